@@ -3,10 +3,17 @@ import { UPSTREAM } from '@/lib/api';
 export const dynamic = 'force-dynamic';
 export const runtime = 'nodejs';
 
-export async function GET() {
+export async function GET(request: Request) {
+  // EventSource sends the last id it saw when it reconnects; passing it on
+  // lets the honeypot replay whatever was published in between.
+  const headers: Record<string, string> = { Accept: 'text/event-stream' };
+  const lastEventId = request.headers.get('last-event-id');
+  if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+
   const upstream = await fetch(`${UPSTREAM}/api/stream`, {
     cache: 'no-store',
-    headers: { Accept: 'text/event-stream' },
+    headers,
+    signal: request.signal,
   });
   if (!upstream.ok || !upstream.body) {
     return new Response('upstream unavailable', { status: 502 });
@@ -9,9 +9,12 @@ import { formatDuration } from '@/lib/utils';
 export const dynamic = 'force-dynamic';
 export const revalidate = 0;
 
+type Overview = { stats: Omit<Stats, 'agent'>; agent: Stats['agent'] | null };
+
 async function loadStats(): Promise<Stats | null> {
   try {
-    return await fetchUpstream<Stats>('/api/stats');
+    const { stats, agent } = await fetchUpstream<Overview>('/api/overview?fields=stats,agent');
+    return { ...stats, agent: agent ?? undefined };
   } catch {
     return null;
   }
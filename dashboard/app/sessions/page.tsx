@@ -1,32 +1,63 @@
+import Link from 'next/link';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from '@/components/ui/table';
 import { Badge } from '@/components/ui/badge';
-import { fetchUpstream, type Session } from '@/lib/api';
+import { UPSTREAM, type Session } from '@/lib/api';
 import { formatDuration, formatRelativeTime } from '@/lib/utils';
 
 export const dynamic = 'force-dynamic';
 export const revalidate = 0;
 
-async function loadSessions(): Promise<Session[]> {
+const FILTERS = ['ip', 'username', 'pattern', 'action'] as const;
+
+type SearchParams = Partial<Record<(typeof FILTERS)[number] | 'cursor', string>>;
+
+async function loadSessions(params: SearchParams): Promise<{ sessions: Session[]; next: string | null }> {
+  const query = new URLSearchParams({ limit: '100' });
+  for (const key of [...FILTERS, 'cursor'] as const) {
+    const value = params[key]?.trim();
+    if (value) query.set(key, value);
+  }
   try {
-    return await fetchUpstream<Session[]>('/api/sessions?limit=100');
+    const res = await fetch(`${UPSTREAM}/api/sessions?${query}`, { cache: 'no-store' });
+    if (!res.ok) return { sessions: [], next: null };
+    return { sessions: await res.json(), next: res.headers.get('x-next-cursor') };
   } catch {
-    return [];
+    return { sessions: [], next: null };
   }
 }
 
-export default async function SessionsPage() {
-  const sessions = await loadSessions();
+export default async function SessionsPage({ searchParams }: { searchParams: SearchParams }) {
+  const { sessions, next } = await loadSessions(searchParams);
+  const older = new URLSearchParams();
+  for (const key of FILTERS) {
+    if (searchParams[key]) older.set(key, searchParams[key] as string);
+  }
+  if (next) older.set('cursor', next);
 
   return (
     <Card>
       <CardHeader>
-        <CardTitle>Recent sessions</CardTitle>
+        <CardTitle>Sessions</CardTitle>
+        <form method="get" className="flex flex-wrap gap-2 pt-2">
+          {FILTERS.map((key) => (
+            <input
+              key={key}
+              name={key}
+              placeholder={key}
+              defaultValue={searchParams[key] ?? ''}
+              className="h-8 w-36 rounded-md border bg-transparent px-2 font-mono text-xs"
+            />
+          ))}
+          <button type="submit" className="h-8 rounded-md border px-3 text-xs">
+            Search
+          </button>
+        </form>
       </CardHeader>
       <CardContent>
         {sessions.length === 0 ? (
           <div className="py-12 text-center text-sm text-muted-foreground">
-            No sessions recorded yet. Try <code>ssh user@localhost -p 2222</code>.
+            No matching sessions. Try <code>ssh user@localhost -p 2222</code>.
           </div>
         ) : (
           <Table>
@@ -66,6 +97,13 @@ export default async function SessionsPage() {
             </TableBody>
           </Table>
         )}
+        {next && (
+          <div className="pt-4 text-right text-sm">
+            <Link href={`/sessions?${older}`} className="text-muted-foreground hover:text-foreground">
+              Older →
+            </Link>
+          </div>
+        )}
       </CardContent>
     </Card>
   );
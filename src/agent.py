@@ -1,9 +1,12 @@
 import logging
+import math
 import random
 import re
 import time
 from dataclasses import dataclass, field
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, Optional, Tuple
+
+from .qtable import QTable
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +43,57 @@ def phase_of(command_count: int) -> str:
     return 'late'
 
 
+def engagement_reward(dt_seconds: float, next_is_malicious: bool) -> float:
+    """Reward for a decision that was followed by another command after
+    `dt_seconds`: the sooner, the better."""
+    if dt_seconds < 5:
+        base = 1.0
+    elif dt_seconds < 20:
+        base = 0.6
+    elif dt_seconds < 60:
+        base = 0.3
+    else:
+        base = 0.1
+    if next_is_malicious:
+        base += 0.3
+    return base
+
+
+def terminal_reward(commands_seen: int) -> float:
+    """Reward for the last decision of a session — the attacker left.
+    Moderate penalty, tempered if they had already engaged a lot."""
+    return -1.0 + min(0.5, commands_seen * 0.02)
+
+
+ALPHA_SCHEDULES: Dict[str, Callable] = {
+    # Fixed step: tracks drift, never settles.
+    'constant': lambda agent, n: agent.alpha,
+    # Sample-average step: fast on rare cells, settles on common ones.
+    'harmonic': lambda agent, n: max(agent.alpha_min, 1.0 / (n + 1)),
+    # Constant step halved after `alpha_half_life` updates, then shrinking.
+    'decay': lambda agent, n: max(agent.alpha_min, agent.alpha * agent.alpha_half_life / (agent.alpha_half_life + n)),
+}
+
+
+_STATE_KEYS: Dict[Tuple[str, str], str] = {}
+
+
+def state_key(pattern: str, phase: str) -> str:
+    """The `pattern|phase` state string, built once per distinct pair."""
+    key = _STATE_KEYS.get((pattern, phase))
+    if key is None:
+        key = _STATE_KEYS[(pattern, phase)] = f"{pattern}|{phase}"
+    return key
+
+
+def _parse_q(serialized: Dict[str, float]):
+    """Yield (state, action, value) from the persisted `"pattern|phase|ACTION"`
+    keys. The state itself contains a '|', so split on the last one."""
+    for key, value in serialized.items():
+        state, _, action = key.rpartition('|')
+        yield state, action, value
+
+
 @dataclass
 class Decision:
     state: str
@@ -47,6 +101,9 @@ class Decision:
     timestamp: float
     command: str
     is_malicious: bool
+    # Engine-specific context kept until the decision's reward is known.
+    features: Optional[tuple] = None
+    reward: Optional[float] = None
 
 
 @dataclass
@@ -57,6 +114,10 @@ class SessionTracker:
     command_count: int = 0
     pending: Optional[Decision] = None
     session_start: float = field(default_factory=time.time)
+    client_ip: str = ''
+    client_version: str = ''
+    malicious_count: int = 0
+    last_command_at: Optional[float] = None
 
 
 class QLearningAgent:
@@ -67,6 +128,10 @@ class QLearningAgent:
     another command arriving soon = positive, session ending = negative.
     """
 
+    engine = 'qlearning'
+    # Whether replayed transitions (ReplayLearner) make sense for this engine.
+    replayable = True
+
     def __init__(
         self,
         epsilon: float = 0.3,
@@ -76,17 +141,35 @@ class QLearningAgent:
         epsilon_decay: float = 0.9995,
         state_manager=None,
         rng: Optional[random.Random] = None,
+        clock: Callable[[], float] = time.time,
+        alpha_schedule: str = 'constant',
+        alpha_min: float = 0.01,
+        alpha_half_life: float = 100.0,
+        exploration: str = 'global',
+        state_epsilon_decay: float = 0.99,
     ):
+        if alpha_schedule not in ALPHA_SCHEDULES:
+            raise ValueError(f"unknown alpha_schedule {alpha_schedule!r} (expected one of {', '.join(ALPHA_SCHEDULES)})")
+        if exploration not in ('global', 'per_state'):
+            raise ValueError(f"unknown exploration {exploration!r} (expected 'global' or 'per_state')")
         self.epsilon = epsilon
         self.epsilon_min = epsilon_min
         self.epsilon_decay = epsilon_decay
         self.alpha = learning_rate
+        self.alpha_schedule = alpha_schedule
+        self.alpha_min = alpha_min
+        self.alpha_half_life = alpha_half_life
+        self.exploration = exploration
+        self.state_epsilon_decay = state_epsilon_decay
         self.gamma = discount
         self.rng = rng or random.Random()
+        self.clock = clock
         self.state_manager = state_manager
         self.save_interval = 100
+        self.checkpointer = None
+        self.replay = None
 
-        self.q: Dict[Tuple[str, str], float] = {}
+        self.q = QTable(ACTIONS)
         self.action_counts: Dict[str, int] = {a: 0 for a in ACTIONS}
         self.decision_count = 0
 
@@ -95,9 +178,21 @@ class QLearningAgent:
 
     def _restore(self):
         saved = self.state_manager.load_state()
-        if not saved:
+        if not saved or not self._compatible(saved):
             return
-        self.q = {tuple(k.split('|', 1)): v for k, v in saved.get('q', {}).items()}
+        self.q.clear()
+        self.q.load(_parse_q(saved.get('q', {})))
+        if 'visits' in saved:
+            self.q.load_visits(_parse_q(saved['visits']))
+        else:
+            # Written before visits were counted. With zero visits the next
+            # update would step at α = 1/(0+1) and replace the learned value
+            # with one sample, and per-state ε would start over; credit each
+            # cell with the visits a constant learning_rate step implies.
+            nominal = math.ceil(1.0 / max(self.alpha, 0.01))
+            self.q.load_visits((s, a, nominal) for s, a, _ in _parse_q(saved.get('q', {})))
+            logger.info("state file has no visit counts; seeding %d per cell", nominal)
+        self.q.load_updated(_parse_q(saved.get('updated', {})))
         self.action_counts.update(saved.get('action_counts', {}))
         self.epsilon = saved.get('epsilon', self.epsilon)
         self.decision_count = saved.get('decision_count', 0)
@@ -106,39 +201,80 @@ class QLearningAgent:
             len(self.q), self.decision_count, self.epsilon,
         )
 
+    def load_policy(self, cells: Dict[Tuple[str, str], Tuple[float, int, float]], meta: Dict) -> bool:
+        """Replace the live table with stored `(value, visits, updated)`
+        cells, e.g. from a policy checkpoint. Decision and action counters
+        keep running; ε comes from the checkpoint."""
+        if not self._compatible(meta):
+            return False
+        self.q.clear()
+        self.q.load((s, a, v) for (s, a), (v, _, _) in cells.items())
+        self.q.load_visits((s, a, n) for (s, a), (_, n, _) in cells.items())
+        self.q.load_updated((s, a, t) for (s, a), (_, _, t) in cells.items())
+        self.epsilon = meta.get('epsilon', self.epsilon)
+        return True
+
+    def _compatible(self, saved: Dict) -> bool:
+        engine = saved.get('engine', 'qlearning')
+        if engine != self.engine:
+            logger.warning("state file holds a %r engine, not %r; starting fresh", engine, self.engine)
+            return False
+        return True
+
     def set_save_interval(self, interval: int):
         self.save_interval = max(1, interval)
 
     def select_action(self, command: str, session: SessionTracker) -> Tuple[str, Decision]:
         pattern = classify(command)
-        state = f"{pattern}|{phase_of(session.command_count)}"
-
-        if self.rng.random() < self.epsilon:
-            action = self.rng.choice(ACTIONS)
-        else:
-            action = self._greedy(state, pattern)
-
+        state = state_key(pattern, phase_of(session.command_count))
+        action = self._choose(self.q.intern(state), pattern)
         self.action_counts[action] += 1
         self.decision_count += 1
-        self.epsilon = max(self.epsilon_min, self.epsilon * self.epsilon_decay)
 
+        now = self.clock()
         decision = Decision(
             state=state,
             action=action,
-            timestamp=time.time(),
+            timestamp=now,
             command=command,
             is_malicious=pattern != 'none',
         )
+        session.malicious_count += decision.is_malicious
+        session.last_command_at = now
 
         if self.state_manager and self.decision_count % self.save_interval == 0:
-            self.save_state()
+            self.request_save()
 
         return action, decision
 
-    def _greedy(self, state: str, pattern: str) -> str:
-        values = [self.q.get((state, a), 0.0) for a in ACTIONS]
+    def _choose(self, sid: int, pattern: str) -> str:
+        """ε-greedy with decaying ε. Other engines swap in their own rule."""
+        if self.rng.random() < self.state_epsilon(sid):
+            action = self.rng.choice(ACTIONS)
+        else:
+            action = self._greedy(sid, pattern)
+        if self.exploration == 'global':
+            self.epsilon = max(self.epsilon_min, self.epsilon * self.epsilon_decay)
+        return action
+
+    def state_epsilon(self, sid: int) -> float:
+        """Exploration rate in a state. Globally decayed per decision, or with
+        `exploration='per_state'` decayed by `state_epsilon_decay` per visit
+        to that state, so rare states keep exploring after common ones have
+        settled."""
+        if self.exploration == 'global':
+            return self.epsilon
+        visits = sum(self.q.row_visits(sid))
+        return max(self.epsilon_min, self.epsilon * self.state_epsilon_decay ** visits)
+
+    def _alpha(self, visits: int) -> float:
+        """Step size for a cell that has been updated `visits` times."""
+        return ALPHA_SCHEDULES[self.alpha_schedule](self, visits)
+
+    def _greedy(self, sid: int, pattern: str) -> str:
+        values = self.q.row(sid)
         best = max(values)
-        if best == 0.0 and all(v == 0.0 for v in values):
+        if best == 0.0 and not any(values):
             return self._warm_start(pattern)
         best_actions = [a for a, v in zip(ACTIONS, values) if v == best]
         return self.rng.choice(best_actions)
@@ -159,61 +295,99 @@ class QLearningAgent:
 
     def observe_next_command(self, decision: Decision, next_state: str, next_is_malicious: bool):
         """Called when another command arrives after `decision` — attacker stayed."""
-        dt = time.time() - decision.timestamp
-        reward = self._engagement_reward(dt, next_is_malicious)
+        dt = self.clock() - decision.timestamp
+        reward = engagement_reward(dt, next_is_malicious)
         self._td_update(decision, next_state, reward, terminal=False)
 
     def observe_session_end(self, decision: Decision, commands_seen: int):
         """Called when the session ends after `decision` — attacker left."""
-        # Moderate penalty; tempered if they had already engaged a lot.
-        engagement_bonus = min(0.5, commands_seen * 0.02)
-        reward = -1.0 + engagement_bonus
-        self._td_update(decision, next_state=None, reward=reward, terminal=True)
-
-    def _engagement_reward(self, dt_seconds: float, next_is_malicious: bool) -> float:
-        if dt_seconds < 5:
-            base = 1.0
-        elif dt_seconds < 20:
-            base = 0.6
-        elif dt_seconds < 60:
-            base = 0.3
-        else:
-            base = 0.1
-        if next_is_malicious:
-            base += 0.3
-        return base
+        self._td_update(decision, next_state=None, reward=terminal_reward(commands_seen), terminal=True)
 
     def _td_update(self, decision: Decision, next_state: Optional[str], reward: float, terminal: bool):
-        key = (decision.state, decision.action)
-        current = self.q.get(key, 0.0)
+        sid = self.q.intern(decision.state)
         if terminal or next_state is None:
             target = reward
         else:
-            future = max(self.q.get((next_state, a), 0.0) for a in ACTIONS)
-            target = reward + self.gamma * future
-        self.q[key] = current + self.alpha * (target - current)
+            target = reward + self.gamma * self.q.max_value(self.q.intern(next_state))
+        aid = self.q.action_index[decision.action]
+        self.q.td_update(sid, aid, target, self._alpha(self.q.visits(sid, aid)), now=self.clock())
+        if self.replay is not None:
+            self.replay.append(decision.state, decision.action, reward, None if terminal else next_state)
 
     def policy_snapshot(self) -> Dict[str, Dict[str, float]]:
         snapshot: Dict[str, Dict[str, float]] = {}
-        for (state, action), value in self.q.items():
+        for state, action, value in self.q.cells():
             snapshot.setdefault(state, {})[action] = value
         return snapshot
 
+    def policy_detail(self) -> Dict[str, Dict]:
+        """Per-state values with the evidence behind them: visit counts,
+        last-update times, exploration rate and a per-cell confidence of
+        1 - 1/sqrt(1 + visits)."""
+        q = self.q
+        detail: Dict[str, Dict] = {}
+        for sid, (state, values) in enumerate(zip(q.states, q.rows())):
+            visits = q.row_visits(sid)
+            if not any(visits) and not any(values):
+                continue
+            detail[state] = {
+                'values': dict(zip(ACTIONS, values)),
+                'visits': dict(zip(ACTIONS, visits)),
+                'updated': {a: q.updated(sid, i) or None for i, a in enumerate(ACTIONS)},
+                'confidence': {a: round(1.0 - 1.0 / math.sqrt(1 + n), 3) for a, n in zip(ACTIONS, visits)},
+                'epsilon': round(self.state_epsilon(sid), 4),
+            }
+        return detail
+
+    @property
+    def version(self) -> int:
+        """Changes whenever `stats`, `policy_snapshot` or `policy_detail`
+        could: every decision and every table write."""
+        return self.q.version + self.decision_count
+
     def stats(self) -> Dict:
         return {
+            'engine': self.engine,
             'action_counts': dict(self.action_counts),
             'epsilon': self.epsilon,
             'q_size': len(self.q),
             'decision_count': self.decision_count,
+            'replay_size': len(self.replay) if self.replay is not None else 0,
         }
 
-    def save_state(self) -> bool:
-        if not self.state_manager:
-            return False
-        serialized = {
-            'q': {f"{s}|{a}": v for (s, a), v in self.q.items()},
-            'action_counts': self.action_counts,
+    def snapshot(self) -> Dict:
+        """Cheap copy of everything `save_state` persists. Safe to hand to
+        `serialize` on another thread while learning continues."""
+        return {
+            'engine': self.engine,
+            'q': self.q.snapshot(),
+            'action_counts': dict(self.action_counts),
             'epsilon': self.epsilon,
             'decision_count': self.decision_count,
         }
-        return self.state_manager.save_state(serialized)
+
+    def request_save(self):
+        """Ask for a checkpoint. Coalesced and written off the event loop
+        when a Checkpointer is attached; a synchronous save otherwise."""
+        if self.checkpointer is not None:
+            self.checkpointer.request()
+        else:
+            self.save_state()
+
+    def serialize(self, snapshot: Dict) -> Dict:
+        """State-file dict for a `snapshot()`; runs on the checkpoint thread."""
+        return serialize_snapshot(snapshot)
+
+    def save_state(self) -> bool:
+        if not self.state_manager:
+            return False
+        return self.state_manager.save_state(self.serialize(self.snapshot()))
+
+
+def serialize_snapshot(snapshot: Dict) -> Dict:
+    """Turn `QLearningAgent.snapshot()` into the JSON state-file layout."""
+    serialized = dict(snapshot)
+    serialized['q'] = {f"{s}|{a}": v for s, a, v in snapshot['q'].cells()}
+    serialized['visits'] = {f"{s}|{a}": n for s, a, n in snapshot['q'].visit_counts()}
+    serialized['updated'] = {f"{s}|{a}": t for s, a, t in snapshot['q'].update_times()}
+    return serialized
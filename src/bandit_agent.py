@@ -0,0 +1,133 @@
+"""Contextual bandit engines: per-state UCB1 and Thompson sampling.
+
+Both treat each `pattern|phase` state as its own multi-armed bandit over
+the five actions. The Q-table holds each arm's sample-mean reward and its
+visit count (so persistence, federation and the policy view work
+unchanged), and exploration comes from those counts instead of a global
+ε: well-known states stop exploring, new ones explore hard, and an arm
+that keeps losing sessions (BLOCK) stops being tried.
+"""
+import logging
+import math
+from typing import Dict
+
+from .agent import ACTIONS, Decision, QLearningAgent
+
+logger = logging.getLogger(__name__)
+
+
+class BanditAgent(QLearningAgent):
+    """Shared bookkeeping: no bootstrapping (γ = 0) and a 1/n step, so each
+    cell is the exact mean of the rewards its arm received."""
+
+    replayable = False
+
+    def __init__(self, **kwargs):
+        kwargs['discount'] = 0.0
+        kwargs.setdefault('epsilon', 0.0)
+        kwargs.setdefault('epsilon_min', 0.0)
+        super().__init__(**kwargs)
+
+    def _reward(self, reward: float, terminal: bool) -> float:
+        return reward
+
+    def _td_update(self, decision: Decision, next_state, reward: float, terminal: bool):
+        sid = self.q.intern(decision.state)
+        aid = self.q.action_index[decision.action]
+        value = self._reward(reward, terminal)
+        self.q.td_update(sid, aid, value, 1.0 / (self.q.visits(sid, aid) + 1), now=self.clock())
+
+    def state_epsilon(self, sid: int) -> float:
+        return 0.0
+
+    def _untried(self, sid: int, pattern: str):
+        untried = [a for i, a in enumerate(ACTIONS) if not self.q.visits(sid, i)]
+        if not untried:
+            return None
+        prior = self._warm_start(pattern)
+        return prior if prior in untried else self.rng.choice(untried)
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        stats.pop('epsilon', None)
+        return stats
+
+
+class UCBAgent(BanditAgent):
+    """UCB1: pick argmax mean + c·sqrt(ln N / n). Every arm of a state is
+    tried once (the warm-start prior first), after which rarely-paying arms
+    are revisited only logarithmically often."""
+
+    engine = 'ucb'
+
+    def __init__(self, c: float = 1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.c = c
+
+    def _choose(self, sid: int, pattern: str) -> str:
+        untried = self._untried(sid, pattern)
+        if untried is not None:
+            return untried
+        q = self.q
+        means = q.row(sid)
+        counts = [q.visits(sid, i) for i in range(len(ACTIONS))]
+        log_total = math.log(sum(counts))
+        scores = [m + self.c * math.sqrt(log_total / n) for m, n in zip(means, counts)]
+        best = max(scores)
+        return self.rng.choice([a for a, s in zip(ACTIONS, scores) if s == best])
+
+
+class ThompsonAgent(BanditAgent):
+    """Thompson sampling over each arm's posterior.
+
+    `likelihood='gaussian'` models the engagement reward with a normal
+    posterior, N(mean, sigma²/(n+1)). `likelihood='beta'` models only
+    whether the attacker stayed (1) or left (0) after the action, with a
+    Beta(1 + stays, 1 + leaves) posterior; cells then hold stay rates.
+    """
+
+    engine = 'thompson'
+
+    def __init__(self, likelihood: str = 'gaussian', sigma: float = 1.0, **kwargs):
+        if likelihood not in ('gaussian', 'beta'):
+            raise ValueError(f"unknown thompson likelihood {likelihood!r} (expected 'gaussian' or 'beta')")
+        # Set before the base class restores, which checks it.
+        self.likelihood = likelihood
+        self.sigma = sigma
+        super().__init__(**kwargs)
+
+    def _compatible(self, saved: Dict) -> bool:
+        if not super()._compatible(saved):
+            return False
+        if saved.get('likelihood', 'gaussian') != self.likelihood:
+            logger.warning("state file holds %s posteriors, configured %s; starting fresh", saved.get('likelihood'), self.likelihood)
+            return False
+        return True
+
+    def snapshot(self) -> Dict:
+        snapshot = super().snapshot()
+        snapshot['likelihood'] = self.likelihood
+        return snapshot
+
+    def _reward(self, reward: float, terminal: bool) -> float:
+        if self.likelihood == 'beta':
+            return 0.0 if terminal else 1.0
+        return reward
+
+    def _choose(self, sid: int, pattern: str) -> str:
+        q, rng = self.q, self.rng
+        means = q.row(sid)
+        counts = [q.visits(sid, i) for i in range(len(ACTIONS))]
+        if not any(counts):
+            return self._warm_start(pattern)
+        if self.likelihood == 'beta':
+            samples = [
+                rng.betavariate(1.0 + m * n, 1.0 + (1.0 - m) * n)
+                for m, n in zip(means, counts)
+            ]
+        else:
+            samples = [
+                rng.gauss(m, self.sigma / math.sqrt(n + 1))
+                for m, n in zip(means, counts)
+            ]
+        return ACTIONS[samples.index(max(samples))]
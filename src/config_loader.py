@@ -44,11 +44,84 @@ class Config:
                 "port": 8080,
             },
             "reinforcement_learning": {
+                "engine": "qlearning",
                 "epsilon": 0.3,
                 "learning_rate": 0.1,
                 "discount": 0.9,
+                "alpha_schedule": "harmonic",
+                "alpha_min": 0.01,
+                "alpha_half_life": 100,
+                "exploration": "per_state",
+                "state_epsilon_decay": 0.99,
                 "state_file": "data/rl_state.json",
                 "save_interval": 100,
+                "checkpoint_interval": 30,
+                "keep_generations": 3,
+                "linear": {
+                    "bits": 18,
+                    "ip_history": 10000,
+                },
+                "ucb": {
+                    "c": 1.0,
+                },
+                "thompson": {
+                    "likelihood": "gaussian",
+                    "sigma": 1.0,
+                },
+            },
+            "checkpoints": {
+                "enabled": True,
+                "dir": "data/checkpoints",
+                "interval": 3600,
+                "full_every": 24,
+                "keep_recent": 48,
+                "keep_daily": 90,
+            },
+            "replay": {
+                "enabled": True,
+                "capacity": 50000,
+                "batch_size": 32,
+                "updates_per_second": 10,
+                "priority_alpha": 0.6,
+                "priority_beta": 0.4,
+                "file": "data/rl_replay.bin",
+            },
+            "federation": {
+                "enabled": False,
+                "node_id": "",
+                "transport": "directory",
+                "dir": "data/federation",
+                "url": "http://localhost:8090",
+                "interval": 60,
+            },
+            "commands": {
+                "cpu_budget_ms": 250,
+                "session_cpu_budget_ms": 5000,
+                "max_stall_ms": 20,
+                "max_output_bytes": 1048576,
+            },
+            "session_store": {
+                "enabled": True,
+                "path": "data/sessions.db",
+                "retention_days": 180,
+                "max_batch": 1000,
+            },
+            "metrics": {
+                "slow_command_ms": 50,
+                "sketch_file": "data/stats_sketches.json",
+                "sketch_save_interval": 300,
+                "thread_safe": False,
+                "event_buffer": 100000,
+            },
+            "downloads": {
+                "enabled": True,
+                "fetcher": "stub",
+                "store_dir": "data/downloads",
+                "workers": 4,
+                "queue_size": 256,
+                "timeout": 15,
+                "max_bytes": 10485760,
+                "max_redirects": 5,
             },
             "logging": {
                 "level": "INFO",
@@ -0,0 +1,468 @@
+import asyncio
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import random
+import re
+import socket
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_COMMANDS = ('wget', 'curl', 'tftp', 'fetch')
+
+# Options that consume the next argument, per command. They differ: curl's
+# -O is a bare "save under the remote name" switch, wget's takes a filename.
+_ARG_OPTIONS = {
+    'wget': frozenset((
+        '-O', '--output-document', '-o', '--output-file', '-a', '--append-output',
+        '-U', '--user-agent', '--header', '-e', '--execute', '-i', '--input-file',
+        '-P', '--directory-prefix', '-t', '--tries', '-T', '--timeout',
+    )),
+    'curl': frozenset((
+        '-o', '--output', '-H', '--header', '-A', '--user-agent', '-e', '--referer',
+        '-u', '--user', '-d', '--data', '-X', '--request', '-x', '--proxy',
+        '-m', '--max-time', '--connect-timeout', '-b', '--cookie', '-c', '--cookie-jar',
+        '-T', '--upload-file', '-F', '--form',
+    )),
+    'fetch': frozenset(('-o', '--output', '-T', '--timeout', '-N', '--netrc')),
+}
+# Options naming the local file, per command.
+_OUTPUT_OPTIONS = {
+    'wget': ('-O', '--output-document'),
+    'curl': ('-o', '--output'),
+    'fetch': ('-o', '--output'),
+}
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443, 'ftp': 21, 'tftp': 69}
+_URL_RE = re.compile(r'^(?:https?|ftp|tftp)://', re.IGNORECASE)
+_HOST_RE = re.compile(r'^[A-Za-z0-9.-]+(?::\d+)?(?:/.*)?$')
+
+
+def normalize_url(url: str, default_scheme: str = 'http') -> Optional[str]:
+    """Canonical form used for dedup: lowercase scheme/host, default port
+    dropped, fragment stripped, empty path -> '/'. Returns None for things
+    that don't look like a URL at all."""
+    url = url.strip().strip('\'"')
+    if not url:
+        return None
+    if not _URL_RE.match(url):
+        if not _HOST_RE.match(url) or '.' not in url.split('/', 1)[0]:
+            return None
+        url = f"{default_scheme}://{url}"
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if not host:
+        return None
+    netloc = host if port in (None, _DEFAULT_PORTS.get(scheme)) else f"{host}:{port}"
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def extract_urls(cmd: str, args: List[str]) -> List[str]:
+    """Pull the URLs a download command would fetch, normalized."""
+    if cmd == 'tftp':
+        # busybox: tftp -g -r bins.sh 1.2.3.4 ; classic: tftp 1.2.3.4 -c get bins.sh
+        host, remote, i = None, None, 0
+        while i < len(args):
+            a = args[i]
+            if a in ('-r', '-l') and i + 1 < len(args):
+                if a == '-r':
+                    remote = args[i + 1]
+                i += 2
+                continue
+            if a == 'get' and i + 1 < len(args):
+                remote = args[i + 1]
+                i += 2
+                continue
+            if not a.startswith('-') and host is None:
+                host = a
+            i += 1
+        if not host or not remote:
+            return []
+        url = normalize_url(f"tftp://{host}/{remote.lstrip('/')}")
+        return [url] if url else []
+    takes_arg = _ARG_OPTIONS.get(cmd, _ARG_OPTIONS['wget'])
+    urls = []
+    skip = False
+    for a in args:
+        if skip:
+            skip = False
+            continue
+        if a in takes_arg:
+            skip = True
+            continue
+        if a.startswith('-'):
+            continue
+        url = normalize_url(a)
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+
+def split_target(url: str) -> Tuple[str, str]:
+    """Host and filename the way wget would report them."""
+    parts = urlsplit(url)
+    filename = parts.path.rsplit('/', 1)[-1] or 'index.html'
+    return parts.hostname or 'host', filename
+
+
+def output_name(cmd: str, args: List[str]) -> Optional[str]:
+    """Explicit output file given with wget -O / curl -o."""
+    options = _OUTPUT_OPTIONS.get(cmd, _OUTPUT_OPTIONS['wget'])
+    for i, a in enumerate(args[:-1]):
+        if a in options:
+            return args[i + 1]
+    return None
+
+
+@dataclass
+class FetchResponse:
+    body: bytes
+    content_type: str = 'application/octet-stream'
+    status: int = 200
+
+
+@dataclass
+class DownloadResult:
+    url: str
+    url_hash: str
+    sha256: Optional[str] = None
+    size: int = 0
+    content_type: str = 'application/octet-stream'
+    status: int = 0
+    fetched_at: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.sha256 is not None
+
+
+class StubFetcher:
+    """Never touches the network. Produces deterministic pseudo-payloads so the
+    pipeline (dedup, storage, fake-file sizes) behaves like the real thing in
+    tests and in deployments that shouldn't fetch attacker payloads."""
+
+    async def fetch(self, url: str) -> FetchResponse:
+        rng = random.Random(url)
+        size = rng.randint(512, 8192)
+        return FetchResponse(body=rng.randbytes(size))
+
+    async def close(self):
+        pass
+
+
+def _is_public(address: str) -> bool:
+    """Whether an address is globally routable. Loopback, private,
+    link-local (cloud metadata), shared, reserved and multicast ranges are
+    not; IPv4-mapped IPv6 is judged by its IPv4 address."""
+    try:
+        ip = ipaddress.ip_address(address.split('%', 1)[0])
+    except ValueError:
+        return False
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def check_public(host: str, port: int):
+    """Raise ValueError unless every address `host` resolves to is public."""
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except OSError as e:
+        raise ValueError(f"cannot resolve {host}: {e}") from None
+    for info in infos:
+        if not _is_public(info[4][0]):
+            raise ValueError(f"refusing to fetch {host}: resolves to non-public address {info[4][0]}")
+    if not infos:
+        raise ValueError(f"cannot resolve {host}")
+
+
+def _public_resolver():
+    """aiohttp resolver that drops non-public addresses, so a name that
+    re-resolves between the check and the connect (DNS rebinding) still
+    cannot reach an internal service."""
+    from aiohttp.resolver import DefaultResolver
+
+    class PublicResolver(DefaultResolver):
+        async def resolve(self, host, port=0, family=socket.AF_INET):
+            hosts = [h for h in await super().resolve(host, port, family) if _is_public(h['host'])]
+            if not hosts:
+                raise OSError(f"{host} resolves only to non-public addresses")
+            return hosts
+
+    return PublicResolver()
+
+
+class HTTPFetcher:
+    """Fetches http(s) URLs with aiohttp, capped at `max_bytes`.
+
+    URLs come from attackers, so each one, and each redirect target, must
+    resolve only to public addresses: a `wget http://169.254.169.254/` or a
+    redirect to the stats API must not make the sensor fetch internal
+    resources on the attacker's behalf. Redirects are followed by hand, at
+    most `max_redirects` of them.
+    """
+
+    REDIRECTS = (301, 302, 303, 307, 308)
+
+    def __init__(
+        self,
+        timeout: float = 15.0,
+        max_bytes: int = 10 * 1024 * 1024,
+        user_agent: str = 'Wget/1.20.3 (linux-gnu)',
+        max_redirects: int = 5,
+    ):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.user_agent = user_agent
+        self.max_redirects = max(0, max_redirects)
+        self._session = None
+
+    async def fetch(self, url: str) -> FetchResponse:
+        import aiohttp
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(resolver=_public_resolver()),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'User-Agent': self.user_agent},
+            )
+        target = url
+        for _ in range(self.max_redirects + 1):
+            parts = urlsplit(target)
+            if parts.scheme not in ('http', 'https') or not parts.hostname:
+                raise ValueError(f"unsupported URL {target}")
+            # IP literals never reach the resolver, so check before connecting.
+            await check_public(parts.hostname, parts.port or _DEFAULT_PORTS[parts.scheme])
+            async with self._session.get(target, allow_redirects=False, ssl=False) as resp:
+                location = resp.headers.get('Location')
+                if resp.status in self.REDIRECTS and location:
+                    target = urljoin(target, location)
+                    continue
+                chunks, total = [], 0
+                async for chunk in resp.content.iter_chunked(64 * 1024):
+                    chunks.append(chunk)
+                    total += len(chunk)
+                    if total >= self.max_bytes:
+                        break
+                body = b''.join(chunks)[:self.max_bytes]
+                return FetchResponse(
+                    body=body,
+                    content_type=resp.headers.get('Content-Type', 'application/octet-stream'),
+                    status=resp.status,
+                )
+        raise ValueError(f"more than {self.max_redirects} redirects fetching {url}")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class ContentStore:
+    """Content-addressed payload storage on disk.
+
+    Payloads live at `<root>/<sha[:2]>/<sha>`; per-URL metadata at
+    `<root>/urls/<url_hash>.json` so a URL seen again after a restart is
+    answered from disk without refetching. All methods do blocking I/O and are
+    meant to be called from a worker thread.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(os.path.join(root, 'urls'), exist_ok=True)
+
+    def _blob_path(self, sha: str) -> str:
+        return os.path.join(self.root, sha[:2], sha)
+
+    def _meta_path(self, h: str) -> str:
+        return os.path.join(self.root, 'urls', f"{h}.json")
+
+    def put(self, body: bytes) -> str:
+        sha = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(sha)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(body)
+            os.replace(tmp, path)
+        return sha
+
+    def read(self, sha: str, limit: Optional[int] = None) -> bytes:
+        with open(self._blob_path(sha), 'rb') as f:
+            return f.read(limit) if limit is not None else f.read()
+
+    def lookup(self, h: str) -> Optional[DownloadResult]:
+        try:
+            with open(self._meta_path(h), 'r') as f:
+                return DownloadResult(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("bad download metadata for %s: %s", h, e)
+            return None
+
+    def record(self, result: DownloadResult, session_info: Optional[Dict] = None):
+        meta = asdict(result)
+        path = self._meta_path(result.url_hash)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+        if session_info:
+            with open(os.path.join(self.root, 'captures.jsonl'), 'a') as f:
+                f.write(json.dumps({**meta, **session_info}) + '\n')
+
+
+class DownloadCapture:
+    """Bounded async worker pool that fetches URLs attackers try to download.
+
+    Requests are deduplicated by URL hash: concurrent submissions share one
+    in-flight future, recent results are answered from an in-memory LRU, and
+    older ones from the on-disk metadata, so a URL hammered by a whole campaign
+    is fetched exactly once.
+    """
+
+    def __init__(
+        self,
+        store: ContentStore,
+        fetcher=None,
+        workers: int = 4,
+        queue_size: int = 256,
+        cache_size: int = 10000,
+    ):
+        self.store = store
+        self.fetcher = fetcher or StubFetcher()
+        self.workers = max(1, workers)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._cache: 'OrderedDict[str, DownloadResult]' = OrderedDict()
+        self._cache_size = cache_size
+        self._tasks: List[asyncio.Task] = []
+        self.fetched = 0
+        self.deduplicated = 0
+        self.dropped = 0
+
+    async def start(self):
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"download-worker-{i}"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        await self.fetcher.close()
+
+    def submit(self, url: str, session_info: Optional[Dict] = None) -> 'asyncio.Future[DownloadResult]':
+        h = url_hash(url)
+        loop = asyncio.get_running_loop()
+        cached = self._cache.get(h)
+        if cached is not None:
+            self._cache.move_to_end(h)
+            self.deduplicated += 1
+            fut = loop.create_future()
+            fut.set_result(cached)
+            return fut
+        inflight = self._inflight.get(h)
+        if inflight is not None:
+            self.deduplicated += 1
+            return inflight
+        fut = loop.create_future()
+        try:
+            self._queue.put_nowait((url, h, session_info, fut))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            fut.set_result(DownloadResult(url=url, url_hash=h, error='capture queue full'))
+            return fut
+        self._inflight[h] = fut
+        return fut
+
+    async def _worker(self):
+        while True:
+            url, h, session_info, fut = await self._queue.get()
+            try:
+                result = await self._capture(url, h, session_info)
+            except Exception as e:
+                logger.warning("download capture failed for %s: %s", url, e)
+                result = DownloadResult(url=url, url_hash=h, fetched_at=time.time(), error=str(e) or type(e).__name__)
+            finally:
+                self._inflight.pop(h, None)
+                self._queue.task_done()
+            if result.ok:
+                self._cache[h] = result
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+            if not fut.done():
+                fut.set_result(result)
+
+    async def _capture(self, url: str, h: str, session_info: Optional[Dict]) -> DownloadResult:
+        known = await asyncio.to_thread(self.store.lookup, h)
+        if known is not None and known.ok:
+            self.deduplicated += 1
+            return known
+        response = await self.fetcher.fetch(url)
+        sha = await asyncio.to_thread(self.store.put, response.body)
+        result = DownloadResult(
+            url=url,
+            url_hash=h,
+            sha256=sha,
+            size=len(response.body),
+            content_type=response.content_type,
+            status=response.status,
+            fetched_at=time.time(),
+        )
+        await asyncio.to_thread(self.store.record, result, session_info)
+        self.fetched += 1
+        logger.info("captured %s (%d bytes, sha256=%s)", url, result.size, sha)
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            'fetched': self.fetched,
+            'deduplicated': self.deduplicated,
+            'dropped': self.dropped,
+            'queued': self._queue.qsize(),
+            'inflight': len(self._inflight),
+        }
+
+
+def build_capture(config) -> Optional[DownloadCapture]:
+    if not config.get('downloads.enabled', True):
+        return None
+    kind = config.get('downloads.fetcher', 'stub')
+    if kind == 'http':
+        fetcher = HTTPFetcher(
+            timeout=config.get('downloads.timeout', 15),
+            max_bytes=config.get('downloads.max_bytes', 10 * 1024 * 1024),
+            max_redirects=config.get('downloads.max_redirects', 5),
+        )
+    elif kind == 'stub':
+        fetcher = StubFetcher()
+    else:
+        raise ValueError(f"unknown downloads.fetcher {kind!r} (expected 'stub' or 'http')")
+    store = ContentStore(config.get('downloads.store_dir', 'data/downloads'))
+    return DownloadCapture(
+        store,
+        fetcher=fetcher,
+        workers=config.get('downloads.workers', 4),
+        queue_size=config.get('downloads.queue_size', 256),
+    )
+
@@ -0,0 +1,41 @@
+"""Agent engine selection (`reinforcement_learning.engine`).
+
+Every engine implements the `QLearningAgent` interface — `select_action`,
+`observe_next_command`, `observe_session_end`, `policy_snapshot`, `stats`
+and the snapshot/serialize persistence pair — so the server, checkpointer,
+offline tools and simulator work with any of them. Engine-specific options
+come from `reinforcement_learning.<engine>`.
+"""
+from typing import Dict, Type
+
+from .agent import QLearningAgent
+from .bandit_agent import ThompsonAgent, UCBAgent
+from .linear_agent import LinearAgent
+
+ENGINES: Dict[str, Type[QLearningAgent]] = {
+    'qlearning': QLearningAgent,
+    'linear': LinearAgent,
+    'ucb': UCBAgent,
+    'thompson': ThompsonAgent,
+}
+
+
+def build_agent(config, state_manager=None, **kwargs) -> QLearningAgent:
+    name = config.get('reinforcement_learning.engine', 'qlearning')
+    cls = ENGINES.get(name)
+    if cls is None:
+        raise ValueError(f"unknown reinforcement_learning.engine {name!r} (expected one of {', '.join(ENGINES)})")
+    options = config.get(f'reinforcement_learning.{name}', None) or {}
+    return cls(
+        epsilon=config.get('reinforcement_learning.epsilon', 0.3),
+        learning_rate=config.get('reinforcement_learning.learning_rate', 0.1),
+        discount=config.get('reinforcement_learning.discount', 0.9),
+        alpha_schedule=config.get('reinforcement_learning.alpha_schedule', 'harmonic'),
+        alpha_min=config.get('reinforcement_learning.alpha_min', 0.01),
+        alpha_half_life=config.get('reinforcement_learning.alpha_half_life', 100),
+        exploration=config.get('reinforcement_learning.exploration', 'per_state'),
+        state_epsilon_decay=config.get('reinforcement_learning.state_epsilon_decay', 0.99),
+        state_manager=state_manager,
+        **options,
+        **kwargs,
+    )
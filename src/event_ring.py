@@ -0,0 +1,192 @@
+"""Columnar ring buffer for the recent-event history behind `/api/events`.
+
+Events are not kept as dicts. Each field lives in a preallocated parallel
+array (timestamp, type, session, client IP, two string slots, action,
+flag, duration, count), and strings are interned in a reference-counted
+table, so a slot costs about 40 bytes plus whatever distinct strings are
+live. A million events of brute-force traffic, where the same IPs,
+usernames and commands repeat, fit in tens of megabytes. An event is only
+turned back into a dict when it is read.
+
+Every event gets a sequence number, returned as `seq` and as `id`. The
+registry appends and publishes the same events in the same order, so it is
+also the event's `id` on the live streams. `read(after, limit)` returns the
+events after a cursor by indexing into the arrays, without touching the
+rest of the buffer.
+"""
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+TYPES = ('login', 'session_start', 'command', 'session_end')
+_TYPE_CODES = {kind: i for i, kind in enumerate(TYPES)}
+
+# Meaning of the two string slots and the flag per type.
+_SLOTS = {
+    'login': ('username', 'password', 'accepted'),
+    'session_start': ('username', None, None),
+    'command': ('command', 'pattern', 'is_malicious'),
+    'session_end': (None, None, None),
+}
+
+
+class Interner:
+    """Strings by small integer id, freed when the last slot using them is
+    overwritten. Id 0 is None."""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._strings: List[Optional[str]] = [None]
+        self._refs = array('i', [0])
+        self._free: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def acquire(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        i = self._ids.get(value)
+        if i is None:
+            if self._free:
+                i = self._free.pop()
+                self._strings[i] = value
+            else:
+                i = len(self._strings)
+                self._strings.append(value)
+                self._refs.append(0)
+            self._ids[value] = i
+        self._refs[i] += 1
+        return i
+
+    def release(self, i: int):
+        if i:
+            refs = self._refs
+            refs[i] -= 1
+            if not refs[i]:
+                del self._ids[self._strings[i]]
+                self._strings[i] = None
+                self._free.append(i)
+
+    def get(self, i: int) -> Optional[str]:
+        return self._strings[i]
+
+
+class EventRing:
+    """The last `capacity` events in parallel arrays. Event-loop only (or
+    under the registry lock in thread-safe mode)."""
+
+    def __init__(self, capacity: int = 100_000):
+        self.capacity = n = max(1, capacity)
+        self.last_seq = 0
+        self.strings = Interner()
+        self._ts = array('d', [0.0]) * n
+        self._type = array('b', [0]) * n
+        self._action = array('b', [0]) * n
+        self._flag = array('b', [0]) * n
+        self._value = array('d', [0.0]) * n
+        self._count = array('i', [0]) * n
+        # Interned string ids; each slot holds one reference.
+        self._session = array('i', [0]) * n
+        self._ip = array('i', [0]) * n
+        self._a = array('i', [0]) * n
+        self._b = array('i', [0]) * n
+        # Actions are a handful of names; a one-byte code each.
+        self._actions: List[str] = ['']
+        self._action_codes: Dict[str, int] = {'': 0}
+
+    def __len__(self) -> int:
+        return min(self.last_seq, self.capacity)
+
+    @property
+    def first_seq(self) -> int:
+        """Oldest sequence number still held (last_seq + 1 when empty)."""
+        return max(1, self.last_seq - self.capacity + 1)
+
+    def append(
+        self,
+        kind: str,
+        ts: float,
+        session_id: Optional[str] = None,
+        client_ip: Optional[str] = None,
+        a: Optional[str] = None,
+        b: Optional[str] = None,
+        action: str = '',
+        flag: bool = False,
+        value: float = 0.0,
+        count: int = 0,
+    ) -> int:
+        """Store one event; `a`, `b` and `flag` mean what `_SLOTS` says for
+        `kind`. Returns its sequence number."""
+        self.last_seq += 1
+        i = self.last_seq % self.capacity
+        strings = self.strings
+        if self.last_seq > self.capacity:
+            release = strings.release
+            release(self._session[i])
+            release(self._ip[i])
+            release(self._a[i])
+            release(self._b[i])
+        acquire = strings.acquire
+        self._session[i] = acquire(session_id)
+        self._ip[i] = acquire(client_ip)
+        self._a[i] = acquire(a)
+        self._b[i] = acquire(b)
+        self._ts[i] = ts
+        self._type[i] = _TYPE_CODES[kind]
+        code = self._action_codes.get(action)
+        if code is None:
+            code = self._action_codes[action] = len(self._actions)
+            self._actions.append(action)
+        self._action[i] = code
+        self._flag[i] = 1 if flag else 0
+        self._value[i] = value
+        self._count[i] = count
+        return self.last_seq
+
+    def get(self, seq: int) -> Optional[Dict[str, Any]]:
+        if not self.first_seq <= seq <= self.last_seq:
+            return None
+        i = seq % self.capacity
+        s = self.strings.get
+        kind = TYPES[self._type[i]]
+        event: Dict[str, Any] = {'id': seq, 'seq': seq, 'type': kind, 'ts': self._ts[i]}
+        if self._session[i]:
+            event['session_id'] = s(self._session[i])
+        if self._ip[i]:
+            event['client_ip'] = s(self._ip[i])
+        a, b, flag = _SLOTS[kind]
+        if a:
+            event[a] = s(self._a[i])
+        if b:
+            event[b] = s(self._b[i])
+        if flag:
+            event[flag] = bool(self._flag[i])
+        if kind == 'command':
+            event['action'] = self._actions[self._action[i]]
+        elif kind == 'session_end':
+            event['duration'] = self._value[i]
+            event['command_count'] = self._count[i]
+        return event
+
+    def read(self, after: Optional[int] = None, limit: int = 200) -> Tuple[List[Dict[str, Any]], int]:
+        """Up to `limit` events after sequence number `after`, oldest first,
+        and the cursor to pass next. Without `after`, the newest `limit`
+        events. A cursor older than the buffer resumes at the oldest event
+        still held."""
+        if after is None:
+            start = max(self.first_seq, self.last_seq - limit + 1)
+        else:
+            start = max(self.first_seq, after + 1)
+        end = min(self.last_seq, start + limit - 1)
+        events = [self.get(seq) for seq in range(start, end + 1)]
+        # Caught up (or a cursor from before a restart): continue from the end.
+        return events, end if events else self.last_seq
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'capacity': self.capacity,
+            'events': len(self),
+            'first_seq': self.first_seq,
+            'last_seq': self.last_seq,
+            'strings': len(self.strings),
+        }
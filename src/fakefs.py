@@ -94,6 +94,7 @@ class FakeFileSystem:
         self.now = time.time()
         self.users = self._pick_users()
         self.default_user = self.users[0]
+        self._pick_identity()
         self.root = self._build_tree()
         self.cwd: List[str] = ['', 'home', self.default_user]
 
@@ -101,6 +102,19 @@ class FakeFileSystem:
         count = self.rng.randint(2, 4)
         return self.rng.sample(USERNAMES_POOL, count)
 
+    def _pick_identity(self):
+        # Network and process identity of the box. Drawn once so every command
+        # in the session (ifconfig, netstat, ps, auth.log) agrees on it.
+        self.ip = f"10.0.0.{self.rng.choice([n for n in range(10, 200) if n not in (15, 22)])}"
+        self.mac = '02:42:' + ':'.join(f"{self.rng.randint(0, 255):02x}" for _ in range(4))
+        self.admin_ip = f"192.168.1.{self.rng.randint(2, 254)}"
+        self.shell_pid = self.rng.randint(800, 2000)
+        self.pids = {
+            'nginx': self.rng.randint(700, 799),
+            'mysqld': self.rng.randint(1000, 1100),
+            'redis-server': self.rng.randint(500, 699),
+        }
+
     def _build_tree(self) -> Node:
         now = self.now
         root = _dir(mtime=now)
@@ -224,7 +238,7 @@ class FakeFileSystem:
         log = _dir()
         log.children['auth.log'] = _file(
             f"Jan 15 10:30:22 {self.hostname} sshd[1234]: Accepted password for "
-            f"{self.default_user} from 192.168.1.{self.rng.randint(2, 254)} port 54321 ssh2\n"
+            f"{self.default_user} from {self.admin_ip} port 54321 ssh2\n"
         )
         log.children['syslog'] = _file(
             f"Jan 15 10:30:22 {self.hostname} kernel: [   0.000000] Linux version 5.4.0-150-generic\n"
@@ -336,14 +350,17 @@ class FakeFileSystem:
     def exists(self, target: str) -> bool:
         return self._lookup(self._resolve(target)) is not None
 
-    def write(self, target: str, content: str, owner: Optional[str] = None) -> str:
+    def write(self, target: str, content: str, owner: Optional[str] = None, size: Optional[int] = None) -> str:
         parts = self._resolve(target)
         if len(parts) < 2:
             return f"cannot write {target}\n"
         parent = self._lookup(parts[:-1])
         if parent is None or parent.kind != 'dir':
             return f"no such directory: {'/'.join(parts[:-1]) or '/'}\n"
-        parent.children[parts[-1]] = _file(content, owner=owner or self.default_user, group=owner or self.default_user)
+        node = _file(content, owner=owner or self.default_user, group=owner or self.default_user)
+        if size is not None:
+            node.size = size
+        parent.children[parts[-1]] = node
         return ''
 
     def touch(self, target: str, owner: Optional[str] = None) -> str:
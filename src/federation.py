@@ -0,0 +1,454 @@
+"""Q-table federation across sensors.
+
+Each node periodically exports the cells of its Q-table that changed since
+its last export, with their current value and the node's visit count, to a
+shared transport. A merger keeps the latest (value, visits) per node and
+cell and publishes a visit-weighted average:
+
+    Q(s, a) = Σ_n visits_n · Q_n(s, a) / Σ_n visits_n
+
+Nodes pull the merged table when its version moves and apply it on the
+event loop in one pass, keeping whatever they learned locally since their
+last export on top of it.
+
+Two transports:
+
+- `DirectoryTransport`: a shared directory (NFS, synced bucket). Run the
+  merger with `python -m src.federation merge --dir <shared> [--watch 60]`.
+- `HTTPTransport`: talks to `python -m src.federation hub`, a small aiohttp
+  stand-in that merges deltas as they arrive.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logger = logging.getLogger(__name__)
+
+Cell = Tuple[str, str]
+
+
+def _write_json(path: str, payload: Dict):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(payload, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logger.warning("ignoring unreadable federation file %s: %s", path, e)
+        return None
+
+
+class Merger:
+    """Latest (value, visits) per node and cell, and their weighted merge.
+
+    Deltas carry cumulative visit counts and current values, so applying
+    the same delta twice is harmless. Cells a node has values for but never
+    visited (e.g. tables from before visit counting) weigh as one visit.
+    """
+
+    def __init__(self):
+        self.nodes: Dict[str, Dict[Cell, Tuple[float, int]]] = {}
+        self.cursors: Dict[str, int] = {}
+        self.version = 0
+        self._merged: Optional[Dict] = None
+
+    def apply(self, delta: Dict) -> bool:
+        """Fold in one delta. A malformed one raises ValueError or
+        TypeError and leaves the merger unchanged."""
+        node, seq = delta['node'], delta['seq']
+        if seq <= self.cursors.get(node, -1):
+            return False
+        rows = {(state, action): (float(value), int(visits)) for state, action, value, visits in delta['cells']}
+        self.nodes.setdefault(node, {}).update(rows)
+        self.cursors[node] = seq
+        self.version += 1
+        self._merged = None
+        return True
+
+    def merged(self) -> Dict:
+        if self._merged is None:
+            sums: Dict[Cell, List[float]] = {}
+            for cells in self.nodes.values():
+                for cell, (value, visits) in cells.items():
+                    weight = max(1, visits)
+                    acc = sums.setdefault(cell, [0.0, 0, 0])
+                    acc[0] += weight * value
+                    acc[1] += weight
+                    acc[2] += visits
+            self._merged = {
+                'version': self.version,
+                'time': time.time(),
+                'nodes': len(self.nodes),
+                'cells': [[s, a, total / weight, visits] for (s, a), (total, weight, visits) in sums.items()],
+            }
+        return self._merged
+
+    def to_dict(self) -> Dict:
+        return {
+            'version': self.version,
+            'cursors': self.cursors,
+            'nodes': {
+                node: [[s, a, v, n] for (s, a), (v, n) in cells.items()]
+                for node, cells in self.nodes.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> 'Merger':
+        merger = cls()
+        if data:
+            merger.version = data.get('version', 0)
+            merger.cursors = dict(data.get('cursors', {}))
+            for node, cells in data.get('nodes', {}).items():
+                merger.nodes[node] = {(s, a): (v, n) for s, a, v, n in cells}
+        return merger
+
+
+# --- Transports ---
+
+class DirectoryTransport:
+    """Deltas at `<root>/deltas/<node>/<seq>.json`, merged table at
+    `<root>/merged.json`, merger bookkeeping at `<root>/merger.json`."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _delta_dir(self, node: str) -> str:
+        return os.path.join(self.root, 'deltas', node)
+
+    async def push(self, delta: Dict):
+        path = os.path.join(self._delta_dir(delta['node']), f"{delta['seq']:015d}.json")
+        await asyncio.to_thread(_write_json, path, delta)
+
+    async def pull(self, since: int) -> Optional[Dict]:
+        merged = await asyncio.to_thread(_read_json, os.path.join(self.root, 'merged.json'))
+        if merged is None or merged.get('version', 0) <= since:
+            return None
+        return merged
+
+    async def close(self):
+        pass
+
+    # Merger side (blocking; run from the CLI).
+
+    def pending(self, cursors: Dict[str, int]) -> Iterator[Tuple[str, Dict]]:
+        base = os.path.join(self.root, 'deltas')
+        if not os.path.isdir(base):
+            return
+        for node in sorted(os.listdir(base)):
+            for name in sorted(os.listdir(os.path.join(base, node))):
+                if not name.endswith('.json') or int(name[:-5]) <= cursors.get(node, -1):
+                    continue
+                path = os.path.join(base, node, name)
+                delta = _read_json(path)
+                if delta is not None:
+                    yield path, delta
+
+    def merge_once(self) -> int:
+        """Fold new deltas into the merged table; returns how many."""
+        state_path = os.path.join(self.root, 'merger.json')
+        merger = Merger.from_dict(_read_json(state_path))
+        consumed = []
+        for path, delta in self.pending(merger.cursors):
+            merger.apply(delta)
+            consumed.append(path)
+        if not consumed:
+            return 0
+        _write_json(os.path.join(self.root, 'merged.json'), merger.merged())
+        _write_json(state_path, merger.to_dict())
+        # Folded into merger.json; the files themselves are no longer needed.
+        for path in consumed:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return len(consumed)
+
+
+class HTTPTransport:
+    """Client for the `hub` command's endpoints."""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self._session = None
+
+    def _client(self):
+        import aiohttp
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def push(self, delta: Dict):
+        async with self._client().post(f"{self.url}/federation/deltas", json=delta) as resp:
+            resp.raise_for_status()
+
+    async def pull(self, since: int) -> Optional[Dict]:
+        async with self._client().get(f"{self.url}/federation/merged", params={'since': since}) as resp:
+            if resp.status == 304:
+                return None
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+# --- Node side ---
+
+class FederationClient:
+    """Exports local Q-table changes and applies the merged table.
+
+    Exports are incremental: only cells whose value or visit count moved
+    since the previous successful export are sent, so their size tracks
+    recent activity rather than the table.
+    """
+
+    def __init__(self, agent, transport, node_id: str, interval: float = 60.0):
+        self.agent = agent
+        self.transport = transport
+        self.node_id = node_id
+        self.interval = max(1.0, interval)
+        self.version = 0
+        self.exports = 0
+        self.last_export_cells = 0
+        self.merges = 0
+        self._exported: Dict[Cell, Tuple[float, int]] = {}
+        self._seq = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name='federation')
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.export()
+        except Exception as e:
+            logger.warning("final federation export failed: %s", e)
+        await self.transport.close()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning("federation sync failed: %s", e)
+
+    async def sync(self):
+        await self.export()
+        merged = await self.transport.pull(self.version)
+        if merged is not None:
+            self.apply(merged)
+
+    def _next_seq(self) -> int:
+        # Millisecond timestamps keep sequence numbers increasing across restarts.
+        self._seq = max(self._seq + 1, int(time.time() * 1000))
+        return self._seq
+
+    async def export(self) -> int:
+        snap = self.agent.q.snapshot()
+        visits = dict(((s, a), n) for s, a, n in snap.visit_counts())
+        changed = []
+        for s, a, v in snap.cells():
+            n = visits.get((s, a), 0)
+            # Unvisited cells carry no local evidence; the merger would still
+            # weigh them as one visit.
+            if n and self._exported.get((s, a)) != (v, n):
+                changed.append([s, a, v, n])
+        if not changed:
+            return 0
+        await self.transport.push({
+            'node': self.node_id,
+            'seq': self._next_seq(),
+            'time': time.time(),
+            'cells': changed,
+        })
+        for s, a, v, n in changed:
+            self._exported[(s, a)] = (v, n)
+        self.exports += 1
+        self.last_export_cells = len(changed)
+        return len(changed)
+
+    def apply(self, merged: Dict):
+        """Adopt the fleet's values, keeping local progress since the last
+        export: Q ← merged + (Q_local − Q_exported)."""
+        q = self.agent.q
+        for state, action, value, _ in merged['cells']:
+            if action not in q.action_index:
+                continue
+            local = q.get((state, action))
+            exported = self._exported.get((state, action))
+            if local is not None and exported is not None:
+                q[(state, action)] = value + (local - exported[0])
+            else:
+                q[(state, action)] = value
+            # The merged value is now this node's baseline. A cell adopted from
+            # the fleet is recorded too, with no local visits, so the next
+            # export does not echo it back as this node's own estimate.
+            self._exported[(state, action)] = (value, exported[1] if exported is not None else 0)
+        self.version = merged['version']
+        self.merges += 1
+        logger.info("applied federated Q-table v%d (%d cells from %d nodes)", self.version, len(merged['cells']), merged.get('nodes', 0))
+
+    def stats(self) -> Dict:
+        return {
+            'node_id': self.node_id,
+            'version': self.version,
+            'exports': self.exports,
+            'last_export_cells': self.last_export_cells,
+            'merges': self.merges,
+        }
+
+
+def build_federation(config, agent) -> Optional[FederationClient]:
+    if not config.get('federation.enabled', False):
+        return None
+    if agent.q is None:
+        logger.warning("federation disabled: the %s engine has no Q-table", agent.engine)
+        return None
+    kind = config.get('federation.transport', 'directory')
+    if kind == 'directory':
+        transport = DirectoryTransport(config.get('federation.dir', 'data/federation'))
+    elif kind == 'http':
+        transport = HTTPTransport(config.get('federation.url', 'http://localhost:8090'))
+    else:
+        raise ValueError(f"unknown federation.transport {kind!r} (expected 'directory' or 'http')")
+    return FederationClient(
+        agent,
+        transport,
+        node_id=config.get('federation.node_id') or socket.gethostname(),
+        interval=config.get('federation.interval', 60),
+    )
+
+
+# --- Merger CLI ---
+
+class FederationHub:
+    """HTTP stand-in for a shared directory: merges deltas as they are
+    posted and serves the merged table. State survives restarts."""
+
+    def __init__(self, state_file: str, port: int = 8090):
+        self.state_file = state_file
+        self.port = port
+        self.merger = Merger.from_dict(_read_json(state_file))
+        self._saved_version = self.merger.version
+
+    def app(self):
+        from aiohttp import web
+
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post('/federation/deltas', self._deltas)
+        app.router.add_get('/federation/merged', self._merged)
+        return app
+
+    async def _deltas(self, request):
+        from aiohttp import web
+
+        try:
+            delta = await request.json()
+            if not isinstance(delta, dict) or not {'node', 'seq', 'cells'} <= delta.keys():
+                raise ValueError(delta)
+            applied = self.merger.apply(delta)
+        except (ValueError, TypeError):
+            return web.json_response({'error': 'expected a JSON object with node, seq and cells of [state, action, value, visits]'}, status=400)
+        return web.json_response({'applied': applied, 'version': self.merger.version})
+
+    async def _merged(self, request):
+        from aiohttp import web
+
+        try:
+            since = int(request.query.get('since', 0))
+        except ValueError:
+            return web.json_response({'error': 'since must be an integer'}, status=400)
+        if self.merger.version <= since:
+            return web.Response(status=304)
+        return web.json_response(self.merger.merged())
+
+    async def _persist(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.save()
+
+    async def save(self):
+        if self.merger.version != self._saved_version:
+            await asyncio.to_thread(_write_json, self.state_file, self.merger.to_dict())
+            self._saved_version = self.merger.version
+
+    async def serve(self):
+        from aiohttp import web
+
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        site = web.TCPSite(runner, '0.0.0.0', self.port)
+        await site.start()
+        logger.info("federation hub on :%d", self.port)
+        persist = asyncio.create_task(self._persist(10.0))
+        try:
+            await asyncio.Event().wait()
+        finally:
+            persist.cancel()
+            await self.save()
+            await runner.cleanup()
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Merge Q-tables exported by Honeygotchi sensors')
+    sub = p.add_subparsers(dest='mode', required=True)
+    merge = sub.add_parser('merge', help='merge deltas in a shared directory')
+    merge.add_argument('--dir', required=True, help='shared federation directory')
+    merge.add_argument('--watch', type=float, help='keep merging every N seconds')
+    hub = sub.add_parser('hub', help='serve the HTTP federation endpoints')
+    hub.add_argument('--port', type=int, default=8090)
+    hub.add_argument('--state', default='data/federation_hub.json', help='where the hub keeps merged state')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    args = parse_args(argv)
+    try:
+        if args.mode == 'hub':
+            asyncio.run(FederationHub(args.state, port=args.port).serve())
+            return
+        transport = DirectoryTransport(args.dir)
+        while True:
+            n = transport.merge_once()
+            if n:
+                logger.info("merged %d deltas", n)
+            if not args.watch:
+                return
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -10,14 +10,34 @@ import asyncssh
 
 if __package__ in (None, ''):
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from src.agent import QLearningAgent  # noqa: E402
+    from src.checkpoint import Checkpointer  # noqa: E402
+    from src.commands import CommandLimits  # noqa: E402
     from src.config_loader import Config  # noqa: E402
+    from src.downloads import build_capture  # noqa: E402
+    from src.engines import build_agent  # noqa: E402
+    from src.event_ring import EventRing  # noqa: E402
+    from src.federation import build_federation  # noqa: E402
+    from src.metrics import STATS  # noqa: E402
+    from src.policy_store import build_policy_store  # noqa: E402
+    from src.replay import build_replay  # noqa: E402
+    from src.session_store import build_session_store  # noqa: E402
+    from src.sketches import SketchPersister  # noqa: E402
     from src.ssh_server import HoneygotchiServer, SessionRunner, ensure_host_key  # noqa: E402
     from src.state_manager import StateManager  # noqa: E402
     from src.stats_api import StatsAPIServer  # noqa: E402
 else:
-    from .agent import QLearningAgent
+    from .checkpoint import Checkpointer
+    from .commands import CommandLimits
     from .config_loader import Config
+    from .downloads import build_capture
+    from .engines import build_agent
+    from .event_ring import EventRing
+    from .federation import build_federation
+    from .metrics import STATS
+    from .policy_store import build_policy_store
+    from .replay import build_replay
+    from .session_store import build_session_store
+    from .sketches import SketchPersister
     from .ssh_server import HoneygotchiServer, SessionRunner, ensure_host_key
     from .state_manager import StateManager
     from .stats_api import StatsAPIServer
@@ -88,26 +108,60 @@ async def run():
     logger.info("starting Honeygotchi")
 
     state_file = config.get('reinforcement_learning.state_file', 'data/rl_state.json')
-    state = StateManager(state_file)
+    state = StateManager(state_file, generations=config.get('reinforcement_learning.keep_generations', 3))
     if args.clear_state:
         state.clear_state()
-        logger.info("cleared saved RL state")
+        logger.info("cleared saved RL state (policy checkpoints are kept; restore one via /api/checkpoints)")
 
-    agent = QLearningAgent(
-        epsilon=config.get('reinforcement_learning.epsilon', 0.3),
-        learning_rate=config.get('reinforcement_learning.learning_rate', 0.1),
-        discount=config.get('reinforcement_learning.discount', 0.9),
-        state_manager=state,
-    )
+    agent = build_agent(config, state_manager=state)
     agent.set_save_interval(config.get('reinforcement_learning.save_interval', 100))
+    replay = build_replay(config, agent)
+    if replay:
+        await replay.start()
+    checkpointer = Checkpointer(
+        agent, state,
+        interval=config.get('reinforcement_learning.checkpoint_interval', 30),
+        replay=replay,
+        store=build_policy_store(config, agent),
+        store_interval=config.get('checkpoints.interval', 3600),
+    )
+    await checkpointer.start()
+
+    federation = build_federation(config, agent)
+    if federation:
+        await federation.start()
+
+    STATS.slow_command_ms = config.get('metrics.slow_command_ms', 50)
+    STATS.events = EventRing(config.get('metrics.event_buffer', 100000))
+    if config.get('metrics.thread_safe', False):
+        STATS.set_thread_safe(asyncio.get_running_loop())
+    sketches = SketchPersister(
+        STATS,
+        config.get('metrics.sketch_file', 'data/stats_sketches.json'),
+        interval=config.get('metrics.sketch_save_interval', 300),
+    )
+    await sketches.start()
+    session_store = build_session_store(config)
+    if session_store:
+        session_store.start()
+        STATS.store = session_store
 
-    api = StatsAPIServer(port=config.get('api.port', 8080), agent=agent)
+    api = StatsAPIServer(port=config.get('api.port', 8080), agent=agent, checkpointer=checkpointer)
     await api.start()
 
     host_key = config.get('ssh.host_key', 'data/ssh_host_key')
     ensure_host_key(host_key)
 
-    runner = SessionRunner(agent, audit, seed_salt=os.urandom(8).hex())
+    capture = build_capture(config)
+    if capture:
+        await capture.start()
+
+    runner = SessionRunner(
+        agent, audit,
+        seed_salt=os.urandom(8).hex(),
+        capture=capture,
+        limits=CommandLimits.from_config(config),
+    )
 
     async def process_factory(process):
         await runner.run(process)
@@ -141,7 +195,18 @@ async def run():
         logger.info("shutting down")
         server.close()
         await server.wait_closed()
-        agent.save_state()
+        if federation:
+            await federation.stop()
+        if replay:
+            # The final checkpoint below writes the buffer.
+            await replay.stop(save=False)
+        await checkpointer.stop()
+        if capture:
+            await capture.stop()
+        await sketches.stop()
+        if session_store:
+            STATS.store = None
+            await session_store.stop()
         await api.stop()
         logger.info("shutdown complete")
 
@@ -0,0 +1,290 @@
+"""Feature-hashed linear Q-function engine.
+
+Q(x, a) = Σ_f w[h(f, a)] over the active features f of a decision context.
+Features are strings (command tokens, every matched category, phase,
+inter-command gap, session and source-IP history, client version) hashed
+into a fixed 2^bits weight vector, so memory is constant no matter how many
+distinct commands, hosts or clients show up, and each decision or update
+touches O(features) weights.
+"""
+import base64
+import logging
+import re
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Tuple
+
+from .agent import (
+    ACTIONS,
+    MALICIOUS_PATTERNS,
+    Decision,
+    QLearningAgent,
+    SessionTracker,
+    classify,
+    engagement_reward,
+    phase_of,
+    state_key,
+    terminal_reward,
+)
+
+logger = logging.getLogger(__name__)
+
+_HOST_RE = re.compile(r'(?:https?|ftp|tftp)://([^/\s:\'"]+)', re.IGNORECASE)
+_ACTION_INDEX = {a: i for i, a in enumerate(ACTIONS)}
+
+
+def _bucket(n: float, edges: Tuple[float, ...]) -> str:
+    for edge in edges:
+        if n < edge:
+            return f"<{edge:g}"
+    return f">={edges[-1]:g}"
+
+
+class LinearAgent(QLearningAgent):
+    """ε-greedy Q-learning with a hashed linear value function.
+
+    Same interface as `QLearningAgent`. The TD target needs the next
+    decision's features, which only exist once the next command arrives, so
+    `observe_next_command` parks the reward on the decision and the update
+    runs at the start of that session's next `select_action`.
+    """
+
+    engine = 'linear'
+    replayable = False
+
+    def __init__(
+        self,
+        epsilon: float = 0.3,
+        learning_rate: float = 0.1,
+        discount: float = 0.9,
+        epsilon_min: float = 0.05,
+        epsilon_decay: float = 0.9995,
+        state_manager=None,
+        rng=None,
+        clock: Callable[[], float] = time.time,
+        bits: int = 18,
+        ip_history: int = 10000,
+        **kwargs,
+    ):
+        super().__init__(
+            epsilon=epsilon,
+            learning_rate=learning_rate,
+            discount=discount,
+            epsilon_min=epsilon_min,
+            epsilon_decay=epsilon_decay,
+            rng=rng,
+            clock=clock,
+            **kwargs,
+        )
+        # No table: replay and federation operate on QTable and stay off.
+        self.q = None
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.weights = array('d', bytes(8 << bits))
+        self.ip_history = ip_history
+        self._ips: 'OrderedDict[str, List[int]]' = OrderedDict()
+        self._indices: Dict[str, Tuple[int, ...]] = {}
+        self._states: Dict[str, Tuple[str, str]] = {}
+        self.updates = 0
+        self.state_manager = state_manager
+        if state_manager:
+            self._restore()
+
+    # --- Features ---
+
+    def _hash(self, feature: str) -> Tuple[int, ...]:
+        idx = self._indices.get(feature)
+        if idx is None:
+            if len(self._indices) >= 200000:
+                self._indices.clear()
+            data = feature.encode('utf-8', 'replace')
+            idx = self._indices[feature] = tuple(
+                zlib.crc32(data, zlib.crc32(a.encode())) & self.mask for a in ACTIONS
+            )
+        return idx
+
+    def _ip_record(self, ip: str) -> List[int]:
+        rec = self._ips.get(ip)
+        if rec is None:
+            rec = self._ips[ip] = [0, 0]
+            if len(self._ips) > self.ip_history:
+                self._ips.popitem(last=False)
+        else:
+            self._ips.move_to_end(ip)
+        return rec
+
+    def features(self, command: str, pattern: str, phase: str, session: SessionTracker, now: float) -> List[str]:
+        """Context of a decision, as feature names. History features describe
+        what happened *before* this command."""
+        feats = ['bias', f"phase:{phase}", f"state:{pattern}|{phase}"]
+        feats.extend(f"cat:{name}" for name, rx in MALICIOUS_PATTERNS.items() if rx.search(command))
+        tokens = command.split()
+        if tokens:
+            feats.append(f"cmd:{tokens[0].rsplit('/', 1)[-1]}")
+            feats.extend(f"tok:{t}" for t in tokens[1:4])
+        feats.extend(f"host:{h.lower()}" for h in _HOST_RE.findall(command)[:2])
+        if session.last_command_at is None:
+            feats.append('gap:first')
+        else:
+            feats.append(f"gap:{_bucket(now - session.last_command_at, (1, 5, 20, 60))}")
+        feats.append(f"prevmal:{_bucket(session.malicious_count, (1, 2, 4, 8))}")
+        if session.client_version:
+            feats.append(f"ver:{session.client_version[:64]}")
+        if session.client_ip:
+            sessions, malicious = self._ip_record(session.client_ip)
+            feats.append(f"ipsessions:{_bucket(sessions, (2, 4, 11))}")
+            feats.append(f"ipmal:{_bucket(malicious, (1, 4, 16))}")
+        return feats
+
+    # --- Value function ---
+
+    def _values(self, indices: Tuple[Tuple[int, ...], ...]) -> List[float]:
+        w = self.weights
+        values = [0.0] * len(ACTIONS)
+        for idx in indices:
+            for a, i in enumerate(idx):
+                values[a] += w[i]
+        return values
+
+    def _update(self, decision: Decision, target: float):
+        indices = decision.features
+        aid = _ACTION_INDEX[decision.action]
+        w = self.weights
+        current = sum(w[idx[aid]] for idx in indices)
+        step = self.alpha * (target - current) / len(indices)
+        for idx in indices:
+            w[idx[aid]] += step
+        self.updates += 1
+
+    # --- Agent interface ---
+
+    def select_action(self, command: str, session: SessionTracker) -> Tuple[str, Decision]:
+        pattern = classify(command)
+        phase = phase_of(session.command_count)
+        state = state_key(pattern, phase)
+        now = self.clock()
+        if session.command_count == 0 and session.client_ip:
+            self._ip_record(session.client_ip)[0] += 1
+        indices = tuple(self._hash(f) for f in self.features(command, pattern, phase, session, now))
+        values = self._values(indices)
+
+        # Deferred update for this session's previous decision, now that the
+        # next context is known.
+        prev = session.pending
+        if prev is not None and prev.reward is not None and prev.features is not None:
+            self._update(prev, prev.reward + self.gamma * max(values))
+            prev.reward = None
+            values = self._values(indices)
+
+        if self.rng.random() < self.epsilon:
+            action = self.rng.choice(ACTIONS)
+        elif not any(values):
+            action = self._warm_start(pattern)
+        else:
+            best = max(values)
+            action = self.rng.choice([a for a, v in zip(ACTIONS, values) if v == best])
+
+        self.action_counts[action] += 1
+        self.decision_count += 1
+        self.epsilon = max(self.epsilon_min, self.epsilon * self.epsilon_decay)
+        self._states.setdefault(state, (pattern, phase))
+
+        decision = Decision(
+            state=state,
+            action=action,
+            timestamp=now,
+            command=command,
+            is_malicious=pattern != 'none',
+            features=indices,
+        )
+        if decision.is_malicious:
+            session.malicious_count += 1
+            if session.client_ip:
+                self._ip_record(session.client_ip)[1] += 1
+        session.last_command_at = now
+
+        if self.state_manager and self.decision_count % self.save_interval == 0:
+            self.request_save()
+
+        return action, decision
+
+    def observe_next_command(self, decision: Decision, next_state: str, next_is_malicious: bool):
+        decision.reward = engagement_reward(self.clock() - decision.timestamp, next_is_malicious)
+
+    def observe_session_end(self, decision: Decision, commands_seen: int):
+        if decision.features is not None:
+            self._update(decision, terminal_reward(commands_seen))
+
+    # --- Introspection ---
+
+    def policy_snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Q-values per `pattern|phase` seen so far, evaluated on the context
+        features alone (no command, history or client features)."""
+        snapshot = {}
+        for state, (pattern, phase) in self._states.items():
+            feats = ['bias', f"phase:{phase}", f"state:{state}"]
+            if pattern != 'none':
+                feats.append(f"cat:{pattern}")
+            values = self._values(tuple(self._hash(f) for f in feats))
+            snapshot[state] = dict(zip(ACTIONS, values))
+        return snapshot
+
+    def policy_detail(self) -> Dict[str, Dict]:
+        # Weights are shared across states, so there are no per-cell counts.
+        return {state: {'values': values} for state, values in self.policy_snapshot().items()}
+
+    @property
+    def version(self) -> int:
+        return self.updates + self.decision_count
+
+    def stats(self) -> Dict:
+        return {
+            'engine': self.engine,
+            'action_counts': dict(self.action_counts),
+            'epsilon': self.epsilon,
+            'q_size': len(self._states),
+            'decision_count': self.decision_count,
+            'weights': len(self.weights),
+            'updates': self.updates,
+        }
+
+    # --- Persistence ---
+
+    def snapshot(self) -> Dict:
+        return {
+            'engine': self.engine,
+            'bits': self.bits,
+            'weights': self.weights.tobytes(),
+            'states': list(self._states),
+            'action_counts': dict(self.action_counts),
+            'epsilon': self.epsilon,
+            'decision_count': self.decision_count,
+        }
+
+    def serialize(self, snapshot: Dict) -> Dict:
+        serialized = dict(snapshot)
+        serialized['weights'] = base64.b64encode(zlib.compress(snapshot['weights'])).decode('ascii')
+        return serialized
+
+    def _restore(self):
+        saved = self.state_manager.load_state()
+        if not saved or not self._compatible(saved):
+            return
+        if saved.get('bits') != self.bits:
+            logger.warning("saved linear weights use %s bits, configured %d; starting fresh", saved.get('bits'), self.bits)
+            return
+        weights = array('d')
+        weights.frombytes(zlib.decompress(base64.b64decode(saved['weights'])))
+        self.weights = weights
+        for state in saved.get('states', []):
+            pattern, _, phase = state.rpartition('|')
+            self._states[state] = (pattern, phase)
+        self.action_counts.update(saved.get('action_counts', {}))
+        self.epsilon = saved.get('epsilon', self.epsilon)
+        self.decision_count = saved.get('decision_count', 0)
+        logger.info(
+            "Restored linear RL state: %d weights, %d decisions, ε=%.3f",
+            len(self.weights), self.decision_count, self.epsilon,
+        )
@@ -1,9 +1,307 @@
 import asyncio
+import functools
+import json
 import time
+from array import array
+from bisect import bisect_left
 from collections import Counter, deque
 from dataclasses import asdict, dataclass, field
 from threading import Lock
-from typing import Any, Deque, Dict, List, Optional
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from .event_ring import EventRing
+from .sketches import HyperLogLog, SpaceSaving
+from .stream_filter import FilterIndex
+
+# Bucket upper bounds. Seconds for timings, bytes for output sizes.
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+SESSION_DURATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+SESSION_COMMAND_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+HANDSHAKE_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# json.dumps with non-default options builds a new encoder per call.
+_encode = json.JSONEncoder(separators=(',', ':')).encode
+
+
+class Histogram:
+    """Fixed-bucket histogram. The bucket array is allocated once, so
+    `observe` only bumps counters."""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return self.bounds[i] if i < len(self.bounds) else float('inf')
+        return None
+
+    def copy(self) -> 'Histogram':
+        h = Histogram.__new__(Histogram)
+        h.bounds = self.bounds
+        h.counts = list(self.counts)
+        h.sum = self.sum
+        h.count = self.count
+        return h
+
+    def to_dict(self, scale: float = 1.0) -> Dict[str, Any]:
+        cumulative, buckets = 0, []
+        for bound, c in zip(self.bounds, self.counts):
+            cumulative += c
+            buckets.append([bound * scale, cumulative])
+        p = {q: self.quantile(q) for q in (0.5, 0.95, 0.99)}
+        return {
+            'count': self.count,
+            'sum': self.sum * scale,
+            'p50': None if p[0.5] is None else p[0.5] * scale,
+            'p95': None if p[0.95] is None else p[0.95] * scale,
+            'p99': None if p[0.99] is None else p[0.99] * scale,
+            'buckets': buckets,
+        }
+
+
+class CommandCost:
+    """Per-command histograms: handler CPU time, wall time (deliberate DELAY
+    excluded) and output size."""
+
+    __slots__ = ('cpu', 'wall', 'output')
+
+    def __init__(self):
+        self.cpu = Histogram(LATENCY_BUCKETS)
+        self.wall = Histogram(LATENCY_BUCKETS)
+        self.output = Histogram(SIZE_BUCKETS)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.cpu.count,
+            'cpu_ms': self.cpu.to_dict(scale=1000.0),
+            'wall_ms': self.wall.to_dict(scale=1000.0),
+            'output_bytes': self.output.to_dict(),
+        }
+
+
+class _Ring:
+    """Counts per `step`-second slot for the last `size` slots, one column
+    per series. A slot is zeroed lazily when time wraps back onto it."""
+
+    __slots__ = ('step', 'size', 'stamps', 'series')
+
+    def __init__(self, step: int, size: int):
+        self.step = step
+        self.size = size
+        self.stamps = array('q', [-1]) * size
+        self.series: Dict[str, array] = {}
+
+    def add(self, names: Sequence[str], now: float, n: int):
+        slot = int(now // self.step)
+        i = slot % self.size
+        series = self.series
+        if self.stamps[i] != slot:
+            self.stamps[i] = slot
+            for col in series.values():
+                col[i] = 0
+        for name in names:
+            col = series.get(name)
+            if col is None:
+                col = series[name] = array('q', [0]) * self.size
+            col[i] += n
+
+    def window(self, start: float, end: float, names: Sequence[str]) -> Dict[str, Any]:
+        first = max(int(start // self.step), int(end // self.step) - self.size + 1)
+        slots = range(first, int(end // self.step) + 1)
+        stamps = self.stamps
+        live = [(j, slot % self.size) for j, slot in enumerate(slots) if stamps[slot % self.size] == slot]
+        out = {}
+        for name in names:
+            values = [0] * len(slots)
+            col = self.series.get(name)
+            if col is not None:
+                for j, i in live:
+                    values[j] = col[i]
+            out[name] = values
+        return {'step': self.step, 'start': first * self.step, 'points': len(slots), 'series': out}
+
+
+class TimeSeries:
+    """Fixed-memory rollups: per-second counts for an hour, per-minute for
+    a day and per-hour for 30 days. `add` is O(1) per resolution; a window
+    costs O(points x series)."""
+
+    RESOLUTIONS = {'second': (1, 3600), 'minute': (60, 1440), 'hour': (3600, 720)}
+
+    def __init__(self):
+        self._rings = {name: _Ring(step, size) for name, (step, size) in self.RESOLUTIONS.items()}
+        self._ring_list = tuple(self._rings.values())
+
+    def add(self, name: str, now: float, n: int = 1):
+        for ring in self._ring_list:
+            ring.add((name,), now, n)
+
+    def add_many(self, names: Sequence[str], now: float, n: int = 1):
+        """`add` for several series at the same instant; each ring finds
+        its slot once."""
+        for ring in self._ring_list:
+            ring.add(names, now, n)
+
+    def names(self) -> List[str]:
+        return sorted(self._rings['second'].series)
+
+    def window(
+        self,
+        resolution: str = 'minute',
+        seconds: Optional[float] = None,
+        series: Optional[Sequence[str]] = None,
+        now: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Counts for the last `seconds` (default 60 points) at `resolution`.
+        `series` entries ending in ':' select every series with that prefix
+        (e.g. 'action:')."""
+        ring = self._rings[resolution]
+        now = time.time() if now is None else now
+        seconds = ring.step * 60 if seconds is None else seconds
+        names = self.names()
+        if series:
+            names = [n for n in names if any(n == s or (s.endswith(':') and n.startswith(s)) for s in series)]
+        return ring.window(now - seconds + ring.step, now, names)
+
+
+class Subscription:
+    """One stream reader's position in an `EventHub`."""
+
+    __slots__ = ('last_id', 'sent', 'dropped', 'connected_at')
+
+    def __init__(self, last_id: int):
+        self.last_id = last_id
+        self.sent = 0
+        self.dropped = 0
+        self.connected_at = time.time()
+
+
+class EventHub:
+    """Serialize-once fan-out for the SSE stream.
+
+    `publish` gives each event the next id, encodes it once into a complete
+    SSE frame and stores it in a ring of the last `ring_size` frames.
+    Readers do not get their own queues: each `Subscription` is just the last
+    id it has sent, and `drain` returns the ring frames after that id. A
+    slow reader falls behind until the ring overwrites frames it has not
+    read. Those frames count as its `dropped`, and the reader skips ahead.
+    The same ring serves `Last-Event-ID` resumes.
+
+    Filtered WebSocket readers are served from `filters`, a `FilterIndex`
+    that receives the same encoded JSON.
+
+    Event-loop only, like the sessions that publish into it.
+    """
+
+    def __init__(self, ring_size: int = 1024):
+        self.ring_size = ring_size
+        self._frames: List[bytes] = [b''] * ring_size
+        self.last_id = 0
+        self.published = 0
+        self.dropped = 0
+        self._subs: List[Subscription] = []
+        self._wakeup = asyncio.Event()
+        self._waiting = 0
+        self.filters = FilterIndex()
+
+    def publish(self, event: Dict[str, Any]) -> int:
+        self.last_id += 1
+        event['id'] = self.last_id
+        data = _encode(event)
+        self._frames[self.last_id % self.ring_size] = f"id: {self.last_id}\ndata: {data}\n\n".encode()
+        self.published += 1
+        if self.filters:
+            self.filters.dispatch(event, data)
+        if self._waiting:
+            # A fresh Event only when someone is parked on the old one.
+            wakeup, self._wakeup = self._wakeup, asyncio.Event()
+            wakeup.set()
+        return self.last_id
+
+    def subscribe(self, last_event_id: Optional[int] = None, backlog: int = 25) -> Subscription:
+        """Start after `last_event_id` (a reconnect), or with the last
+        `backlog` events for a fresh reader."""
+        if last_event_id is None or last_event_id > self.last_id:
+            last_event_id = max(0, self.last_id - backlog)
+        else:
+            # The id is client-supplied; a resume from before the ring can
+            # miss at most the ring, not inflate `dropped` arbitrarily.
+            last_event_id = max(last_event_id, self.last_id - self.ring_size, 0)
+        sub = Subscription(last_event_id)
+        self._subs.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        if sub in self._subs:
+            self._subs.remove(sub)
+
+    def drain(self, sub: Subscription, limit: int = 256) -> List[bytes]:
+        """Frames after `sub.last_id`, oldest first, at most `limit`."""
+        oldest = self.last_id - self.ring_size + 1
+        if sub.last_id + 1 < oldest:
+            missed = oldest - sub.last_id - 1
+            sub.dropped += missed
+            self.dropped += missed
+            sub.last_id = oldest - 1
+        end = min(self.last_id, sub.last_id + limit)
+        frames = [self._frames[i % self.ring_size] for i in range(sub.last_id + 1, end + 1)]
+        sub.last_id = end
+        sub.sent += len(frames)
+        return frames
+
+    async def wait(self, sub: Subscription, timeout: float) -> bool:
+        """Until there is something after `sub.last_id`; False on timeout."""
+        if self.last_id > sub.last_id:
+            return True
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiting -= 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        lags = [self.last_id - sub.last_id for sub in self._subs]
+        return {
+            'last_id': self.last_id,
+            'published': self.published,
+            'subscribers': len(self._subs),
+            'max_lag': max(lags, default=0),
+            'dropped': self.dropped,
+            'ring_size': self.ring_size,
+            'readers': [
+                {
+                    'lag': self.last_id - sub.last_id,
+                    'sent': sub.sent,
+                    'dropped': sub.dropped,
+                    'connected_at': sub.connected_at,
+                }
+                for sub in self._subs
+            ],
+            'filtered': self.filters.stats(),
+        }
 
 
 @dataclass
@@ -28,17 +326,46 @@ class SessionRecord:
         return data
 
 
+SKETCHES = ('ips', 'usernames', 'passwords', 'credentials', 'commands')
+
+
+# Public methods that take the registry lock in thread-safe mode.
+_LOCKED = (
+    'record_login', 'start_session', 'record_command', 'end_session',
+    'record_handshake', 'record_decision', 'record_command_cost',
+    'snapshot', 'overview', 'top_keys', 'dump_sketches', 'load_sketches',
+    'exposition_snapshot', 'recent_sessions', 'get_session', 'command_costs',
+    'slow_commands', 'timeseries_window', 'recent_events', 'events_after',
+)
+
+
+def _locked(lock: Lock, method: Callable) -> Callable:
+    @functools.wraps(method)
+    def call(*args, **kwargs):
+        with lock:
+            return method(*args, **kwargs)
+    return call
+
+
 class StatsRegistry:
-    """Thread-safe in-memory metrics + recent-event buffer for the dashboard.
+    """In-memory metrics + recent-event buffer for the dashboard.
 
-    Everything lives in a single process; the dashboard reads via HTTP, so we
-    don't need Prometheus or any external TSDB.
+    Everything lives in a single process; the dashboard reads via HTTP and
+    `/metrics` renders the same numbers for a Prometheus scraper.
+
+    By default the registry belongs to the event loop: the SSH sessions
+    that record and the API handlers that read all run on the loop thread,
+    and no method awaits, so every update and every view is atomic without
+    a lock. `set_thread_safe()` is for deployments that record from worker
+    threads: it puts one lock around each public method and hands events
+    to the loop for publishing.
     """
 
-    def __init__(self, max_sessions: int = 200, max_events: int = 1000):
-        self._lock = Lock()
+    def __init__(self, max_sessions: int = 200, max_events: int = 100_000, slow_command_ms: float = 50.0):
+        self._lock: Optional[Lock] = None
+        # Bumped on every mutation; API responses are cached per version.
+        self.version = 0
         self._max_sessions = max_sessions
-        self._max_events = max_events
         self._start_time = time.time()
 
         self.sessions_total = 0
@@ -50,30 +377,50 @@ class StatsRegistry:
         self.actions: Counter = Counter()
         self.patterns: Counter = Counter()
         self.commands_by_action_malicious: Counter = Counter()  # (action, is_malicious) -> count
-        self.client_ips: Counter = Counter()
-        self.top_usernames: Counter = Counter()
+        # Fixed-memory heavy hitters and distinct counts; brute force from
+        # the whole internet would grow plain Counters without bound.
+        self.top = {name: SpaceSaving(1000) for name in SKETCHES}
+        self.unique = {name: HyperLogLog() for name in SKETCHES}
+        self.client_ips = self.top['ips']
+        self.top_usernames = self.top['usernames']
 
         self._sessions: Dict[str, SessionRecord] = {}
         self._session_order: Deque[str] = deque()
-        self._events: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        self.events = EventRing(max_events)
+
+        self.hub = EventHub()
+        # Optional durable history (SessionStore); only ever enqueued to.
+        self.store = None
+        self.timeseries = TimeSeries()
 
-        self._subscribers: List[asyncio.Queue] = []
+        self.session_duration = Histogram(SESSION_DURATION_BUCKETS)
+        self.session_commands = Histogram(SESSION_COMMAND_BUCKETS)
+        self.handshake = Histogram(HANDSHAKE_BUCKETS)
+        self.decision = Histogram(LATENCY_BUCKETS)
+
+        self.slow_command_ms = slow_command_ms
+        self._command_costs: Dict[str, CommandCost] = {}
+        self._slow_commands: Deque[Dict[str, Any]] = deque(maxlen=100)
 
     # --- Counters ---
 
     def record_login(self, client_ip: str, username: str, password: str, accepted: bool = True):
-        with self._lock:
-            self.login_attempts += 1
-            self.top_usernames[username] += 1
-            event = {
-                'type': 'login',
-                'ts': time.time(),
-                'client_ip': client_ip,
-                'username': username,
-                'password': password,
-                'accepted': accepted,
-            }
-            self._events.append(event)
+        now = time.time()
+        self.version += 1
+        self.login_attempts += 1
+        self._sketch('usernames', username)
+        self._sketch('passwords', password)
+        self._sketch('credentials', f'{username}:{password}')
+        self.timeseries.add('logins', now)
+        event = {
+            'type': 'login',
+            'ts': now,
+            'client_ip': client_ip,
+            'username': username,
+            'password': password,
+            'accepted': accepted,
+        }
+        self.events.append('login', now, None, client_ip, username, password, flag=accepted)
         self._publish(event)
 
     def start_session(self, session_id: str, client_ip: str, username: str):
@@ -83,23 +430,26 @@ class StatsRegistry:
             username=username,
             started_at=time.time(),
         )
-        with self._lock:
-            self.sessions_total += 1
-            self.active_sessions += 1
-            self.client_ips[client_ip] += 1
-            self._sessions[session_id] = rec
-            self._session_order.append(session_id)
-            while len(self._session_order) > self._max_sessions:
-                old = self._session_order.popleft()
-                self._sessions.pop(old, None)
-            event = {
-                'type': 'session_start',
-                'ts': rec.started_at,
-                'session_id': session_id,
-                'client_ip': client_ip,
-                'username': username,
-            }
-            self._events.append(event)
+        self.version += 1
+        self.sessions_total += 1
+        self.active_sessions += 1
+        self.timeseries.add('sessions', rec.started_at)
+        self._sketch('ips', client_ip)
+        self._sessions[session_id] = rec
+        self._session_order.append(session_id)
+        while len(self._session_order) > self._max_sessions:
+            old = self._session_order.popleft()
+            self._sessions.pop(old, None)
+        if self.store is not None:
+            self.store.session_start(session_id, client_ip, username, rec.started_at)
+        event = {
+            'type': 'session_start',
+            'ts': rec.started_at,
+            'session_id': session_id,
+            'client_ip': client_ip,
+            'username': username,
+        }
+        self.events.append('session_start', rec.started_at, session_id, client_ip, username)
         self._publish(event)
 
     def record_command(
@@ -110,108 +460,249 @@ class StatsRegistry:
         pattern: str,
         is_malicious: bool,
     ):
-        with self._lock:
-            self.commands_total += 1
-            self.actions[action] += 1
-            if is_malicious:
-                self.malicious_total += 1
-                self.patterns[pattern] += 1
-            self.commands_by_action_malicious[(action, bool(is_malicious))] += 1
-            rec = self._sessions.get(session_id)
-            if rec:
-                rec.command_count += 1
-                rec.commands.append({
-                    'ts': time.time(),
-                    'command': command,
-                    'action': action,
-                    'pattern': pattern,
-                    'is_malicious': is_malicious,
-                })
-                if len(rec.commands) > 50:
-                    rec.commands = rec.commands[-50:]
-            event = {
-                'type': 'command',
-                'ts': time.time(),
-                'session_id': session_id,
+        now = time.time()
+        self.version += 1
+        self.commands_total += 1
+        self.actions[action] += 1
+        self._sketch('commands', command[:200])
+        if is_malicious:
+            self.malicious_total += 1
+            self.patterns[pattern] += 1
+            self.timeseries.add_many(('commands', f'action:{action}', 'malicious', f'pattern:{pattern}'), now)
+        else:
+            self.timeseries.add_many(('commands', f'action:{action}'), now)
+        self.commands_by_action_malicious[(action, bool(is_malicious))] += 1
+        if self.store is not None:
+            self.store.command(session_id, now, command, action, pattern, is_malicious)
+        rec = self._sessions.get(session_id)
+        if rec:
+            rec.command_count += 1
+            rec.commands.append({
+                'ts': now,
                 'command': command,
                 'action': action,
                 'pattern': pattern,
                 'is_malicious': is_malicious,
-            }
-            self._events.append(event)
+            })
+            if len(rec.commands) > 50:
+                rec.commands = rec.commands[-50:]
+        event = {
+            'type': 'command',
+            'ts': now,
+            'session_id': session_id,
+            'client_ip': rec.client_ip if rec else None,
+            'command': command,
+            'action': action,
+            'pattern': pattern,
+            'is_malicious': is_malicious,
+        }
+        self.events.append(
+            'command', now, session_id, event['client_ip'], command, pattern,
+            action=action, flag=is_malicious,
+        )
         self._publish(event)
 
     def end_session(self, session_id: str):
-        with self._lock:
-            self.active_sessions = max(0, self.active_sessions - 1)
-            rec = self._sessions.get(session_id)
-            if rec:
-                rec.ended_at = time.time()
-                event = {
-                    'type': 'session_end',
-                    'ts': rec.ended_at,
-                    'session_id': session_id,
-                    'duration': rec.duration,
-                    'command_count': rec.command_count,
-                }
-                self._events.append(event)
-            else:
-                event = None
+        self.version += 1
+        self.active_sessions = max(0, self.active_sessions - 1)
+        now = time.time()
+        # Sessions that outlived the in-memory window still need their end
+        # in the store (and the writer's per-session state released).
+        if self.store is not None:
+            self.store.session_end(session_id, now)
+        rec = self._sessions.get(session_id)
+        if rec:
+            rec.ended_at = now
+            self.session_duration.observe(rec.duration)
+            self.session_commands.observe(rec.command_count)
+            event = {
+                'type': 'session_end',
+                'ts': rec.ended_at,
+                'session_id': session_id,
+                'client_ip': rec.client_ip,
+                'duration': rec.duration,
+                'command_count': rec.command_count,
+            }
+            self.events.append(
+                'session_end', rec.ended_at, session_id, rec.client_ip,
+                value=rec.duration, count=rec.command_count,
+            )
+        else:
+            event = None
         if event:
             self._publish(event)
 
+    def _sketch(self, name: str, key: str):
+        self.top[name].add(key)
+        self.unique[name].add(key)
+
+    def record_handshake(self, seconds: float):
+        """TCP connect to completed authentication."""
+        self.version += 1
+        self.handshake.observe(seconds)
+
+    def record_decision(self, seconds: float):
+        """Time the agent spent learning from and choosing for one command."""
+        self.version += 1
+        self.decision.observe(seconds)
+
+    def record_command_cost(
+        self,
+        name: str,
+        cpu_seconds: float,
+        wall_seconds: float,
+        output_bytes: int,
+        session_id: Optional[str] = None,
+        command: str = '',
+    ):
+        self.version += 1
+        cost = self._command_costs.get(name)
+        if cost is None:
+            cost = self._command_costs[name] = CommandCost()
+        cost.cpu.observe(cpu_seconds)
+        cost.wall.observe(wall_seconds)
+        cost.output.observe(output_bytes)
+        if wall_seconds * 1000.0 >= self.slow_command_ms:
+            self._slow_commands.append({
+                'ts': time.time(),
+                'session_id': session_id,
+                'name': name,
+                'command': command[:200],
+                'cpu_ms': cpu_seconds * 1000.0,
+                'wall_ms': wall_seconds * 1000.0,
+                'output_bytes': output_bytes,
+            })
+
     # --- Views ---
 
     def snapshot(self) -> Dict[str, Any]:
-        with self._lock:
-            return {
-                'uptime_seconds': time.time() - self._start_time,
-                'sessions_total': self.sessions_total,
-                'active_sessions': self.active_sessions,
-                'commands_total': self.commands_total,
-                'malicious_total': self.malicious_total,
-                'login_attempts': self.login_attempts,
-                'actions': dict(self.actions),
-                'patterns': dict(self.patterns),
-                'top_client_ips': self.client_ips.most_common(10),
-                'top_usernames': self.top_usernames.most_common(10),
-            }
+        return self._snapshot()
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {
+            'uptime_seconds': time.time() - self._start_time,
+            'sessions_total': self.sessions_total,
+            'active_sessions': self.active_sessions,
+            'commands_total': self.commands_total,
+            'malicious_total': self.malicious_total,
+            'login_attempts': self.login_attempts,
+            'actions': dict(self.actions),
+            'patterns': dict(self.patterns),
+            'top_client_ips': self.client_ips.most_common(10),
+            'top_usernames': self.top_usernames.most_common(10),
+            'unique': {name: hll.count() for name, hll in self.unique.items()},
+            'stream': self.hub.stats(),
+            'events': self.events.stats(),
+        }
+
+    def top_keys(self, name: str, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.top[name].top(limit)
+
+    def dump_sketches(self) -> Dict[str, Any]:
+        return {
+            'top': {name: sketch.to_dict() for name, sketch in self.top.items()},
+            'unique': {name: hll.to_dict() for name, hll in self.unique.items()},
+        }
+
+    def load_sketches(self, data: Dict[str, Any]):
+        self.version += 1
+        for name, sketch in data.get('top', {}).items():
+            if name in self.top:
+                self.top[name] = SpaceSaving.from_dict(sketch, k=self.top[name].k)
+        for name, hll in data.get('unique', {}).items():
+            if name in self.unique:
+                self.unique[name] = HyperLogLog.from_dict(hll)
+        self.client_ips = self.top['ips']
+        self.top_usernames = self.top['usernames']
+
+    def exposition_snapshot(self) -> Dict[str, Any]:
+        """Raw counters and histogram copies for `/metrics`. Only copying
+        happens here; formatting is the caller's job."""
+        return {
+            'uptime_seconds': time.time() - self._start_time,
+            'sessions_total': self.sessions_total,
+            'active_sessions': self.active_sessions,
+            'commands_total': self.commands_total,
+            'malicious_total': self.malicious_total,
+            'login_attempts': self.login_attempts,
+            'actions': dict(self.actions),
+            'patterns': dict(self.patterns),
+            'session_duration': self.session_duration.copy(),
+            'session_commands': self.session_commands.copy(),
+            'handshake': self.handshake.copy(),
+            'decision': self.decision.copy(),
+            'command_costs': {
+                name: (cost.cpu.copy(), cost.wall.copy(), cost.output.copy())
+                for name, cost in self._command_costs.items()
+            },
+            'stream': self.hub.stats(),
+            'unique': {name: hll.count() for name, hll in self.unique.items()},
+        }
+
+    def overview(
+        self,
+        sections: Sequence[str] = ('stats', 'sessions', 'timeseries'),
+        sessions_limit: int = 10,
+        resolution: str = 'minute',
+        seconds: Optional[float] = None,
+        series: Optional[Sequence[str]] = None,
+    ) -> Dict[str, Any]:
+        """`snapshot()`, `recent_sessions()` and `timeseries_window()`
+        (whichever `sections` names) read in one call, and under one lock
+        acquisition in thread-safe mode, so the parts agree with each other."""
+        out: Dict[str, Any] = {}
+        if 'stats' in sections:
+            out['stats'] = self._snapshot()
+        if 'sessions' in sections:
+            out['sessions'] = self._recent_sessions(sessions_limit, False)
+        if 'timeseries' in sections:
+            out['timeseries'] = self.timeseries.window(resolution, seconds, series)
+        return out
 
     def recent_sessions(self, limit: int = 50, include_commands: bool = False) -> List[Dict[str, Any]]:
-        with self._lock:
-            ids = list(self._session_order)[-limit:][::-1]
-            return [self._sessions[i].to_dict(include_commands=include_commands) for i in ids if i in self._sessions]
+        return self._recent_sessions(limit, include_commands)
+
+    def _recent_sessions(self, limit: int, include_commands: bool) -> List[Dict[str, Any]]:
+        order = self._session_order
+        ids = [order[-1 - i] for i in range(min(limit, len(order)))]
+        return [self._sessions[i].to_dict(include_commands=include_commands) for i in ids if i in self._sessions]
 
     def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        with self._lock:
-            rec = self._sessions.get(session_id)
-            return rec.to_dict(include_commands=True) if rec else None
+        rec = self._sessions.get(session_id)
+        return rec.to_dict(include_commands=True) if rec else None
+
+    def command_costs(self) -> Dict[str, Dict[str, Any]]:
+        return {name: cost.to_dict() for name, cost in sorted(self._command_costs.items())}
+
+    def slow_commands(self, limit: int = 50) -> List[Dict[str, Any]]:
+        return list(self._slow_commands)[-limit:][::-1]
+
+    def timeseries_window(self, resolution: str = 'minute', seconds: Optional[float] = None, series: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        return self.timeseries.window(resolution, seconds, series)
 
     def recent_events(self, limit: int = 200) -> List[Dict[str, Any]]:
-        with self._lock:
-            return list(self._events)[-limit:]
+        return self.events.read(None, limit)[0]
 
-    # --- Pub/sub for SSE streaming ---
+    def events_after(self, after: Optional[int], limit: int = 200) -> Tuple[List[Dict[str, Any]], int]:
+        """Events after cursor `after` (or the newest ones), oldest first,
+        and the next cursor."""
+        return self.events.read(after, limit)
 
-    def subscribe(self) -> asyncio.Queue:
-        queue: asyncio.Queue = asyncio.Queue(maxsize=200)
-        with self._lock:
-            self._subscribers.append(queue)
-        return queue
+    def set_thread_safe(self, loop: asyncio.AbstractEventLoop):
+        """Switch to locked mode. `loop` owns the event hub; events recorded
+        on any thread are published there in recording order."""
+        if self._lock is not None:
+            return
+        self._lock = Lock()
+        for name in _LOCKED:
+            setattr(self, name, _locked(self._lock, getattr(self, name)))
+        publish = self.hub.publish
+        self._publish = lambda event: loop.call_soon_threadsafe(publish, event)
 
-    def unsubscribe(self, queue: asyncio.Queue):
-        with self._lock:
-            if queue in self._subscribers:
-                self._subscribers.remove(queue)
+    # --- Pub/sub for SSE streaming ---
 
     def _publish(self, event: Dict[str, Any]):
-        with self._lock:
-            subs = list(self._subscribers)
-        for q in subs:
-            try:
-                q.put_nowait(event)
-            except asyncio.QueueFull:
-                pass
+        self.hub.publish(event)
 
 
 # Module-level registry used across the process.
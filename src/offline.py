@@ -0,0 +1,407 @@
+"""Offline training and evaluation of the agent from audit logs.
+
+    python -m src.offline train logs/ -o data/rl_state.json
+    python -m src.offline evaluate logs/ --policy data/rl_state.json --policy other.json
+
+Audit logs (including rotated `audit.log.N` and `.gz`/`.bz2`/`.xz` copies)
+are replayed into the same transitions the live loop learns from: state
+`pattern|phase` at each command, the logged action, the engagement reward
+from the gap to the next command, and the terminal reward at session end.
+
+Each file is scanned in a worker process. Sessions that start and end
+inside one file are reduced there; the few that straddle a rotation come
+back as raw events and are stitched together in the parent.
+
+`train` builds the empirical model (mean reward and next-state counts per
+state/action) and solves it by value iteration, writing a state file that
+`QLearningAgent` restores like any other. `evaluate` estimates the
+engagement a policy file would get with per-session importance sampling
+against the logged behavior policy.
+"""
+import argparse
+import bz2
+import gzip
+import json
+import lzma
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.agent import ACTIONS, _parse_q, engagement_reward, phase_of, state_key, terminal_reward  # noqa: E402
+    from src.state_manager import StateManager  # noqa: E402
+else:
+    from .agent import ACTIONS, _parse_q, engagement_reward, phase_of, state_key, terminal_reward
+    from .state_manager import StateManager
+
+_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+_ROTATED = re.compile(r'\.(\d+)(?:\.(?:gz|bz2|xz))?$')
+
+# (timestamp, pattern, action, command_count) per logged command.
+Command = Tuple[float, str, str, int]
+Transition = Tuple[str, str, float, Optional[str]]
+
+
+# --- Reading logs ---
+
+def discover(paths: Iterable[str]) -> List[str]:
+    """Expand directories to their `audit.log*` files and order everything
+    oldest first (`audit.log.10` before `audit.log.1` before `audit.log`)."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.startswith('audit.log')
+            )
+        else:
+            files.append(path)
+
+    def age(path: str) -> int:
+        m = _ROTATED.search(os.path.basename(path))
+        return int(m.group(1)) if m else 0
+
+    return sorted(set(files), key=lambda p: (-age(p), p))
+
+
+def open_log(path: str):
+    opener = _OPENERS.get(os.path.splitext(path)[1], open)
+    return opener(path, 'rt', encoding='utf-8', errors='replace')
+
+
+def _timestamp(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def scan(path: str) -> Dict[str, Dict]:
+    """Per-session command lists from one file:
+    {session_id: {'commands': [Command], 'started': bool, 'end': count|None}}."""
+    sessions: Dict[str, Dict] = {}
+    with open_log(path) as f:
+        for line in f:
+            # Cheap prefilter; auth events are most of a busy sensor's log.
+            if '"command"' not in line and '"session_' not in line:
+                continue
+            try:
+                event = json.loads(line)
+                kind = event['event']
+                sid = event['session_id']
+            except (ValueError, KeyError, TypeError):
+                continue
+            if kind not in ('command', 'session_start', 'session_end'):
+                continue
+            rec = sessions.get(sid)
+            if rec is None:
+                rec = sessions[sid] = {'commands': [], 'started': False, 'end': None}
+            try:
+                if kind == 'command':
+                    rec['commands'].append((
+                        _timestamp(event['timestamp']),
+                        event['pattern'],
+                        event['action'],
+                        int(event['command_count']),
+                    ))
+                elif kind == 'session_start':
+                    rec['started'] = True
+                else:
+                    rec['end'] = int(event['command_count'])
+            except (KeyError, ValueError, TypeError):
+                continue
+    return sessions
+
+
+def _split(sessions: Dict[str, Dict]) -> Tuple[List[Dict], Dict[str, Dict]]:
+    complete, partial = [], {}
+    for sid, rec in sessions.items():
+        if rec['started'] and rec['end'] is not None:
+            complete.append(rec)
+        else:
+            partial[sid] = rec
+    return complete, partial
+
+
+def _stitch(partials: Iterable[Dict[str, Dict]]) -> List[Dict]:
+    """Merge per-file fragments of sessions that crossed a rotation."""
+    merged: Dict[str, Dict] = {}
+    for fragment in partials:
+        for sid, rec in fragment.items():
+            into = merged.get(sid)
+            if into is None:
+                merged[sid] = {'commands': list(rec['commands']), 'started': rec['started'], 'end': rec['end']}
+                continue
+            into['commands'].extend(rec['commands'])
+            into['started'] = into['started'] or rec['started']
+            if rec['end'] is not None:
+                into['end'] = rec['end']
+    for rec in merged.values():
+        rec['commands'].sort(key=lambda c: c[3])
+    return list(merged.values())
+
+
+def transitions(session: Dict) -> Iterator[Transition]:
+    """The transitions the live loop would have learned from this session.
+    `command_count` is logged after the increment, so a command's phase is
+    taken from the count before it. The last command is only terminal if the
+    session_end was seen; otherwise the log was cut and it is dropped."""
+    commands: List[Command] = session['commands']
+    for i, (ts, pattern, action, count) in enumerate(commands):
+        if action not in ACTIONS:
+            continue
+        state = state_key(pattern, phase_of(count - 1))
+        if i + 1 < len(commands):
+            next_ts, next_pattern, _, next_count = commands[i + 1]
+            reward = engagement_reward(next_ts - ts, next_pattern != 'none')
+            yield state, action, reward, state_key(next_pattern, phase_of(next_count - 1))
+        elif session['end'] is not None:
+            yield state, action, terminal_reward(session['end']), None
+
+
+# --- Training ---
+
+class Model:
+    """Empirical MDP: visit counts, reward sums and next-state counts per
+    (state, action). Models from different files add up."""
+
+    def __init__(self):
+        self.visits: Dict[Tuple[str, str], int] = {}
+        self.rewards: Dict[Tuple[str, str], float] = {}
+        self.successors: Dict[Tuple[str, str], Dict[Optional[str], int]] = {}
+        self.sessions = 0
+
+    def add(self, state: str, action: str, reward: float, next_state: Optional[str]):
+        key = (state, action)
+        self.visits[key] = self.visits.get(key, 0) + 1
+        self.rewards[key] = self.rewards.get(key, 0.0) + reward
+        nxt = self.successors.setdefault(key, {})
+        nxt[next_state] = nxt.get(next_state, 0) + 1
+
+    def add_session(self, session: Dict):
+        for t in transitions(session):
+            self.add(*t)
+        self.sessions += 1
+
+    def merge(self, other: 'Model'):
+        for key, n in other.visits.items():
+            self.visits[key] = self.visits.get(key, 0) + n
+            self.rewards[key] = self.rewards.get(key, 0.0) + other.rewards[key]
+            into = self.successors.setdefault(key, {})
+            for s, c in other.successors[key].items():
+                into[s] = into.get(s, 0) + c
+        self.sessions += other.sessions
+
+    def behavior(self, smoothing: float = 0.5) -> Dict[str, Dict[str, float]]:
+        """Logged action frequencies per state, with additive smoothing so no
+        action has zero probability."""
+        counts: Dict[str, Dict[str, int]] = {}
+        for (state, action), n in self.visits.items():
+            counts.setdefault(state, {})[action] = n
+        policy = {}
+        for state, per_action in counts.items():
+            total = sum(per_action.values()) + smoothing * len(ACTIONS)
+            policy[state] = {a: (per_action.get(a, 0) + smoothing) / total for a in ACTIONS}
+        return policy
+
+    def solve(self, gamma: float, tol: float = 1e-6, max_iter: int = 1000) -> Dict[Tuple[str, str], float]:
+        """Value iteration over the empirical model. Unvisited next states
+        are worth 0, like an empty Q-table row."""
+        q = {key: 0.0 for key in self.visits}
+        best: Dict[str, float] = {}
+        for _ in range(max_iter):
+            best.clear()
+            for (state, _), v in q.items():
+                if v > best.get(state, float('-inf')):
+                    best[state] = v
+            delta = 0.0
+            for key, n in self.visits.items():
+                future = sum(
+                    c * best.get(s, 0.0) for s, c in self.successors[key].items() if s is not None
+                )
+                value = (self.rewards[key] + gamma * future) / n
+                delta = max(delta, abs(value - q[key]))
+                q[key] = value
+            if delta < tol:
+                break
+        return q
+
+
+def _train_file(path: str) -> Tuple[Model, Dict[str, Dict]]:
+    complete, partial = _split(scan(path))
+    model = Model()
+    for session in complete:
+        model.add_session(session)
+    return model, partial
+
+
+def build_model(files: List[str], workers: Optional[int]) -> Model:
+    model = Model()
+    partials = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for part, partial in pool.map(_train_file, files):
+            model.merge(part)
+            partials.append(partial)
+    for session in _stitch(partials):
+        model.add_session(session)
+    return model
+
+
+# --- Evaluation ---
+
+_BEHAVIOR: Dict[str, Dict[str, float]] = {}
+_TARGETS: List[Dict[str, Dict[str, float]]] = []
+_GAMMA = 1.0
+
+
+def _init_eval(behavior, targets, gamma):
+    global _BEHAVIOR, _TARGETS, _GAMMA
+    _BEHAVIOR, _TARGETS, _GAMMA = behavior, targets, gamma
+
+
+def greedy_policy(q: Dict[Tuple[str, str], float], epsilon: float) -> Dict[str, Dict[str, float]]:
+    """ε-greedy action probabilities per state of a Q-table, ties split
+    evenly. Mirrors `QLearningAgent.select_action` for states it has seen."""
+    rows: Dict[str, Dict[str, float]] = {}
+    for (state, action), v in q.items():
+        rows.setdefault(state, {})[action] = v
+    policy = {}
+    for state, row in rows.items():
+        values = [row.get(a, 0.0) for a in ACTIONS]
+        top = max(values)
+        best = [a for a, v in zip(ACTIONS, values) if v == top]
+        policy[state] = {
+            a: epsilon / len(ACTIONS) + ((1 - epsilon) / len(best) if a in best else 0.0)
+            for a in ACTIONS
+        }
+    return policy
+
+
+def _new_estimate() -> Dict[str, float]:
+    return {'sessions': 0, 'ret': 0.0, 'w': 0.0, 'w2': 0.0, 'wret': 0.0}
+
+
+def _evaluate_session(session: Dict, estimates: List[Dict[str, float]]):
+    steps = list(transitions(session))
+    if not steps:
+        return
+    ret = sum(reward * _GAMMA ** t for t, (_, _, reward, _) in enumerate(steps))
+    for target, est in zip(_TARGETS, estimates):
+        # States the target table has never seen are assumed to follow the
+        # logged policy (ratio 1) — the live agent would explore them anyway.
+        rho = 1.0
+        for state, action, _, _ in steps:
+            pi = target.get(state)
+            if pi is not None:
+                rho *= pi[action] / _BEHAVIOR[state][action]
+        est['sessions'] += 1
+        est['ret'] += ret
+        est['w'] += rho
+        est['w2'] += rho * rho
+        est['wret'] += rho * ret
+
+
+def _eval_file(path: str) -> Tuple[List[Dict[str, float]], Dict[str, Dict]]:
+    complete, partial = _split(scan(path))
+    estimates = [_new_estimate() for _ in _TARGETS]
+    for session in complete:
+        _evaluate_session(session, estimates)
+    return estimates, partial
+
+
+def evaluate(files: List[str], behavior, targets, gamma: float, workers: Optional[int]) -> List[Dict[str, float]]:
+    totals = [_new_estimate() for _ in targets]
+    partials = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_eval, initargs=(behavior, targets, gamma)) as pool:
+        for estimates, partial in pool.map(_eval_file, files):
+            for total, est in zip(totals, estimates):
+                for k, v in est.items():
+                    total[k] += v
+            partials.append(partial)
+    _init_eval(behavior, targets, gamma)
+    for session in _stitch(partials):
+        _evaluate_session(session, totals)
+    return totals
+
+
+def summarize(est: Dict[str, float]) -> Dict[str, float]:
+    n = est['sessions']
+    if not n:
+        return {'sessions': 0}
+    return {
+        'sessions': n,
+        'logged_return': round(est['ret'] / n, 4),
+        'is_return': round(est['wret'] / n, 4),
+        'wis_return': round(est['wret'] / est['w'], 4) if est['w'] else None,
+        'effective_sessions': round(est['w'] ** 2 / est['w2'], 1) if est['w2'] else 0.0,
+    }
+
+
+# --- CLI ---
+
+def _load_q(path: str) -> Dict[Tuple[str, str], float]:
+    saved = StateManager(path, generations=0).load_state()
+    if saved is None:
+        raise SystemExit(f"cannot read policy file {path}")
+    return {(s, a): v for s, a, v in _parse_q(saved.get('q', {}))}
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Train or evaluate the Honeygotchi agent from audit logs')
+    sub = p.add_subparsers(dest='mode', required=True)
+
+    def common(sp):
+        sp.add_argument('logs', nargs='+', help='audit.log files or directories containing them')
+        sp.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+        sp.add_argument('--discount', type=float, default=0.9, help='γ used for training')
+
+    train = sub.add_parser('train', help='write a state file learned from the logs')
+    common(train)
+    train.add_argument('-o', '--output', required=True, help='state file to write')
+    train.add_argument('--epsilon', type=float, default=0.1, help='exploration rate stored in the state file')
+
+    ev = sub.add_parser('evaluate', help='estimate engagement of policy files on the logged sessions')
+    common(ev)
+    ev.add_argument('--policy', action='append', required=True, help='state file to evaluate (repeatable)')
+    ev.add_argument('--epsilon', type=float, default=0.05, help='exploration assumed for evaluated policies')
+    ev.add_argument('--gamma', type=float, default=1.0, help='discount for the evaluated session return')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    files = discover(args.logs)
+    if not files:
+        raise SystemExit('no audit logs found')
+    model = build_model(files, args.workers)
+    print(f"{model.sessions} sessions, {sum(model.visits.values())} transitions from {len(files)} files", file=sys.stderr)
+
+    if args.mode == 'train':
+        q = model.solve(args.discount)
+        counts = {a: 0 for a in ACTIONS}
+        for (_, action), n in model.visits.items():
+            counts[action] += n
+        ok = StateManager(args.output, generations=0).save_state({
+            'q': {f"{s}|{a}": v for (s, a), v in q.items()},
+            'visits': {f"{s}|{a}": n for (s, a), n in model.visits.items()},
+            'action_counts': counts,
+            'epsilon': args.epsilon,
+            'decision_count': sum(counts.values()),
+        })
+        if not ok:
+            raise SystemExit(f"failed to write {args.output}")
+        print(f"wrote {len(q)} q-entries to {args.output}", file=sys.stderr)
+        return
+
+    targets = [greedy_policy(_load_q(path), args.epsilon) for path in args.policy]
+    results = evaluate(files, model.behavior(), targets, args.gamma, args.workers)
+    json.dump(
+        {path: summarize(est) for path, est in zip(args.policy, results)},
+        sys.stdout, indent=2,
+    )
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""Versioned Q-table checkpoints: an append-only log of full snapshots and
+deltas, thinned over time.
+
+Each line of `<dir>/policy.log` is one checkpoint. Every `full_every`-th is
+a full copy of the table; the ones in between hold only the cells whose
+value or visit count changed since the previous checkpoint, so an hourly
+history of a settled table costs a few kilobytes per entry. Reading a
+checkpoint replays at most `full_every` lines from the nearest full one.
+
+Compaction keeps the newest `keep_recent` checkpoints, one per day for
+the `keep_daily` days before them, and every labelled checkpoint (manual
+saves and rollbacks), then rewrites the log with fresh deltas. Ids never
+change, so an id from `/api/checkpoints` stays valid until it is dropped.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Cell = Tuple[str, str]
+CellValue = Tuple[float, int, float]  # value, visits, last update
+
+
+def snapshot_cells(snap) -> Dict[Cell, CellValue]:
+    """Cells of a `QSnapshot` that were ever written or visited."""
+    n = len(snap.actions)
+    cells = {}
+    for cell, (value, touched, visits, updated) in enumerate(zip(snap.values, snap.touched, snap.visits, snap.updated)):
+        if touched or visits:
+            cells[(snap.states[cell // n], snap.actions[cell % n])] = (value, visits, updated)
+    return cells
+
+
+def greedy(cells: Dict[Cell, CellValue]) -> Dict[str, str]:
+    """Best action per state (ties broken by action name)."""
+    best: Dict[str, Tuple[float, str]] = {}
+    for (state, action), (value, _, _) in cells.items():
+        cur = best.get(state)
+        if cur is None or (value, action) > cur:
+            best[state] = (value, action)
+    return {state: action for state, (_, action) in best.items()}
+
+
+class Checkpoint:
+    """One materialized checkpoint."""
+
+    __slots__ = ('id', 'time', 'label', 'meta', 'cells')
+
+    def __init__(self, id: int, time: float, label: str, meta: Dict, cells: Dict[Cell, CellValue]):
+        self.id = id
+        self.time = time
+        self.label = label
+        self.meta = meta
+        self.cells = cells
+
+    def summary(self) -> Dict:
+        return {
+            'id': self.id,
+            'time': self.time,
+            'label': self.label,
+            'engine': self.meta.get('engine'),
+            'decision_count': self.meta.get('decision_count'),
+            'cells': len(self.cells),
+        }
+
+
+class PolicyStore:
+    """Append-only checkpoint log. Thread-safe; methods do file I/O, so
+    call them off the event loop."""
+
+    def __init__(
+        self,
+        directory: str = 'data/checkpoints',
+        full_every: int = 24,
+        keep_recent: int = 48,
+        keep_daily: int = 90,
+    ):
+        self.directory = directory
+        self.path = os.path.join(directory, 'policy.log')
+        self.full_every = max(1, full_every)
+        self.keep_recent = max(1, keep_recent)
+        self.keep_daily = max(0, keep_daily)
+        self.compactions = 0
+        self._lock = threading.Lock()
+        # (id, time, label, kind, offset, cells written) per checkpoint, oldest first.
+        self._index: List[Tuple[int, float, str, str, int, int]] = []
+        self._last: Optional[Checkpoint] = None
+        self._since_full = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    # --- Log I/O ---
+
+    def _scan(self):
+        if not os.path.exists(self.path):
+            return
+        offset = 0
+        good = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # A torn final write; everything before it is intact.
+                    logger.warning("ignoring damaged checkpoint record at byte %d of %s", offset, self.path)
+                    break
+                self._index.append((rec['id'], rec['time'], rec.get('label', ''), rec['kind'], offset, len(rec['cells'])))
+                self._since_full = 0 if rec['kind'] == 'full' else self._since_full + 1
+                offset += len(line)
+                good = offset
+        if good != os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good)
+        if self._index:
+            self._last = self._materialize(len(self._index) - 1)
+            logger.info("checkpoint store: %d checkpoints in %s", len(self._index), self.path)
+
+    def _read_at(self, f, offset: int) -> Dict:
+        f.seek(offset)
+        return json.loads(f.readline())
+
+    def _materialize(self, pos: int) -> Checkpoint:
+        start = pos
+        while self._index[start][3] != 'full':
+            start -= 1
+        cells: Dict[Cell, CellValue] = {}
+        with open(self.path, 'rb') as f:
+            for i in range(start, pos + 1):
+                rec = self._read_at(f, self._index[i][4])
+                for state, action, value, visits, updated in rec['cells']:
+                    cells[(state, action)] = (value, visits, updated)
+        return Checkpoint(rec['id'], rec['time'], rec.get('label', ''), rec['meta'], cells)
+
+    @staticmethod
+    def _record(cp: Checkpoint, kind: str, cells: Iterable) -> bytes:
+        rec = {
+            'id': cp.id,
+            'time': cp.time,
+            'label': cp.label,
+            'kind': kind,
+            'meta': cp.meta,
+            'cells': [[s, a, v, n, t] for (s, a), (v, n, t) in cells],
+        }
+        return (json.dumps(rec, separators=(',', ':')) + '\n').encode()
+
+    def _encode(self, cp: Checkpoint, prev: Optional[Checkpoint], since_full: int) -> Tuple[str, bytes, int]:
+        """(kind, line, cells written). A delta cannot drop cells, so a
+        table that lost some (after a rollback) gets a full record."""
+        if prev is None or since_full + 1 >= self.full_every or prev.cells.keys() - cp.cells.keys():
+            return 'full', self._record(cp, 'full', cp.cells.items()), len(cp.cells)
+        old = prev.cells
+        changed = [(k, v) for k, v in cp.cells.items() if old.get(k) != v]
+        return 'delta', self._record(cp, 'delta', changed), len(changed)
+
+    # --- Public API ---
+
+    def append(self, snapshot: Dict, label: str = '', now: Optional[float] = None) -> int:
+        """Record an agent `snapshot()` (Q-table engines only). Returns the id."""
+        meta = {k: v for k, v in snapshot.items() if k not in ('q', 'action_counts')}
+        with self._lock:
+            cp = Checkpoint(
+                (self._index[-1][0] + 1) if self._index else 1,
+                time.time() if now is None else now,
+                label,
+                meta,
+                snapshot_cells(snapshot['q']),
+            )
+            kind, data, count = self._encode(cp, self._last, self._since_full)
+            offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            with open(self.path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._index.append((cp.id, cp.time, label, kind, offset, count))
+            self._since_full = 0 if kind == 'full' else self._since_full + 1
+            self._last = cp
+            if len(self._index) > self.keep_recent + self.keep_daily + self.full_every:
+                self._compact()
+            return cp.id
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {'id': i, 'time': t, 'label': label, 'kind': kind, 'changed_cells': n}
+                for i, t, label, kind, _, n in self._index
+            ]
+
+    def load(self, checkpoint_id: int) -> Optional[Checkpoint]:
+        with self._lock:
+            for pos, entry in enumerate(self._index):
+                if entry[0] == checkpoint_id:
+                    return self._materialize(pos)
+        return None
+
+    def diff(self, a: int, b: int, limit: int = 100) -> Optional[Dict]:
+        """Cells that differ between two checkpoints (largest change first)
+        and states whose greedy action changed."""
+        old, new = self.load(a), self.load(b)
+        if old is None or new is None:
+            return None
+        changed = []
+        for key in old.cells.keys() | new.cells.keys():
+            va = old.cells.get(key, (0.0, 0, 0.0))
+            vb = new.cells.get(key, (0.0, 0, 0.0))
+            if va[:2] != vb[:2]:
+                changed.append((key, va, vb))
+        changed.sort(key=lambda c: abs(c[2][0] - c[1][0]), reverse=True)
+        ga, gb = greedy(old.cells), greedy(new.cells)
+        return {
+            'a': old.summary(),
+            'b': new.summary(),
+            'changed_cells': len(changed),
+            'cells': [
+                {
+                    'state': s, 'action': act,
+                    'a': va[0], 'b': vb[0], 'delta': vb[0] - va[0],
+                    'visits_a': va[1], 'visits_b': vb[1],
+                }
+                for (s, act), va, vb in changed[:limit]
+            ],
+            'policy_changes': [
+                {'state': s, 'a': ga.get(s), 'b': gb.get(s)}
+                for s in sorted(ga.keys() | gb.keys())
+                if ga.get(s) != gb.get(s)
+            ],
+        }
+
+    # --- Compaction ---
+
+    def _keep(self) -> List[int]:
+        """Positions in the index that survive compaction."""
+        n = len(self._index)
+        keep = set(range(max(0, n - self.keep_recent), n))
+        days = set()
+        for pos in range(n - self.keep_recent - 1, -1, -1):
+            day = int(self._index[pos][1] // 86400)
+            if day not in days and len(days) < self.keep_daily:
+                days.add(day)
+                keep.add(pos)
+        keep.update(pos for pos, entry in enumerate(self._index) if entry[2])
+        return sorted(keep)
+
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        keep = self._keep()
+        if len(keep) == len(self._index):
+            return
+        tmp = f"{self.path}.tmp"
+        index = []
+        prev: Optional[Checkpoint] = None
+        since_full = 0
+        offset = 0
+        with open(tmp, 'wb') as out:
+            for pos in keep:
+                cp = self._materialize(pos)
+                kind, data, count = self._encode(cp, prev, since_full)
+                out.write(data)
+                index.append((cp.id, cp.time, cp.label, kind, offset, count))
+                since_full = 0 if kind == 'full' else since_full + 1
+                offset += len(data)
+                prev = cp
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, self.path)
+        dropped = len(self._index) - len(index)
+        self._index = index
+        self._since_full = since_full
+        self._last = prev
+        self.compactions += 1
+        logger.info("compacted checkpoint store: dropped %d, kept %d", dropped, len(index))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'checkpoints': len(self._index),
+                'latest': self._index[-1][0] if self._index else None,
+                'bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+                'compactions': self.compactions,
+            }
+
+
+def build_policy_store(config, agent) -> Optional[PolicyStore]:
+    if not config.get('checkpoints.enabled', True):
+        return None
+    if agent.q is None:
+        logger.info("policy checkpoints disabled: the %s engine has no Q-table", agent.engine)
+        return None
+    return PolicyStore(
+        config.get('checkpoints.dir', 'data/checkpoints'),
+        full_every=config.get('checkpoints.full_every', 24),
+        keep_recent=config.get('checkpoints.keep_recent', 48),
+        keep_daily=config.get('checkpoints.keep_daily', 90),
+    )
@@ -0,0 +1,104 @@
+"""Prometheus text exposition (format 0.0.4) for `/metrics`.
+
+Rendering works on `StatsRegistry.exposition_snapshot()`, so the registry
+is held (or locked, in thread-safe mode) only while numbers are copied,
+never while text is built.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Labels, extra: str = '') -> str:
+    parts = [f'{k}="{_escape(str(v))}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _num(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Writer:
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.lines: List[str] = []
+
+    def _head(self, name: str, kind: str, help_text: str) -> str:
+        full = f"{self.prefix}_{name}"
+        self.lines.append(f"# HELP {full} {help_text}")
+        self.lines.append(f"# TYPE {full} {kind}")
+        return full
+
+    def scalar(self, name: str, kind: str, help_text: str, samples: Iterable[Tuple[Labels, float]]):
+        full = self._head(name, kind, help_text)
+        for labels, value in samples:
+            self.lines.append(f"{full}{_labels(labels)} {_num(value)}")
+
+    def histogram(self, name: str, help_text: str, samples: Iterable[Tuple[Labels, Any]]):
+        full = self._head(name, 'histogram', help_text)
+        for labels, hist in samples:
+            cumulative = 0
+            for bound, count in zip(hist.bounds, hist.counts):
+                cumulative += count
+                le = 'le="%s"' % _num(bound)
+                self.lines.append(f"{full}_bucket{_labels(labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            self.lines.append(f"{full}_bucket{_labels(labels, le)} {hist.count}")
+            self.lines.append(f"{full}_sum{_labels(labels)} {_num(hist.sum)}")
+            self.lines.append(f"{full}_count{_labels(labels)} {hist.count}")
+
+    def text(self) -> str:
+        return '\n'.join(self.lines) + '\n'
+
+
+def render(snapshot: Dict[str, Any], agent: Optional[Dict[str, Any]] = None, prefix: str = 'honeygotchi') -> str:
+    w = _Writer(prefix)
+    w.scalar('uptime_seconds', 'gauge', 'Seconds since the process started.', [((), snapshot['uptime_seconds'])])
+    w.scalar('sessions_total', 'counter', 'SSH sessions opened.', [((), snapshot['sessions_total'])])
+    w.scalar('active_sessions', 'gauge', 'SSH sessions currently open.', [((), snapshot['active_sessions'])])
+    w.scalar('login_attempts_total', 'counter', 'Authentication attempts (all accepted).', [((), snapshot['login_attempts'])])
+    w.scalar('commands_total', 'counter', 'Commands received.', [((), snapshot['commands_total'])])
+    w.scalar('malicious_commands_total', 'counter', 'Commands matching a malicious pattern.', [((), snapshot['malicious_total'])])
+    w.scalar(
+        'actions_total', 'counter', 'Agent decisions by action.',
+        [((('action', a),), n) for a, n in sorted(snapshot['actions'].items())],
+    )
+    w.scalar(
+        'patterns_total', 'counter', 'Malicious commands by pattern.',
+        [((('pattern', p),), n) for p, n in sorted(snapshot['patterns'].items())],
+    )
+    w.histogram('session_duration_seconds', 'Session length.', [((), snapshot['session_duration'])])
+    w.histogram('session_commands', 'Commands per session.', [((), snapshot['session_commands'])])
+    w.histogram('handshake_seconds', 'TCP connect to completed SSH authentication.', [((), snapshot['handshake'])])
+    w.histogram('decision_seconds', 'Agent learning and action selection per command.', [((), snapshot['decision'])])
+    costs = sorted(snapshot['command_costs'].items())
+    w.histogram('command_cpu_seconds', 'Handler CPU time per command.', [((('command', n),), c[0]) for n, c in costs])
+    w.histogram('command_wall_seconds', 'Handler wall time per command, DELAY and download waits excluded.', [((('command', n),), c[1]) for n, c in costs])
+    w.histogram('command_output_bytes', 'Output size per command.', [((('command', n),), c[2]) for n, c in costs])
+    w.scalar(
+        'unique_estimate', 'gauge', 'Distinct values seen (HyperLogLog estimate).',
+        [((('kind', k),), n) for k, n in sorted(snapshot['unique'].items())],
+    )
+    stream = snapshot['stream']
+    w.scalar('stream_subscribers', 'gauge', 'Connected live-stream readers.', [((), stream['subscribers'])])
+    w.scalar('stream_events_total', 'counter', 'Events published to the live stream.', [((), stream['published'])])
+    w.scalar('stream_dropped_total', 'counter', 'Live-stream events skipped by readers that fell behind.', [((), stream['dropped'])])
+    if agent:
+        engine = (('engine', agent.get('engine', '')),)
+        w.scalar('agent_decisions_total', 'counter', 'Decisions made by the agent.', [(engine, agent.get('decision_count', 0))])
+        w.scalar('agent_states', 'gauge', 'States the agent has values for.', [(engine, agent.get('q_size', 0))])
+        if 'epsilon' in agent:
+            w.scalar('agent_epsilon', 'gauge', 'Current global exploration rate.', [(engine, agent['epsilon'])])
+        if 'replay_size' in agent:
+            w.scalar('agent_replay_size', 'gauge', 'Transitions in the replay buffer.', [(engine, agent['replay_size'])])
+    return w.text()
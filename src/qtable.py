@@ -0,0 +1,338 @@
+"""Dense Q-value storage for the tabular agents.
+
+States are interned to small integer ids and Q-values live in one flat
+float64 buffer (`numpy` when installed, the stdlib `array` module
+otherwise), row-major by state, with parallel buffers of per-cell visit
+counts (online TD updates applied; replay does not count) and last-update
+times. Single decisions read a row as a short Python list; the batch paths
+(TD updates over many transitions, snapshots) run vectorized when NumPy is
+present.
+"""
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without numpy
+    np = None
+
+
+class QTable:
+    """Q(s, a) over interned states and a fixed action tuple.
+
+    Also behaves like the old `Dict[(state, action), float]` for reads and
+    writes (`q[(s, a)]`, `q.get`, `q.items()`, `len(q)`), so code that treated
+    `agent.q` as a mapping keeps working. Only cells that were ever written
+    count as present, matching the sparse dict it replaces.
+
+    `version` increases on every change, so readers can cache anything
+    derived from the table until it moves.
+    """
+
+    def __init__(self, actions: Sequence[str], capacity: int = 64):
+        self.actions = tuple(actions)
+        self.n_actions = len(self.actions)
+        self.action_index: Dict[str, int] = {a: i for i, a in enumerate(self.actions)}
+        self.states: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._capacity = 0
+        self._values = self._alloc_values(0)
+        self._visits = self._alloc_visits(0)
+        self._updated = self._alloc_values(0)
+        self._touched = bytearray()
+        self._size = 0
+        self.version = 0
+        self._grow(max(1, capacity))
+
+    # --- Storage ---
+
+    def _alloc_values(self, n: int):
+        if np is not None:
+            return np.zeros(n, dtype=np.float64)
+        return array('d', bytes(8 * n))
+
+    def _alloc_visits(self, n: int):
+        if np is not None:
+            return np.zeros(n, dtype=np.int64)
+        return array('q', bytes(8 * n))
+
+    def _grow(self, capacity: int):
+        cells = capacity * self.n_actions
+        values = self._alloc_values(cells)
+        used = self._capacity * self.n_actions
+        values[:used] = self._values[:used]
+        self._values = values
+        visits = self._alloc_visits(cells)
+        visits[:used] = self._visits[:used]
+        self._visits = visits
+        updated = self._alloc_values(cells)
+        updated[:used] = self._updated[:used]
+        self._updated = updated
+        self._touched.extend(bytes(cells - len(self._touched)))
+        self._capacity = capacity
+
+    def intern(self, state: str) -> int:
+        sid = self._ids.get(state)
+        if sid is None:
+            sid = len(self.states)
+            if sid >= self._capacity:
+                self._grow(self._capacity * 2)
+            self._ids[state] = sid
+            self.states.append(state)
+            self.version += 1
+        return sid
+
+    def state_id(self, state: str) -> Optional[int]:
+        return self._ids.get(state)
+
+    # --- Per-decision access ---
+
+    def row(self, sid: int) -> List[float]:
+        base = sid * self.n_actions
+        return self._values[base:base + self.n_actions].tolist()
+
+    def value(self, sid: int, aid: int) -> float:
+        return float(self._values[sid * self.n_actions + aid])
+
+    def max_value(self, sid: int) -> float:
+        return max(self.row(sid))
+
+    def set(self, sid: int, aid: int, value: float):
+        cell = sid * self.n_actions + aid
+        self._values[cell] = value
+        self.version += 1
+        if not self._touched[cell]:
+            self._touched[cell] = 1
+            self._size += 1
+
+    def visits(self, sid: int, aid: int) -> int:
+        return int(self._visits[sid * self.n_actions + aid])
+
+    def row_visits(self, sid: int) -> List[int]:
+        base = sid * self.n_actions
+        return self._visits[base:base + self.n_actions].tolist()
+
+    def updated(self, sid: int, aid: int) -> float:
+        """Time of the cell's last TD update (0.0 if never or unknown)."""
+        return float(self._updated[sid * self.n_actions + aid])
+
+    def td_update(self, sid: int, aid: int, target: float, alpha: float, now: float = 0.0) -> float:
+        current = self.value(sid, aid)
+        updated = current + alpha * (target - current)
+        self.set(sid, aid, updated)
+        cell = sid * self.n_actions + aid
+        self._visits[cell] += 1
+        self._updated[cell] = now
+        return updated
+
+    # --- Batch access ---
+
+    def batch_update(
+        self,
+        sids: Sequence[int],
+        aids: Sequence[int],
+        rewards: Sequence[float],
+        next_sids: Sequence[int],
+        alpha: Union[float, Sequence[float]],
+        gamma: float,
+        weights: Optional[Sequence[float]] = None,
+    ) -> List[float]:
+        """One TD(0) sweep over a batch of transitions. `next_sids[i] < 0`
+        marks a terminal transition, `alpha` is one step size or one per
+        sample, and `weights` scales each sample's step
+        (importance-sampling correction for prioritized replay). All targets
+        are computed against the table as it was before the batch, and a
+        cell sampled several times moves by the mean of its steps (summing
+        them would scale the step with the duplicate count and diverge).
+        Visit counts and update times are left alone: they count real
+        experience, and exploration and step sizes are driven by them.
+        Returns the per-sample TD errors."""
+        if not len(sids):
+            return []
+        n = self.n_actions
+        if np is not None:
+            s = np.asarray(sids, dtype=np.int64)
+            a = np.asarray(aids, dtype=np.int64)
+            r = np.asarray(rewards, dtype=np.float64)
+            nxt = np.asarray(next_sids, dtype=np.int64)
+            table = self._values[:self._capacity * n].reshape(self._capacity, n)
+            live = nxt >= 0
+            future = np.zeros(len(s), dtype=np.float64)
+            future[live] = table[nxt[live]].max(axis=1)
+            cells = s * n + a
+            errors = r + gamma * future - self._values[cells]
+            step = np.asarray(alpha, dtype=np.float64) * errors
+            if weights is not None:
+                step *= np.asarray(weights, dtype=np.float64)
+            uniq, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+            self._values[uniq] += np.bincount(inverse, weights=step) / counts
+            cells = cells.tolist()
+            errors = errors.tolist()
+        else:
+            futures = [self.max_value(x) if x >= 0 else 0.0 for x in next_sids]
+            cells = [s * n + a for s, a in zip(sids, aids)]
+            errors = [
+                r + gamma * f - self._values[c]
+                for c, r, f in zip(cells, rewards, futures)
+            ]
+            scale = weights if weights is not None else [1.0] * len(cells)
+            alphas = [alpha] * len(cells) if isinstance(alpha, (int, float)) else alpha
+            steps: Dict[int, List[float]] = {}
+            for c, e, w, a in zip(cells, errors, scale, alphas):
+                steps.setdefault(c, []).append(a * w * e)
+            for c, cell_steps in steps.items():
+                self._values[c] += sum(cell_steps) / len(cell_steps)
+        for c in cells:
+            if not self._touched[c]:
+                self._touched[c] = 1
+                self._size += 1
+        self.version += 1
+        return errors
+
+    def rows(self) -> List[List[float]]:
+        """All interned rows, in state-id order."""
+        n = self.n_actions
+        used = len(self.states) * n
+        if np is not None:
+            return self._values[:used].reshape(len(self.states), n).tolist()
+        flat = self._values[:used].tolist()
+        return [flat[i:i + n] for i in range(0, used, n)]
+
+    def cells(self) -> Iterator[Tuple[str, str, float]]:
+        """(state, action, value) for every cell ever written."""
+        n = self.n_actions
+        touched = self._touched
+        for sid, values in enumerate(self.rows()):
+            base = sid * n
+            for aid, v in enumerate(values):
+                if touched[base + aid]:
+                    yield self.states[sid], self.actions[aid], v
+
+    def snapshot(self) -> 'QSnapshot':
+        """Point-in-time copy that can be walked from another thread while
+        this table keeps learning."""
+        used = len(self.states) * self.n_actions
+        return QSnapshot(
+            self.actions,
+            list(self.states),
+            self._values[:used].tolist(),
+            bytes(self._touched[:used]),
+            self._visits[:used].tolist(),
+            self._updated[:used].tolist(),
+        )
+
+    def load(self, entries: Iterable[Tuple[str, str, float]]):
+        for state, action, value in entries:
+            aid = self.action_index.get(action)
+            if aid is not None:
+                self.set(self.intern(state), aid, float(value))
+
+    def load_visits(self, entries: Iterable[Tuple[str, str, int]]):
+        for state, action, count in entries:
+            aid = self.action_index.get(action)
+            if aid is not None:
+                self._visits[self.intern(state) * self.n_actions + aid] = int(count)
+        self.version += 1
+
+    def load_updated(self, entries: Iterable[Tuple[str, str, float]]):
+        for state, action, ts in entries:
+            aid = self.action_index.get(action)
+            if aid is not None:
+                self._updated[self.intern(state) * self.n_actions + aid] = float(ts)
+        self.version += 1
+
+    def clear(self):
+        self.states.clear()
+        self._ids.clear()
+        self._capacity = 0
+        self._values = self._alloc_values(0)
+        self._visits = self._alloc_visits(0)
+        self._updated = self._alloc_values(0)
+        self._touched = bytearray()
+        self._size = 0
+        self.version += 1
+        self._grow(64)
+
+    # --- Mapping compatibility ---
+
+    def _cell(self, key: Tuple[str, str]) -> Optional[int]:
+        state, action = key
+        sid = self._ids.get(state)
+        aid = self.action_index.get(action)
+        if sid is None or aid is None:
+            return None
+        return sid * self.n_actions + aid
+
+    def get(self, key: Tuple[str, str], default: Optional[float] = None) -> Optional[float]:
+        cell = self._cell(key)
+        if cell is None or not self._touched[cell]:
+            return default
+        return float(self._values[cell])
+
+    def __getitem__(self, key: Tuple[str, str]) -> float:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Tuple[str, str], value: float):
+        state, action = key
+        self.set(self.intern(state), self.action_index[action], float(value))
+
+    def __contains__(self, key) -> bool:
+        cell = self._cell(key)
+        return cell is not None and bool(self._touched[cell])
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        for state, action, _ in self.cells():
+            yield state, action
+
+    def items(self) -> Iterator[Tuple[Tuple[str, str], float]]:
+        for state, action, value in self.cells():
+            yield (state, action), value
+
+
+class QSnapshot:
+    """Frozen copy of a QTable's cells (see `QTable.snapshot`)."""
+
+    __slots__ = ('actions', 'states', 'values', 'touched', 'visits', 'updated')
+
+    def __init__(
+        self,
+        actions: Tuple[str, ...],
+        states: List[str],
+        values: List[float],
+        touched: bytes,
+        visits: List[int],
+        updated: List[float],
+    ):
+        self.actions = actions
+        self.states = states
+        self.values = values
+        self.touched = touched
+        self.visits = visits
+        self.updated = updated
+
+    def cells(self) -> Iterator[Tuple[str, str, float]]:
+        n = len(self.actions)
+        for cell, flag in enumerate(self.touched):
+            if flag:
+                yield self.states[cell // n], self.actions[cell % n], self.values[cell]
+
+    def visit_counts(self) -> Iterator[Tuple[str, str, int]]:
+        n = len(self.actions)
+        for cell, count in enumerate(self.visits):
+            if count:
+                yield self.states[cell // n], self.actions[cell % n], count
+
+    def update_times(self) -> Iterator[Tuple[str, str, float]]:
+        n = len(self.actions)
+        for cell, ts in enumerate(self.updated):
+            if ts:
+                yield self.states[cell // n], self.actions[cell % n], ts
+
+    def __len__(self) -> int:
+        return sum(self.touched)
@@ -0,0 +1,403 @@
+"""Experience replay for the Q-learning agent.
+
+Transitions land in a fixed-size ring of typed columns (NumPy arrays when
+installed, the stdlib `array` module otherwise), so recording one is a handful
+of scalar stores. A `ReplayLearner` task samples prioritized minibatches from
+the ring at a fixed rate and applies them through `QTable.batch_update`.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only without numpy
+    np = None
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'HGREPLAY1\n'
+
+# name -> (array typecode, numpy dtype)
+_COLUMNS = (
+    ('state', 'i', 'int32'),
+    ('action', 'b', 'int8'),
+    ('reward', 'f', 'float32'),
+    ('next_state', 'i', 'int32'),
+    ('priority', 'f', 'float32'),
+)
+
+
+def _alloc(typecode: str, dtype: str, n: int):
+    if np is not None:
+        return np.zeros(n, dtype=dtype)
+    return array(typecode, bytes(array(typecode).itemsize * n))
+
+
+class _SumTree:
+    """Binary tree of partial sums over `capacity` leaf weights: set a leaf
+    and draw a leaf in proportion to its weight, both in O(log n). Stands in
+    for NumPy's vectorized sampling when it is not installed."""
+
+    def __init__(self, capacity: int):
+        size = 1
+        while size < capacity:
+            size *= 2
+        self.size = size
+        self.nodes = array('d', bytes(16 * size))
+
+    @property
+    def total(self) -> float:
+        return self.nodes[1]
+
+    def get(self, i: int) -> float:
+        return self.nodes[self.size + i]
+
+    def set(self, i: int, value: float):
+        nodes = self.nodes
+        j = self.size + i
+        nodes[j] = value
+        j >>= 1
+        while j:
+            # Re-add the children rather than apply a delta, so rounding
+            # errors do not accumulate over millions of updates.
+            nodes[j] = nodes[2 * j] + nodes[2 * j + 1]
+            j >>= 1
+
+    def fill(self, values):
+        """Replace all leaves with `values` (the rest are zeroed)."""
+        nodes, size = self.nodes, self.size
+        for j in range(1, 2 * size):
+            nodes[j] = 0.0
+        for i, v in enumerate(values):
+            nodes[size + i] = v
+        for j in range(size - 1, 0, -1):
+            nodes[j] = nodes[2 * j] + nodes[2 * j + 1]
+
+    def find(self, u: float) -> int:
+        """The leaf whose cumulative weight range holds `u` in [0, total)."""
+        nodes, size = self.nodes, self.size
+        j = 1
+        while j < size:
+            left = nodes[2 * j]
+            # An empty right subtree can only be reached through rounding.
+            if u < left or not nodes[2 * j + 1]:
+                j = 2 * j
+            else:
+                u -= left
+                j = 2 * j + 1
+        return j - size
+
+
+class ReplayBuffer:
+    """Bounded ring of (state, action, reward, next_state) transitions.
+
+    States are interned into the buffer's own string table, independent of
+    the Q-table's ids, so the buffer survives a Q-table reload. A
+    `next_state` of -1 marks a terminal transition. New transitions get the
+    highest priority seen so far, so everything is replayed at least once
+    before priorities take over. Without NumPy, priority^alpha is kept in a
+    sum tree so a sample costs O(batch · log n) rather than a pass over the
+    buffer.
+    """
+
+    def __init__(self, actions, capacity: int = 50000, eps: float = 0.01):
+        self.actions = tuple(actions)
+        self.action_index = {a: i for i, a in enumerate(self.actions)}
+        self.capacity = max(1, capacity)
+        self.eps = eps
+        self.states: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self.size = 0
+        self.pos = 0
+        self.appended = 0
+        self.max_priority = 1.0
+        self._cols = {name: _alloc(code, dtype, self.capacity) for name, code, dtype in _COLUMNS}
+        self._tree = _SumTree(self.capacity) if np is None else None
+        # The alpha the tree's weights were raised to; None until the first
+        # sample (or after a reload), which rebuilds it.
+        self._tree_alpha: Optional[float] = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _intern(self, state: str) -> int:
+        sid = self._ids.get(state)
+        if sid is None:
+            sid = self._ids[state] = len(self.states)
+            self.states.append(state)
+        return sid
+
+    def append(self, state: str, action: str, reward: float, next_state: Optional[str]):
+        i = self.pos
+        cols = self._cols
+        cols['state'][i] = self._intern(state)
+        cols['action'][i] = self.action_index[action]
+        cols['reward'][i] = reward
+        cols['next_state'][i] = -1 if next_state is None else self._intern(next_state)
+        cols['priority'][i] = self.max_priority
+        if self._tree_alpha is not None:
+            self._tree.set(i, self.max_priority ** self._tree_alpha)
+        self.pos = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+        self.appended += 1
+
+    def sample(self, batch_size: int, alpha: float, beta: float, rng: random.Random):
+        """Prioritized sample, P(i) ∝ priority_i^alpha. Returns
+        (indices, states, actions, rewards, next_states, weights) where
+        weights are the normalized importance-sampling corrections."""
+        n = self.size
+        cols = self._cols
+        if np is not None:
+            probs = cols['priority'][:n].astype(np.float64) ** alpha
+            probs /= probs.sum()
+            idx = np.random.default_rng(rng.getrandbits(64)).choice(n, size=batch_size, p=probs)
+            weights = (n * probs[idx]) ** -beta
+            weights /= weights.max()
+            # Ids as Python ints: int8 actions would overflow in Q-table
+            # index arithmetic (sid * n_actions + aid).
+            return (
+                idx,
+                cols['state'][idx].tolist(),
+                cols['action'][idx].tolist(),
+                cols['reward'][idx],
+                cols['next_state'][idx].tolist(),
+                weights,
+            )
+        tree = self._tree
+        if alpha != self._tree_alpha:
+            tree.fill(p ** alpha for p in cols['priority'][:n])
+            self._tree_alpha = alpha
+        total = tree.total
+        idx = [tree.find(rng.random() * total) for _ in range(batch_size)]
+        weights = [(n * tree.get(i) / total) ** -beta for i in idx]
+        top = max(weights)
+        return (
+            idx,
+            [cols['state'][i] for i in idx],
+            [cols['action'][i] for i in idx],
+            [cols['reward'][i] for i in idx],
+            [cols['next_state'][i] for i in idx],
+            [w / top for w in weights],
+        )
+
+    def update_priorities(self, idx, td_errors):
+        col = self._cols['priority']
+        tree_alpha = self._tree_alpha
+        for i, err in zip(idx, td_errors):
+            p = abs(err) + self.eps
+            col[i] = p
+            if tree_alpha is not None:
+                self._tree.set(i, p ** tree_alpha)
+            if p > self.max_priority:
+                self.max_priority = p
+
+    def clear(self):
+        self.states.clear()
+        self._ids.clear()
+        self.size = self.pos = 0
+        self.max_priority = 1.0
+        self._tree_alpha = None
+
+    # --- Persistence ---
+
+    def snapshot(self) -> Tuple[Dict, List[bytes]]:
+        """Header and raw column bytes, cheap enough to take on the loop and
+        write from a worker thread with `write_snapshot`."""
+        header = {
+            'actions': list(self.actions),
+            'capacity': self.capacity,
+            'size': self.size,
+            'pos': self.pos,
+            'max_priority': self.max_priority,
+            'states': list(self.states),
+        }
+        return header, [self._cols[name][:self.size].tobytes() for name, _, _ in _COLUMNS]
+
+    def load(self, path: str) -> bool:
+        """Restore from `write_snapshot` output. Transitions recorded with a
+        different action set are dropped; a smaller capacity keeps the newest
+        ones."""
+        try:
+            with open(path, 'rb') as f:
+                if f.readline() != _MAGIC:
+                    raise ValueError('not a replay file')
+                header = json.loads(f.readline())
+                raw = [f.read(header['size'] * array(code).itemsize) for _, code, _ in _COLUMNS]
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning("ignoring unreadable replay buffer %s: %s", path, e)
+            return False
+        if tuple(header['actions']) != self.actions:
+            logger.warning("replay buffer %s was recorded with other actions, ignoring", path)
+            return False
+        columns = []
+        for (name, code, _), data in zip(_COLUMNS, raw):
+            col = array(code)
+            col.frombytes(data)
+            columns.append(col)
+        # Stored oldest-first starting at `pos` once the ring has wrapped.
+        size, pos = header['size'], header['pos']
+        order = list(range(pos, size)) + list(range(pos)) if size == header['capacity'] else list(range(size))
+        order = order[-self.capacity:]
+        self.clear()
+        self.states.extend(header['states'])
+        self._ids.update((s, i) for i, s in enumerate(self.states))
+        for i, src in enumerate(order):
+            for (name, _, _), col in zip(_COLUMNS, columns):
+                self._cols[name][i] = col[src]
+        self.size = len(order)
+        self.pos = self.size % self.capacity
+        self.max_priority = header.get('max_priority', 1.0)
+        logger.info("restored %d replay transitions from %s", self.size, path)
+        return True
+
+
+def write_snapshot(path: str, snapshot: Tuple[Dict, List[bytes]]) -> bool:
+    header, columns = snapshot
+    tmp = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(tmp, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(json.dumps(header, separators=(',', ':')).encode() + b'\n')
+            for data in columns:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return True
+    except Exception as e:
+        logger.error("failed to save replay buffer: %s", e)
+        return False
+
+
+class ReplayLearner:
+    """Replays prioritized minibatches into the agent's Q-table at a fixed
+    rate. Runs as a task on the event loop: each step is one vectorized
+    batch update, so it never holds the loop for long."""
+
+    def __init__(
+        self,
+        agent,
+        buffer: ReplayBuffer,
+        batch_size: int = 32,
+        updates_per_second: float = 10.0,
+        priority_alpha: float = 0.6,
+        priority_beta: float = 0.4,
+        path: Optional[str] = None,
+    ):
+        self.agent = agent
+        self.buffer = buffer
+        self.batch_size = max(1, batch_size)
+        self.interval = 1.0 / max(0.01, updates_per_second)
+        self.priority_alpha = priority_alpha
+        self.priority_beta = priority_beta
+        self.path = path
+        self.updates = 0
+        self.last_update: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._qsids: List[int] = []
+
+    async def start(self):
+        if self.path:
+            await asyncio.to_thread(self.buffer.load, self.path)
+        self.agent.replay = self.buffer
+        self._task = asyncio.create_task(self._run(), name='replay-learner')
+
+    async def stop(self, save: bool = True):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.agent.replay = None
+        if save:
+            await self.save()
+
+    async def save(self) -> bool:
+        if not self.path:
+            return False
+        return await asyncio.to_thread(write_snapshot, self.path, self.buffer.snapshot())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.step()
+            except Exception:
+                logger.exception("replay step failed")
+
+    def _map_states(self, buffer_sids) -> List[int]:
+        # Buffer state ids -> Q-table state ids, extended as the buffer grows.
+        q, states, qsids = self.agent.q, self.buffer.states, self._qsids
+        if len(qsids) < len(states):
+            qsids.extend(q.intern(s) for s in states[len(qsids):])
+        return [qsids[s] if s >= 0 else -1 for s in buffer_sids]
+
+    def step(self) -> bool:
+        if len(self.buffer) < self.batch_size:
+            return False
+        idx, states, actions, rewards, next_states, weights = self.buffer.sample(
+            self.batch_size, self.priority_alpha, self.priority_beta, self.agent.rng,
+        )
+        agent = self.agent
+        sids = self._map_states(states)
+        # Replays do not count as visits, so a rarely visited cell would be
+        # replayed over and over at the schedule's large early steps and end
+        # up at whichever sample came last. Cap the step at learning_rate;
+        # well-visited cells still settle with the schedule.
+        alpha, step = agent.alpha, agent._alpha
+        errors = agent.q.batch_update(
+            sids,
+            actions,
+            rewards,
+            self._map_states(next_states),
+            [min(alpha, step(agent.q.visits(s, a))) for s, a in zip(sids, actions)],
+            agent.gamma,
+            weights=weights,
+        )
+        self.buffer.update_priorities(idx, errors)
+        self.updates += 1
+        self.last_update = time.time()
+        return True
+
+    def reset(self):
+        """Forget cached Q-table ids after the agent's table was reloaded."""
+        self._qsids.clear()
+
+    def stats(self) -> Dict:
+        return {
+            'size': len(self.buffer),
+            'capacity': self.buffer.capacity,
+            'appended': self.buffer.appended,
+            'updates': self.updates,
+            'last_update': self.last_update,
+        }
+
+
+def build_replay(config, agent) -> Optional[ReplayLearner]:
+    if not config.get('replay.enabled', True):
+        return None
+    if not agent.replayable:
+        logger.info("replay disabled: not supported by the %s engine", agent.engine)
+        return None
+    buffer = ReplayBuffer(agent.q.actions, capacity=config.get('replay.capacity', 50000))
+    return ReplayLearner(
+        agent,
+        buffer,
+        batch_size=config.get('replay.batch_size', 32),
+        updates_per_second=config.get('replay.updates_per_second', 10),
+        priority_alpha=config.get('replay.priority_alpha', 0.6),
+        priority_beta=config.get('replay.priority_beta', 0.4),
+        path=config.get('replay.file', 'data/rl_replay.bin'),
+    )
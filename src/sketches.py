@@ -0,0 +1,202 @@
+"""Fixed-memory stream summaries for the stats registry.
+
+`SpaceSaving` keeps the top-k keys of an unbounded stream in k counters
+(Metwally et al.): a new key evicts the current minimum and inherits its
+count, recorded as that entry's maximum overestimate. Any key seen more
+than N/k times is guaranteed to be present. `HyperLogLog` estimates
+distinct counts in 2^p bytes with about 1.04/sqrt(2^p) relative error
+(0.8% at the default p=14).
+
+Both round-trip through `to_dict`/`from_dict` so `SketchPersister` can
+carry them across restarts.
+"""
+import asyncio
+import base64
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SpaceSaving:
+    """Top-k heavy hitters. `add` is O(1) for tracked keys and amortized
+    O(log k) when a new key evicts the minimum."""
+
+    __slots__ = ('k', 'counts', 'errors', 'total', '_heap')
+
+    def __init__(self, k: int = 1000):
+        self.k = max(1, k)
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.total = 0
+        # (count, key) with lazily refreshed counts; the true minimum is
+        # found by re-pushing stale entries at eviction time.
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, key: str, n: int = 1):
+        self.total += n
+        counts = self.counts
+        if key in counts:
+            counts[key] += n
+            return
+        if len(counts) < self.k:
+            counts[key] = n
+            self.errors[key] = 0
+            heapq.heappush(self._heap, (n, key))
+            return
+        heap = self._heap
+        while True:
+            count, victim = heap[0]
+            actual = counts[victim]
+            if actual == count:
+                break
+            heapq.heapreplace(heap, (actual, victim))
+        del counts[victim]
+        del self.errors[victim]
+        counts[key] = count + n
+        self.errors[key] = count
+        heapq.heapreplace(heap, (count + n, key))
+
+    def most_common(self, n: int = 10) -> List[Tuple[str, int]]:
+        return heapq.nlargest(n, self.counts.items(), key=lambda kv: kv[1])
+
+    def top(self, n: int = 10) -> List[Dict]:
+        """Like `most_common`, with each count's maximum overestimate."""
+        return [
+            {'key': key, 'count': count, 'error': self.errors[key]}
+            for key, count in self.most_common(n)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def to_dict(self) -> Dict:
+        return {
+            'k': self.k,
+            'total': self.total,
+            'items': [[key, count, self.errors[key]] for key, count in self.counts.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, k: Optional[int] = None) -> 'SpaceSaving':
+        sketch = cls(k or data.get('k', 1000))
+        items = sorted(data.get('items', []), key=lambda item: item[1], reverse=True)[:sketch.k]
+        for key, count, error in items:
+            sketch.counts[key] = count
+            sketch.errors[key] = error
+        sketch._heap = [(count, key) for key, count in sketch.counts.items()]
+        heapq.heapify(sketch._heap)
+        sketch.total = data.get('total', sum(sketch.counts.values()))
+        return sketch
+
+
+class HyperLogLog:
+    """Distinct-count estimator over 2^p one-byte registers."""
+
+    __slots__ = ('p', 'm', 'registers', '_alpha', '_count')
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+        self._alpha = 0.7213 / (1 + 1.079 / self.m)
+        # Cached estimate; most adds of a busy stream change no register.
+        self._count: Optional[int] = None
+
+    def add(self, key: str):
+        # A stable 64-bit hash so persisted registers stay valid across
+        # processes (built-in hash() is salted per process).
+        h = int.from_bytes(hashlib.blake2b(key.encode('utf-8', 'replace'), digest_size=8).digest(), 'little')
+        idx = h & (self.m - 1)
+        rest = h >> self.p
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+            self._count = None
+
+    def count(self) -> int:
+        if self._count is not None:
+            return self._count
+        m = self.m
+        estimate = self._alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        self._count = int(round(estimate))
+        return self._count
+
+    def to_dict(self) -> Dict:
+        return {'p': self.p, 'registers': base64.b64encode(self.registers).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'HyperLogLog':
+        hll = cls(data.get('p', 14))
+        registers = base64.b64decode(data['registers'])
+        if len(registers) == hll.m:
+            hll.registers = bytearray(registers)
+        return hll
+
+
+class SketchPersister:
+    """Writes the registry's sketches to `path` every `interval` seconds
+    and on stop; loads them on start."""
+
+    def __init__(self, registry, path: str = 'data/stats_sketches.json', interval: float = 300.0):
+        self.registry = registry
+        self.path = path
+        self.interval = max(1.0, interval)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        data = await asyncio.to_thread(self._read)
+        if data:
+            self.registry.load_sketches(data)
+            logger.info("restored stats sketches from %s", self.path)
+        self._task = asyncio.create_task(self._run(), name='sketch-persister')
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.save()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save()
+
+    async def save(self) -> bool:
+        return await asyncio.to_thread(self._write, self.registry.dump_sketches())
+
+    def _read(self) -> Optional[Dict]:
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("ignoring unreadable sketch file %s: %s", self.path, e)
+            return None
+
+    def _write(self, data: Dict) -> bool:
+        tmp = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            return True
+        except OSError as e:
+            logger.error("failed to save stats sketches: %s", e)
+            return False
@@ -10,7 +10,7 @@ from typing import Optional
 import asyncssh
 
 from .agent import QLearningAgent, SessionTracker, classify, phase_of
-from .commands import CommandProcessor
+from .commands import CommandLimits, CommandProcessor
 from .fakefs import FakeFileSystem
 from .metrics import STATS
 
@@ -75,10 +75,19 @@ class SessionRunner:
     command loop. The RL agent is shared across all sessions; this object feeds
     it decisions and reward signals."""
 
-    def __init__(self, agent: QLearningAgent, audit_logger: logging.Logger, seed_salt: str = ''):
+    def __init__(
+        self,
+        agent: QLearningAgent,
+        audit_logger: logging.Logger,
+        seed_salt: str = '',
+        capture=None,
+        limits: Optional[CommandLimits] = None,
+    ):
         self.agent = agent
         self.audit = audit_logger
         self.seed_salt = seed_salt
+        self.capture = capture
+        self.limits = limits
 
     async def run(self, process: asyncssh.SSHServerProcess):
         channel = process.channel
@@ -90,8 +99,14 @@ class SessionRunner:
         session_seed = f"{self.seed_salt}:{client_ip}:{session_id}"
         hostname = f"srv-{abs(hash(session_seed)) % 9000 + 1000:04d}"
         fs = FakeFileSystem(seed=session_seed, hostname=hostname)
-        processor = CommandProcessor(fs, hostname, username, rng=random.Random(session_seed))
-        tracker = SessionTracker()
+        processor = CommandProcessor(
+            fs, hostname, username, rng=random.Random(session_seed),
+            capture=self.capture, limits=self.limits,
+        )
+        tracker = SessionTracker(
+            client_ip=client_ip,
+            client_version=(channel.get_extra_info('client_version') if channel else None) or '',
+        )
 
         has_pty = process.get_terminal_type() is not None
         stdin, stdout = process.stdin, process.stdout
@@ -132,7 +147,7 @@ class SessionRunner:
                 'command_count': tracker.command_count,
                 'timestamp': datetime.now().isoformat(),
             }))
-            self.agent.save_state()
+            self.agent.request_save()
             try:
                 process.exit(0)
             except Exception:
@@ -160,10 +175,12 @@ class SessionRunner:
             is_malicious = pattern != 'none'
             next_state = f"{pattern}|{phase_of(tracker.command_count)}"
 
+            started = time.perf_counter()
             if tracker.pending:
                 self.agent.observe_next_command(tracker.pending, next_state, is_malicious)
 
             action, decision = self.agent.select_action(command, tracker)
+            STATS.record_decision(time.perf_counter() - started)
             tracker.command_count += 1
             tracker.pending = decision
 
@@ -211,12 +228,17 @@ class HoneygotchiServer(asyncssh.SSHServer):
         self.audit = audit_logger
         self.client_ip = 'unknown'
         self.username = 'unknown'
+        self.connected_at = time.perf_counter()
 
     def connection_made(self, conn: asyncssh.SSHServerConnection):
+        self.connected_at = time.perf_counter()
         peer = conn.get_extra_info('peername')
         self.client_ip = peer[0] if peer else 'unknown'
         logger.info("connection from %s", self.client_ip)
 
+    def auth_completed(self):
+        STATS.record_handshake(time.perf_counter() - self.connected_at)
+
     def begin_auth(self, username: str) -> bool:
         self.username = username
         return True
@@ -2,81 +2,112 @@
 import json
 import os
 import logging
-from typing import Dict, Any, Optional
-from pathlib import Path
+from typing import Dict, Any, List, Optional
 
 logger = logging.getLogger(__name__)
 
 class StateManager:
-    """Manages persistence of RL agent state."""
-    
-    def __init__(self, state_file: str = "rl_state.json"):
+    """Manages persistence of RL agent state.
+
+    Writes are atomic (tmp file + fsync + rename) and the previous
+    `generations` files are kept as `<state_file>.1`, `.2`, ... (newest
+    first). Loading falls back through them if the current file is corrupt.
+    """
+
+    def __init__(self, state_file: str = "rl_state.json", generations: int = 3):
         """Initialize state manager."""
         self.state_file = state_file
         self.state_dir = os.path.dirname(state_file) or "."
+        self.generations = max(0, generations)
         os.makedirs(self.state_dir, exist_ok=True)
-    
+
+    def _generation_file(self, n: int) -> str:
+        return f"{self.state_file}.{n}"
+
+    def _candidates(self) -> List[str]:
+        """Files to try on load, newest first. `.bak` is the pre-rotation name."""
+        return [self.state_file] + [self._generation_file(n) for n in range(1, self.generations + 1)] + [f"{self.state_file}.bak"]
+
+    def _rotate(self):
+        if not self.generations or not os.path.exists(self.state_file):
+            return
+        for n in range(self.generations - 1, 0, -1):
+            src = self._generation_file(n)
+            if os.path.exists(src):
+                os.replace(src, self._generation_file(n + 1))
+        # A hard link keeps the current file in place until the new one is
+        # renamed over it, so there is never a moment without a state file.
+        first = self._generation_file(1)
+        if os.path.exists(first):
+            os.remove(first)
+        try:
+            os.link(self.state_file, first)
+        except OSError:
+            with open(self.state_file, 'rb') as src, open(first, 'wb') as dst:
+                dst.write(src.read())
+
     def save_state(self, state: Dict[str, Any]) -> bool:
         """Save RL agent state to file."""
+        tmp_file = f"{self.state_file}.tmp"
         try:
-            # Create backup if file exists
-            if os.path.exists(self.state_file):
-                backup_file = f"{self.state_file}.bak"
-                with open(self.state_file, 'r') as f:
-                    backup_data = f.read()
-                with open(backup_file, 'w') as f:
-                    f.write(backup_data)
-            
-            # Save new state
-            with open(self.state_file, 'w') as f:
-                json.dump(state, f, indent=2)
-            
+            data = json.dumps(state, separators=(',', ':'))
+            with open(tmp_file, 'w') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._rotate()
+            os.replace(tmp_file, self.state_file)
+            self._fsync_dir()
             logger.debug(f"State saved to {self.state_file}")
             return True
         except Exception as e:
             logger.error(f"Failed to save state: {e}")
             return False
-    
+
+    def _fsync_dir(self):
+        try:
+            fd = os.open(self.state_dir, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
     def load_state(self) -> Optional[Dict[str, Any]]:
         """Load RL agent state from file."""
-        if not os.path.exists(self.state_file):
+        candidates = [path for path in self._candidates() if os.path.exists(path)]
+        if not candidates:
             logger.info(f"State file not found: {self.state_file}. Starting fresh.")
             return None
-        
-        try:
-            with open(self.state_file, 'r') as f:
-                state = json.load(f)
-            logger.info(f"State loaded from {self.state_file}")
-            return state
-        except json.JSONDecodeError:
-            # Try backup file
-            backup_file = f"{self.state_file}.bak"
-            if os.path.exists(backup_file):
-                try:
-                    with open(backup_file, 'r') as f:
-                        state = json.load(f)
-                    logger.warning(f"Loaded state from backup file: {backup_file}")
-                    return state
-                except Exception as e:
-                    logger.error(f"Failed to load backup state: {e}")
+
+        for path in candidates:
+            try:
+                with open(path, 'r') as f:
+                    state = json.load(f)
+            except Exception as e:
+                logger.error(f"Failed to load state from {path}: {e}")
+                continue
+            if path == self.state_file:
+                logger.info(f"State loaded from {self.state_file}")
             else:
-                logger.error(f"State file corrupted and no backup available: {self.state_file}")
-            return None
-        except Exception as e:
-            logger.error(f"Failed to load state: {e}")
-            return None
-    
+                logger.warning(f"Loaded state from older generation: {path}")
+            return state
+        logger.error(f"State file corrupted and no usable generation available: {self.state_file}")
+        return None
+
     def state_exists(self) -> bool:
         """Check if state file exists."""
         return os.path.exists(self.state_file)
-    
+
     def clear_state(self) -> bool:
         """Clear saved state."""
         try:
-            if os.path.exists(self.state_file):
-                os.remove(self.state_file)
-            if os.path.exists(f"{self.state_file}.bak"):
-                os.remove(f"{self.state_file}.bak")
+            for path in self._candidates() + [f"{self.state_file}.tmp"]:
+                if os.path.exists(path):
+                    os.remove(path)
             logger.info("State cleared")
             return True
         except Exception as e:
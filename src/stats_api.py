@@ -1,12 +1,19 @@
 import asyncio
+import gzip
 import json
 import logging
+import math
+import os
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Optional
+from typing import Any, Callable, Optional, Tuple
 
 from aiohttp import web
 
+from . import prometheus
 from .metrics import STATS
+from .stream_filter import StreamFilter
 
 logger = logging.getLogger(__name__)
 
@@ -14,11 +21,38 @@ logger = logging.getLogger(__name__)
 def _cors_headers() -> dict:
     return {
         'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type',
+        'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
+        'Access-Control-Expose-Headers': 'X-Next-Cursor, ETag',
     }
 
 
+def _window(query) -> Optional[float]:
+    """`?window=` in seconds; ValueError unless finite and positive."""
+    if 'window' not in query:
+        return None
+    seconds = float(query['window'])
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(seconds)
+    return seconds
+
+
+def _accepts_gzip(header: str) -> bool:
+    """Whether an Accept-Encoding value lists gzip with a non-zero q."""
+    for item in header.lower().split(','):
+        coding, _, params = item.partition(';')
+        if coding.strip() != 'gzip':
+            continue
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                return float(q[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
 @web.middleware
 async def cors_middleware(request: web.Request, handler):
     if request.method == 'OPTIONS':
@@ -29,13 +63,75 @@ async def cors_middleware(request: web.Request, handler):
     return response
 
 
+class _Entry:
+    __slots__ = ('version', 'etag', 'body', 'gzipped', 'headers')
+
+    def __init__(self, version, etag: str, body: bytes, headers: dict):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self.gzipped: Optional[bytes] = None
+        self.headers = headers
+
+
+class ResponseCache:
+    """Encoded JSON bodies per request key, reused while the version they
+    were built from still holds.
+
+    A hit costs a dict lookup: no registry reads, no dict building, no
+    json.dumps. ETags are the version plus a per-process nonce, so a client
+    revalidating with `If-None-Match` gets a bodyless 304, and a restart
+    (versions start over) cannot produce a false match. Bodies of
+    `gzip_min` bytes or more are gzipped once per version for clients that
+    accept it.
+    """
+
+    def __init__(self, max_entries: int = 256, gzip_min: int = 1024):
+        self.max_entries = max_entries
+        self.gzip_min = gzip_min
+        self._epoch = os.urandom(4).hex()
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+
+    async def respond(self, request: web.Request, key: str, version: Tuple, build: Callable[[], Any]) -> web.Response:
+        """`build()` (sync or async) returns the payload, or a
+        (payload, extra headers) tuple."""
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            result = build()
+            if asyncio.iscoroutine(result):
+                result = await result
+            payload, headers = result if isinstance(result, tuple) else (result, {})
+            etag = '"%s-%s"' % (self._epoch, '.'.join(map(str, version)))
+            entry = _Entry(version, etag, json.dumps(payload, separators=(',', ':')).encode(), headers)
+            self._entries[key] = entry
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(key)
+
+        headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding', **entry.headers}
+        inm = request.headers.get('If-None-Match')
+        if inm and (inm.strip() == '*' or entry.etag in (t.strip().removeprefix('W/') for t in inm.split(','))):
+            return web.Response(status=304, headers=headers)
+        body = entry.body
+        if len(body) >= self.gzip_min and _accepts_gzip(request.headers.get('Accept-Encoding', '')):
+            if entry.gzipped is None:
+                entry.gzipped = gzip.compress(body, compresslevel=5)
+            body = entry.gzipped
+            headers['Content-Encoding'] = 'gzip'
+        return web.Response(body=body, headers=headers, content_type='application/json')
+
+
 class StatsAPIServer:
     """HTTP API that the dashboard consumes. Serves JSON snapshots and an SSE
     stream of live events so the UI can update without polling."""
 
-    def __init__(self, port: int = 8080, agent=None):
+    OVERVIEW_FIELDS = ('stats', 'agent', 'sessions', 'timeseries', 'policy')
+
+    def __init__(self, port: int = 8080, agent=None, checkpointer=None):
         self.port = port
         self.agent = agent
+        self.checkpointer = checkpointer
+        self.cache = ResponseCache()
         self.start_time = datetime.now()
         self._runner: Optional[web.AppRunner] = None
         self._site: Optional[web.TCPSite] = None
@@ -46,12 +142,24 @@ class StatsAPIServer:
     async def start(self):
         app = web.Application(middlewares=[cors_middleware])
         app.router.add_get('/health', self._health)
+        app.router.add_get('/metrics', self._metrics)
         app.router.add_get('/api/stats', self._stats)
+        app.router.add_get('/api/overview', self._overview)
         app.router.add_get('/api/policy', self._policy)
+        app.router.add_get('/api/checkpoints', self._checkpoints)
+        app.router.add_post('/api/checkpoints', self._create_checkpoint)
+        app.router.add_get('/api/checkpoints/diff', self._diff_checkpoints)
+        app.router.add_get(r'/api/checkpoints/{cid:\d+}', self._checkpoint)
+        app.router.add_post(r'/api/checkpoints/{cid:\d+}/restore', self._restore_checkpoint)
         app.router.add_get('/api/sessions', self._sessions)
         app.router.add_get('/api/sessions/{sid}', self._session)
+        app.router.add_get('/api/commands', self._commands)
+        app.router.add_get('/api/commands/slow', self._slow_commands)
+        app.router.add_get('/api/timeseries', self._timeseries)
+        app.router.add_get('/api/top/{kind}', self._top)
         app.router.add_get('/api/events', self._events)
         app.router.add_get('/api/stream', self._stream)
+        app.router.add_get('/api/ws', self._ws)
 
         self._runner = web.AppRunner(app, access_log=None)
         await self._runner.setup()
@@ -71,33 +179,219 @@ class StatsAPIServer:
             'timestamp': datetime.now().isoformat(),
         })
 
-    async def _stats(self, _request: web.Request) -> web.Response:
-        payload = STATS.snapshot()
-        payload['start_time'] = self.start_time.isoformat()
-        if self.agent:
-            payload['agent'] = self.agent.stats()
-        return web.json_response(payload)
+    async def _metrics(self, _request: web.Request) -> web.Response:
+        text = prometheus.render(STATS.exposition_snapshot(), self.agent.stats() if self.agent else None)
+        return web.Response(body=text.encode(), headers={'Content-Type': prometheus.CONTENT_TYPE})
 
-    async def _policy(self, _request: web.Request) -> web.Response:
+    def _agent_version(self) -> int:
+        return self.agent.version if self.agent else 0
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        def build():
+            payload = STATS.snapshot()
+            payload['start_time'] = self.start_time.isoformat()
+            if self.agent:
+                payload['agent'] = self.agent.stats()
+            return payload
+        # The time bucket keeps uptime and stream gauges from going stale
+        # on an idle sensor.
+        version = (STATS.version, self._agent_version(), int(time.time() // 5))
+        return await self.cache.respond(request, 'stats', version, build)
+
+    async def _overview(self, request: web.Request) -> web.Response:
+        """Everything a dashboard page needs in one round trip:
+        `?fields=stats,agent,sessions,timeseries,policy` (default all),
+        plus `sessions=` (count) and the `/api/timeseries` parameters."""
+        q = request.query
+        fields = sorted({f for f in q.get('fields', '').split(',') if f} or self.OVERVIEW_FIELDS)
+        unknown = [f for f in fields if f not in self.OVERVIEW_FIELDS]
+        if unknown:
+            return web.json_response({'error': f"unknown fields {', '.join(unknown)}; expected {', '.join(self.OVERVIEW_FIELDS)}"}, status=400)
+        resolution = q.get('resolution', 'minute')
+        if resolution not in STATS.timeseries.RESOLUTIONS:
+            return web.json_response({'error': f"resolution must be one of {', '.join(STATS.timeseries.RESOLUTIONS)}"}, status=400)
+        try:
+            limit = min(int(q.get('sessions', 10)), 200)
+            seconds = _window(q)
+        except ValueError:
+            return web.json_response({'error': 'sessions must be a number and window a positive number of seconds'}, status=400)
+        series = [s for s in q.get('series', '').split(',') if s] or None
+
+        def build():
+            payload = STATS.overview(fields, sessions_limit=limit, resolution=resolution, seconds=seconds, series=series)
+            if 'stats' in payload:
+                payload['stats']['start_time'] = self.start_time.isoformat()
+            if 'agent' in fields:
+                payload['agent'] = self.agent.stats() if self.agent else None
+            if 'policy' in fields:
+                payload['policy'] = self.agent.policy_snapshot() if self.agent else None
+            return payload
+        # Agent-only selections rebuild only when the agent changes; registry
+        # sections add the registry version and /api/stats' time bucket, and
+        # the time-series also moves on with its own step.
+        version = [self._agent_version()]
+        if {'stats', 'sessions', 'timeseries'}.intersection(fields):
+            version += [STATS.version, int(time.time() // 5)]
+        if 'timeseries' in fields:
+            version.append(int(time.time() // STATS.timeseries.RESOLUTIONS[resolution][0]))
+        key = f"overview?{','.join(fields)}&{limit}&{resolution}&{seconds}&{series}"
+        return await self.cache.respond(request, key, tuple(version), build)
+
+    async def _policy(self, request: web.Request) -> web.Response:
         if not self.agent:
             return web.json_response({'error': 'agent not available'}, status=503)
-        return web.json_response(self.agent.policy_snapshot())
+        if request.query.get('detail') in ('1', 'true'):
+            return await self.cache.respond(request, 'policy-detail', (self.agent.version,), self.agent.policy_detail)
+        return await self.cache.respond(request, 'policy', (self.agent.version,), self.agent.policy_snapshot)
+
+    def _store(self):
+        return self.checkpointer.store if self.checkpointer else None
+
+    async def _checkpoints(self, _request: web.Request) -> web.Response:
+        store = self._store()
+        if store is None:
+            return web.json_response({'error': 'checkpoint store not enabled'}, status=503)
+        return web.json_response({
+            'store': store.stats(),
+            'checkpoints': await asyncio.to_thread(store.list),
+        })
+
+    async def _create_checkpoint(self, request: web.Request) -> web.Response:
+        if self._store() is None:
+            return web.json_response({'error': 'checkpoint store not enabled'}, status=503)
+        label = 'manual'
+        if request.can_read_body:
+            try:
+                label = str((await request.json()).get('label') or label)[:100]
+            except (ValueError, AttributeError):
+                return web.json_response({'error': 'body must be a JSON object'}, status=400)
+        cid = await self.checkpointer.checkpoint(label)
+        return web.json_response({'id': cid, 'label': label}, status=201)
+
+    async def _checkpoint(self, request: web.Request) -> web.Response:
+        store = self._store()
+        if store is None:
+            return web.json_response({'error': 'checkpoint store not enabled'}, status=503)
+        cp = await asyncio.to_thread(store.load, int(request.match_info['cid']))
+        if cp is None:
+            return web.json_response({'error': 'not found'}, status=404)
+        policy = {}
+        for (state, action), (value, _, _) in cp.cells.items():
+            policy.setdefault(state, {})[action] = value
+        return web.json_response({**cp.summary(), 'meta': cp.meta, 'policy': policy})
+
+    async def _diff_checkpoints(self, request: web.Request) -> web.Response:
+        store = self._store()
+        if store is None:
+            return web.json_response({'error': 'checkpoint store not enabled'}, status=503)
+        try:
+            a, b = int(request.query['a']), int(request.query['b'])
+            limit = max(0, min(int(request.query.get('limit', 100)), 1000))
+        except (KeyError, ValueError):
+            return web.json_response({'error': 'a and b must be checkpoint ids and limit a number'}, status=400)
+        diff = await asyncio.to_thread(store.diff, a, b, limit)
+        if diff is None:
+            return web.json_response({'error': 'not found'}, status=404)
+        return web.json_response(diff)
+
+    async def _restore_checkpoint(self, request: web.Request) -> web.Response:
+        if self._store() is None:
+            return web.json_response({'error': 'checkpoint store not enabled'}, status=503)
+        cid = int(request.match_info['cid'])
+        clear_replay = request.query.get('clear_replay') in ('1', 'true')
+        if not await self.checkpointer.restore(cid, clear_replay=clear_replay):
+            return web.json_response({'error': f'checkpoint {cid} not found or not compatible with this engine'}, status=409)
+        return web.json_response({'restored': cid, 'agent': self.agent.stats()})
 
     async def _sessions(self, request: web.Request) -> web.Response:
-        limit = min(int(request.query.get('limit', 50)), 200)
-        include = request.query.get('commands', '0') in ('1', 'true', 'yes')
-        return web.json_response(STATS.recent_sessions(limit=limit, include_commands=include))
+        q = request.query
+        include = q.get('commands', '0') in ('1', 'true', 'yes')
+        try:
+            limit = max(1, min(int(q.get('limit', 50)), 200))
+            cursor = int(q['cursor']) if q.get('cursor') else None
+            since = float(q['since']) if q.get('since') else None
+            until = float(q['until']) if q.get('until') else None
+        except ValueError:
+            return web.json_response({'error': 'limit, cursor, since and until must be numbers'}, status=400)
+        if STATS.store is None:
+            return await self.cache.respond(
+                request, f'sessions?{request.query_string}', (STATS.version,),
+                lambda: STATS.recent_sessions(limit=limit, include_commands=include),
+            )
+
+        async def build():
+            sessions, next_cursor = await asyncio.to_thread(
+                STATS.store.sessions,
+                limit=limit,
+                cursor=cursor,
+                ip=q.get('ip') or None,
+                username=q.get('username') or None,
+                pattern=q.get('pattern') or None,
+                action=q.get('action') or None,
+                since=since,
+                until=until,
+                include_commands=include,
+            )
+            # The body stays a plain list; the next page is in a header.
+            return sessions, ({'X-Next-Cursor': str(next_cursor)} if next_cursor is not None else {})
+        return await self.cache.respond(request, f'sessions?{request.query_string}', (STATS.store.written,), build)
 
     async def _session(self, request: web.Request) -> web.Response:
         sid = request.match_info['sid']
         rec = STATS.get_session(sid)
+        if not rec and STATS.store is not None:
+            rec = await asyncio.to_thread(STATS.store.get_session, sid)
         if not rec:
             return web.json_response({'error': 'not found'}, status=404)
         return web.json_response(rec)
 
+    async def _commands(self, request: web.Request) -> web.Response:
+        return await self.cache.respond(request, 'commands', (STATS.version,), STATS.command_costs)
+
+    async def _slow_commands(self, request: web.Request) -> web.Response:
+        try:
+            limit = max(1, min(int(request.query.get('limit', 50)), 100))
+        except ValueError:
+            return web.json_response({'error': 'limit must be an integer'}, status=400)
+        return web.json_response({
+            'threshold_ms': STATS.slow_command_ms,
+            'commands': STATS.slow_commands(limit=limit),
+        })
+
+    async def _top(self, request: web.Request) -> web.Response:
+        kind = request.match_info['kind']
+        if kind not in STATS.top:
+            return web.json_response({'error': f"kind must be one of {', '.join(STATS.top)}"}, status=404)
+        try:
+            limit = max(1, min(int(request.query.get('limit', 50)), STATS.top[kind].k))
+        except ValueError:
+            return web.json_response({'error': 'limit must be an integer'}, status=400)
+        return await self.cache.respond(request, f'top/{kind}?{limit}', (STATS.version,), lambda: {
+            'kind': kind,
+            'unique': STATS.unique[kind].count(),
+            'top': STATS.top_keys(kind, limit),
+        })
+
+    async def _timeseries(self, request: web.Request) -> web.Response:
+        resolution = request.query.get('resolution', 'minute')
+        if resolution not in STATS.timeseries.RESOLUTIONS:
+            return web.json_response({'error': f"resolution must be one of {', '.join(STATS.timeseries.RESOLUTIONS)}"}, status=400)
+        try:
+            seconds = _window(request.query)
+        except ValueError:
+            return web.json_response({'error': 'window must be a positive number of seconds'}, status=400)
+        series = [s for s in request.query.get('series', '').split(',') if s] or None
+        return web.json_response(STATS.timeseries_window(resolution, seconds, series))
+
     async def _events(self, request: web.Request) -> web.Response:
-        limit = min(int(request.query.get('limit', 200)), 1000)
-        return web.json_response(STATS.recent_events(limit=limit))
+        try:
+            limit = max(1, min(int(request.query.get('limit', 200)), 1000))
+            after = int(request.query['after']) if request.query.get('after') else None
+        except ValueError:
+            return web.json_response({'error': 'after and limit must be integers'}, status=400)
+        events, next_cursor = STATS.events_after(after, limit)
+        # Same shape as before (a plain list); poll with ?after=<X-Next-Cursor>.
+        return web.json_response(events, headers={'X-Next-Cursor': str(next_cursor)})
 
     async def _stream(self, request: web.Request) -> web.StreamResponse:
         response = web.StreamResponse(headers={
@@ -107,20 +401,75 @@ class StatsAPIServer:
             **_cors_headers(),
         })
         await response.prepare(request)
-        queue = STATS.subscribe()
+        hub = STATS.hub
         try:
-            # Send a snapshot of recent events so the client starts with context.
-            for event in STATS.recent_events(limit=25):
-                await response.write(f"data: {json.dumps(event)}\n\n".encode())
+            resume = int(request.headers.get('Last-Event-ID', ''))
+        except ValueError:
+            resume = None
+        # Resume after the client's last id if the ring still has it,
+        # otherwise start with recent events for context.
+        sub = hub.subscribe(resume)
+        try:
+            await response.write(b"retry: 3000\n\n")
             while True:
-                try:
-                    event = await asyncio.wait_for(queue.get(), timeout=20.0)
-                    await response.write(f"data: {json.dumps(event)}\n\n".encode())
-                except asyncio.TimeoutError:
+                frames = hub.drain(sub)
+                if frames:
+                    await response.write(b''.join(frames))
+                elif not await hub.wait(sub, timeout=20.0):
                     # keep-alive ping
                     await response.write(b": ping\n\n")
         except (ConnectionResetError, asyncio.CancelledError):
             pass
         finally:
-            STATS.unsubscribe(queue)
+            hub.unsubscribe(sub)
         return response
+
+    async def _ws(self, request: web.Request) -> web.StreamResponse:
+        """Filtered live stream. The initial filter comes from the query
+        (`?type=command&ip=203.0.113.0/24&pattern=&action=&session=&sample=`);
+        sending `{"filter": {...}}` replaces it. Events arrive as JSON
+        texts; `{"type": "dropped", "count": n}` reports events lost while
+        the socket was slower than the sensor."""
+        try:
+            flt = StreamFilter.parse(request.query)
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        ws = web.WebSocketResponse(heartbeat=20.0)
+        await ws.prepare(request)
+        index = STATS.hub.filters
+        sub = index.add(flt)
+        sub.offer(json.dumps({'type': 'subscribed', 'filter': flt.to_dict()}))
+        sender = asyncio.create_task(self._ws_send(ws, sub))
+        try:
+            async for msg in ws:
+                if msg.type != web.WSMsgType.TEXT:
+                    continue
+                try:
+                    spec = json.loads(msg.data)
+                    flt = StreamFilter.parse(spec.get('filter', spec))
+                except (ValueError, AttributeError) as e:
+                    sub.offer(json.dumps({'type': 'error', 'error': str(e) or 'filter must be a JSON object'}))
+                    continue
+                index.update(sub, flt)
+                sub.offer(json.dumps({'type': 'subscribed', 'filter': flt.to_dict()}))
+        finally:
+            index.remove(sub)
+            sender.cancel()
+        return ws
+
+    @staticmethod
+    async def _ws_send(ws: web.WebSocketResponse, sub):
+        # The only writer on the socket. send_str waits for the transport to
+        # drain, so a slow client backs up into its bounded queue.
+        reported = 0
+        try:
+            while True:
+                data = await sub.queue.get()
+                if sub.dropped != reported:
+                    await ws.send_str(json.dumps({'type': 'dropped', 'count': sub.dropped - reported}))
+                    reported = sub.dropped
+                await ws.send_str(data)
+                sub.sent += 1
+        except (ConnectionResetError, RuntimeError):
+            # Closed underneath us; the reader loop ends on its own.
+            pass
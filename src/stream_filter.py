@@ -0,0 +1,266 @@
+"""Server-side filtering for the live event stream.
+
+A `StreamFilter` narrows the stream by event type, client IP or CIDR,
+pattern, action and session id (each a set of allowed values, empty means
+any), and may keep only a fraction of sessions. `FilterIndex` compiles the
+filters of all connected readers into per-field lookup tables, so matching
+an event costs one dict lookup per field plus set intersections, not one
+filter evaluation per reader. Sampling hashes the session id, so a sampled
+reader sees whole sessions rather than scattered commands.
+
+Each reader gets a bounded queue of encoded events. When a reader's socket
+cannot keep up, its queue fills and the oldest events are dropped (and
+counted) instead of growing memory or slowing the publisher.
+"""
+import asyncio
+import ipaddress
+import zlib
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+# Filter field -> event key. Events without the key only reach readers that
+# do not filter on it.
+FIELDS = (
+    ('types', 'type'),
+    ('patterns', 'pattern'),
+    ('actions', 'action'),
+    ('sessions', 'session_id'),
+)
+
+EVENT_TYPES = ('login', 'session_start', 'command', 'session_end')
+
+
+def _values(spec: Mapping, *keys: str) -> List[str]:
+    """Allowed values for a field given as a list or a comma-separated
+    string, under any of `keys`."""
+    out: List[str] = []
+    for key in keys:
+        raw = spec.get(key)
+        if raw is None:
+            continue
+        items = raw.split(',') if isinstance(raw, str) else raw
+        if not isinstance(items, (list, tuple)):
+            raise ValueError(f"{key} must be a list or a comma-separated string")
+        out.extend(str(v).strip() for v in items if str(v).strip())
+    return out
+
+
+class StreamFilter:
+    __slots__ = ('types', 'networks', 'patterns', 'actions', 'sessions', 'sample')
+
+    def __init__(
+        self,
+        types: Iterable[str] = (),
+        networks: Iterable[str] = (),
+        patterns: Iterable[str] = (),
+        actions: Iterable[str] = (),
+        sessions: Iterable[str] = (),
+        sample: float = 1.0,
+    ):
+        self.types = frozenset(types)
+        unknown = self.types.difference(EVENT_TYPES)
+        if unknown:
+            raise ValueError(f"unknown event type {sorted(unknown)[0]!r}; expected one of {', '.join(EVENT_TYPES)}")
+        # ip_network raises ValueError on garbage; a bare address is a /32 (/128).
+        self.networks = frozenset(ipaddress.ip_network(n, strict=False) for n in networks)
+        self.patterns = frozenset(patterns)
+        self.actions = frozenset(actions)
+        self.sessions = frozenset(sessions)
+        if not 0.0 < sample <= 1.0:
+            raise ValueError("sample must be in (0, 1]")
+        self.sample = sample
+
+    @classmethod
+    def parse(cls, spec: Mapping) -> 'StreamFilter':
+        """From query parameters or a JSON object: `type`, `ip`, `pattern`,
+        `action`, `session` (lists or comma-separated) and `sample`."""
+        try:
+            sample = float(spec.get('sample', 1.0))
+        except (TypeError, ValueError):
+            raise ValueError("sample must be a number") from None
+        return cls(
+            types=_values(spec, 'type', 'types'),
+            networks=_values(spec, 'ip', 'ips', 'cidr'),
+            patterns=_values(spec, 'pattern', 'patterns'),
+            actions=_values(spec, 'action', 'actions'),
+            sessions=_values(spec, 'session', 'session_id', 'sessions'),
+            sample=sample,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'type': sorted(self.types),
+            'ip': sorted(str(n) for n in self.networks),
+            'pattern': sorted(self.patterns),
+            'action': sorted(self.actions),
+            'session': sorted(self.sessions),
+            'sample': self.sample,
+        }
+
+
+class Subscriber:
+    """One filtered reader: its filter and a bounded queue of JSON texts."""
+
+    __slots__ = ('id', 'filter', 'queue', 'sent', 'dropped')
+
+    def __init__(self, id: int, flt: StreamFilter, queue_size: int):
+        self.id = id
+        self.filter = flt
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, data: str):
+        """Enqueue without blocking; a full queue loses its oldest item."""
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.queue.put_nowait(data)
+
+
+class FilterIndex:
+    """Filters of all readers, inverted into per-field tables.
+
+    For each field, `_exact[field][value]` holds the readers that allow that
+    value and `_any[field]` those that do not filter on the field. CIDRs are
+    grouped by (IP version, prefix length), so an event's address is masked
+    once per prefix length in use. Event-loop only, like `EventHub`.
+    """
+
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self._subs: Dict[int, Subscriber] = {}
+        self._next_id = 0
+        self._exact: Dict[str, Dict[str, Set[int]]] = {f: {} for f, _ in FIELDS}
+        self._any: Dict[str, Set[int]] = {f: set() for f, _ in FIELDS}
+        self._nets: Dict[Tuple[int, int], Dict[int, Set[int]]] = {}
+        self._any_ip: Set[int] = set()
+        self._sampled: Dict[int, float] = {}
+        self.matched = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._subs)
+
+    def add(self, flt: StreamFilter) -> Subscriber:
+        self._next_id += 1
+        sub = Subscriber(self._next_id, flt, self.queue_size)
+        self._subs[sub.id] = sub
+        self._index(sub)
+        return sub
+
+    def remove(self, sub: Subscriber):
+        if self._subs.pop(sub.id, None) is not None:
+            self._unindex(sub)
+            self.dropped += sub.dropped
+
+    def update(self, sub: Subscriber, flt: StreamFilter):
+        self._unindex(sub)
+        sub.filter = flt
+        self._index(sub)
+
+    def _index(self, sub: Subscriber):
+        flt = sub.filter
+        for name, _ in FIELDS:
+            allowed = getattr(flt, name)
+            if not allowed:
+                self._any[name].add(sub.id)
+            for value in allowed:
+                self._exact[name].setdefault(value, set()).add(sub.id)
+        if not flt.networks:
+            self._any_ip.add(sub.id)
+        for net in flt.networks:
+            table = self._nets.setdefault((net.version, net.prefixlen), {})
+            table.setdefault(int(net.network_address) >> (net.max_prefixlen - net.prefixlen), set()).add(sub.id)
+        if flt.sample < 1.0:
+            self._sampled[sub.id] = flt.sample
+
+    def _unindex(self, sub: Subscriber):
+        flt = sub.filter
+        for name, _ in FIELDS:
+            self._any[name].discard(sub.id)
+            exact = self._exact[name]
+            for value in getattr(flt, name):
+                ids = exact.get(value)
+                if ids is not None:
+                    ids.discard(sub.id)
+                    if not ids:
+                        del exact[value]
+        self._any_ip.discard(sub.id)
+        for net in flt.networks:
+            key = (net.version, net.prefixlen)
+            table = self._nets.get(key)
+            if table is None:
+                continue
+            prefix = int(net.network_address) >> (net.max_prefixlen - net.prefixlen)
+            ids = table.get(prefix)
+            if ids is not None:
+                ids.discard(sub.id)
+                if not ids:
+                    del table[prefix]
+                if not table:
+                    del self._nets[key]
+        self._sampled.pop(sub.id, None)
+
+    def _ip_matches(self, client_ip: Optional[str]) -> Set[int]:
+        if not self._nets or client_ip is None:
+            return self._any_ip
+        try:
+            addr = ipaddress.ip_address(client_ip)
+        except ValueError:
+            return self._any_ip
+        hits = set(self._any_ip)
+        value, bits = int(addr), addr.max_prefixlen
+        for (version, prefixlen), table in self._nets.items():
+            if version == addr.version:
+                ids = table.get(value >> (bits - prefixlen))
+                if ids:
+                    hits |= ids
+        return hits
+
+    def match(self, event: Mapping[str, Any]) -> Set[int]:
+        """Ids of the readers whose filter passes `event`."""
+        if not self._subs:
+            return set()
+        matched: Optional[Set[int]] = None
+        for name, key in FIELDS:
+            exact = self._exact[name]
+            if not exact:
+                continue  # nobody filters on this field
+            value = event.get(key)
+            ids = exact.get(value) if value is not None else None
+            allowed = (self._any[name] | ids) if ids else self._any[name]
+            matched = allowed if matched is None else matched & allowed
+            if not matched:
+                return set()
+        if self._nets:
+            ips = self._ip_matches(event.get('client_ip'))
+            matched = ips if matched is None else matched & ips
+        matched = set(self._subs) if matched is None else set(matched)
+        if self._sampled and matched:
+            key = event.get('session_id') or str(event.get('id', ''))
+            u = zlib.crc32(key.encode()) / 0x100000000
+            for sid, rate in self._sampled.items():
+                if u >= rate:
+                    matched.discard(sid)
+        return matched
+
+    def dispatch(self, event: Mapping[str, Any], data: str) -> int:
+        """Queue the encoded `data` of `event` for every matching reader."""
+        ids = self.match(event)
+        subs = self._subs
+        for sid in ids:
+            subs[sid].offer(data)
+        self.matched += len(ids)
+        return len(ids)
+
+    def stats(self) -> Dict[str, Any]:
+        subs = self._subs.values()
+        return {
+            'subscribers': len(self._subs),
+            'matched': self.matched,
+            'dropped': self.dropped + sum(s.dropped for s in subs),
+            'max_queue': max((s.queue.qsize() for s in subs), default=0),
+            'queue_size': self.queue_size,
+        }